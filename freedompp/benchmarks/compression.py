@@ -0,0 +1,139 @@
+# benchmark of the compression options of write_ncfile on ocean_month_z
+# run with: python -m freedompp.benchmarks.compression
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+from freedompp.benchmarks.synthetic import ocean_month_z
+from freedompp.libIO import write_ncfile
+
+# compression settings compared, None is the uncompressed reference
+settings = {
+    "none": None,
+    "zlib1": {"method": "zlib", "complevel": 1},
+    "zlib4": {"method": "zlib", "complevel": 4},
+    "zlib4-noshuffle": {"method": "zlib", "complevel": 4, "shuffle": False},
+    "zstd1": {"method": "zstd", "complevel": 1},
+    "zstd4": {"method": "zstd", "complevel": 4},
+    "zlib4-lsd3": {"method": "zlib", "complevel": 4, "least_significant_digit": 3},
+    "zlib4-bitround12": {"method": "zlib", "complevel": 4, "bitround": 12},
+    "zstd4-bitround12": {"method": "zstd", "complevel": 4, "bitround": 12},
+}
+
+
+def benchmark_setting(ds, filename, compression, chunks=None):
+    """write and read back a dataset with one compression setting
+
+    Args:
+        ds (xarray.Dataset): dataset to write
+        filename (str): path of the output file
+        compression (dict): compression options passed to write_ncfile
+        chunks (dict, optional): chunk sizes of output file. Defaults to None.
+
+    Returns:
+        dict: write time (s), read time (s), size (bytes) and max error
+    """
+
+    start = time.perf_counter()
+    write_ncfile(ds, filename, chunks=chunks, compression=compression)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with xr.open_dataset(filename, decode_times=False) as out:
+        out.load()
+    read_time = time.perf_counter() - start
+
+    error = 0.0
+    for var in ["thetao", "so"]:
+        error = max(error, float(np.nanmax(np.abs(out[var] - ds[var]))))
+
+    return dict(
+        write_time=write_time,
+        read_time=read_time,
+        size=os.path.getsize(filename),
+        max_error=error,
+    )
+
+
+def run_benchmark(nz=35, ny=180, nx=360, names=None, chunks=None, workdir=None):
+    """compare compression settings on a synthetic year of ocean_month_z
+
+    Args:
+        nz (int, optional): number of vertical levels. Defaults to 35.
+        ny (int, optional): number of points in latitude. Defaults to 180.
+        nx (int, optional): number of points in longitude. Defaults to 360.
+        names (list of str, optional): settings to run. Defaults to None (all).
+        chunks (dict, optional): chunk sizes of output files. Defaults to None.
+        workdir (str, optional): where to write the files. Defaults to None,
+                                 i.e. a temporary directory.
+
+    Returns:
+        list of dict: results for each setting
+    """
+
+    names = list(settings) if names is None else names
+    ds = ocean_month_z(nz=nz, ny=ny, nx=nx)
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        for name in names:
+            filename = f"{tmpdir}/{name}.nc"
+            result = benchmark_setting(ds, filename, settings[name], chunks=chunks)
+            result["setting"] = name
+            results.append(result)
+            os.remove(filename)
+
+    # size ratio relative to the uncompressed file
+    reference = ds.nbytes
+    for result in results:
+        if result["setting"] == "none":
+            reference = result["size"]
+    for result in results:
+        result["size_ratio"] = result["size"] / reference
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark compression options on a synthetic ocean_month_z"
+    )
+    parser.add_argument("--nz", type=int, default=35, help="vertical levels")
+    parser.add_argument("--ny", type=int, default=180, help="points in latitude")
+    parser.add_argument("--nx", type=int, default=360, help="points in longitude")
+    parser.add_argument(
+        "--settings", nargs="+", default=None, help=f"among {', '.join(settings)}"
+    )
+    parser.add_argument("--workdir", type=str, default=None, help="scratch dir")
+    parser.add_argument(
+        "--json", action="store_true", default=False, help="print json lines"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        nz=args.nz,
+        ny=args.ny,
+        nx=args.nx,
+        names=args.settings,
+        chunks={"time": 1},
+        workdir=args.workdir,
+    )
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"{'setting':20s} {'write (s)':>10s} {'read (s)':>10s} {'ratio':>8s} error")
+    for r in results:
+        print(
+            f"{r['setting']:20s} {r['write_time']:10.3f} {r['read_time']:10.3f}"
+            f" {r['size_ratio']:8.3f} {r['max_error']:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
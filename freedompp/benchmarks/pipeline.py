@@ -0,0 +1,214 @@
+# benchmark of timeseries and averages written from synthetic history archives
+# run with: python -m freedompp.benchmarks.pipeline
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from freedompp.benchmarks.synthetic import write_history
+from freedompp.libfreedompp import write_average, write_timeserie
+from freedompp.libplan import plan_inputs
+from freedompp.libprofile import peak_rss
+
+# layouts of synthetic history: component, frequency, storage, and nz > 0
+# for 3D fields (the number of levels is set when running the benchmark)
+layouts = {
+    "1m-3d": dict(comesfrom="ocean_month_z", freq="1m", nz=20),
+    "1m-3d-split": dict(comesfrom="ocean_month_z", freq="1m", nz=20, nsplit=4),
+    "1m-2d-tiled": dict(comesfrom="atmos_month", freq="1m", ntiles=6),
+    "1d-2d": dict(comesfrom="ocean_daily", freq="1d"),
+    "6hr-2d": dict(comesfrom="atmos_4xdaily", freq="6hr"),
+    "3hr-2d": dict(comesfrom="atmos_8xdaily", freq="3hr"),
+}
+
+# benchmark cases: layout, pp product and options of the write function
+cases = {
+    "ts-1m-3d": dict(layout="1m-3d", pptype="ts"),
+    "ann-1m-3d": dict(layout="1m-3d", pptype="ann"),
+    "mm-1m-3d": dict(layout="1m-3d", pptype="mm"),
+    "ts-1m-3d-tmpdir": dict(layout="1m-3d", pptype="ts", options={"in_memory": False}),
+    "ts-1m-3d-streaming": dict(
+        layout="1m-3d", pptype="ts", options={"streaming": True}
+    ),
+    "ts-1m-3d-recombine": dict(
+        layout="1m-3d-split",
+        pptype="ts",
+        options={"recombine": True, "nsplit": 4, "chunks": {"time": 1}},
+    ),
+    "ann-1m-3d-recombine": dict(
+        layout="1m-3d-split",
+        pptype="ann",
+        options={"recombine": True, "nsplit": 4, "chunks": {"time": 1}},
+    ),
+    "ts-1m-2d-tiled": dict(layout="1m-2d-tiled", pptype="ts", ftype="tile*.nc"),
+    "ann-1m-2d-tiled": dict(layout="1m-2d-tiled", pptype="ann", ftype="tile*.nc"),
+    "ts-1d-2d": dict(layout="1d-2d", pptype="ts"),
+    "ann-1d-2d": dict(layout="1d-2d", pptype="ann"),
+    "mm-1d-2d": dict(layout="1d-2d", pptype="mm"),
+    "ts-6hr-2d": dict(layout="6hr-2d", pptype="ts"),
+    "ts-3hr-2d": dict(layout="3hr-2d", pptype="ts"),
+}
+
+
+def run_case(name, historydir, workdir, years=2):
+    """time one benchmark case, meant to run in its own process so that
+    the peak RSS belongs to this case only
+
+    Args:
+        name (str): name of the case, key of cases
+        historydir (str): directory with the history of the case layout
+        workdir (str): scratch directory for pp and extracted files
+        years (int, optional): number of years processed. Defaults to 2.
+
+    Returns:
+        dict: time (s), bytes read, throughput (MB/s), peak RSS (bytes)
+              and the time of each stage (s)
+    """
+
+    case = cases[name]
+    layout = layouts[case["layout"]]
+    comesfrom = layout["comesfrom"]
+    ftype = case.get("ftype", "nc")
+    options = dict(case.get("options", {}))
+    if not options.get("in_memory", True):
+        options["tmpdir"] = f"{workdir}/extracted"
+        os.makedirs(options["tmpdir"], exist_ok=True)
+    ppdir = f"{workdir}/pp"
+    os.makedirs(ppdir, exist_ok=True)
+
+    start = time.perf_counter()
+    if case["pptype"] == "ts":
+        field = "thetao" if layout.get("nz", 0) > 0 else "tos"
+        profile = write_timeserie(
+            field,
+            comesfrom,
+            1,
+            years,
+            historydir=historydir,
+            ppdir=ppdir,
+            ftype=ftype,
+            profile=True,
+            **options,
+        )
+    else:
+        profile = write_average(
+            comesfrom,
+            1,
+            years,
+            historydir=historydir,
+            ppdir=ppdir,
+            avtype=case["pptype"],
+            ftype=ftype,
+            profile=True,
+            **options,
+        )
+    elapsed = time.perf_counter() - start
+
+    inputs = plan_inputs(
+        comesfrom,
+        1,
+        years,
+        historydir=historydir,
+        ftype=ftype,
+        recombine=options.get("recombine", False),
+        nsplit=options.get("nsplit", 0),
+    )
+    return dict(
+        case=name,
+        layout=case["layout"],
+        pptype=case["pptype"],
+        years=years,
+        time=elapsed,
+        read_bytes=inputs["read_bytes"],
+        throughput=inputs["read_bytes"] / 1024**2 / elapsed,
+        peak_rss=peak_rss(),
+        stages={s["stage"]: s["time"] for s in profile.stages},
+    )
+
+
+def run_benchmark(names=None, years=2, nz=20, ny=90, nx=180, workdir=None):
+    """run benchmark cases on synthetic history, each in a fresh process
+
+    Args:
+        names (list of str, optional): cases to run. Defaults to None (all).
+        years (int, optional): number of years of history. Defaults to 2.
+        nz (int, optional): number of levels of 3D layouts. Defaults to 20.
+        ny (int, optional): number of points in latitude. Defaults to 90.
+        nx (int, optional): number of points in longitude. Defaults to 180.
+        workdir (str, optional): where to write the history and pp files.
+                                 Defaults to None, i.e. a temporary directory.
+
+    Returns:
+        list of dict: results for each case
+    """
+
+    names = list(cases) if names is None else names
+    # spawn so that children do not inherit the memory of this process
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmpdir:
+        for name in names:
+            layout = cases[name]["layout"]
+            historydir = f"{tmpdir}/history/{layout}"
+            if not os.path.exists(historydir):
+                options = dict(layouts[layout])
+                options["nz"] = nz if options.get("nz", 0) > 0 else 0
+                comesfrom = options.pop("comesfrom")
+                write_history(historydir, comesfrom, 1, years, ny=ny, nx=nx, **options)
+
+            casedir = f"{tmpdir}/{name}"
+            os.makedirs(casedir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                future = pool.submit(run_case, name, historydir, casedir, years)
+                results.append(future.result())
+            shutil.rmtree(casedir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark timeseries and averages on synthetic history"
+    )
+    parser.add_argument(
+        "--cases", nargs="+", default=None, help=f"among {', '.join(cases)}"
+    )
+    parser.add_argument("--years", type=int, default=2, help="years of history")
+    parser.add_argument("--nz", type=int, default=20, help="levels of 3D fields")
+    parser.add_argument("--ny", type=int, default=90, help="points in latitude")
+    parser.add_argument("--nx", type=int, default=180, help="points in longitude")
+    parser.add_argument("--workdir", type=str, default=None, help="scratch dir")
+    parser.add_argument(
+        "--json", action="store_true", default=False, help="print json lines"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        names=args.cases,
+        years=args.years,
+        nz=args.nz,
+        ny=args.ny,
+        nx=args.nx,
+        workdir=args.workdir,
+    )
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(
+        f"{'case':24s} {'time (s)':>10s} {'read (MB)':>10s} {'MB/s':>8s} peak RSS (MB)"
+    )
+    for r in results:
+        print(
+            f"{r['case']:24s} {r['time']:10.3f} {r['read_bytes'] / 1024**2:10.1f}"
+            f" {r['throughput']:8.1f} {r['peak_rss'] / 1024**2:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
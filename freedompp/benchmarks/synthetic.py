@@ -0,0 +1,200 @@
+# this module creates synthetic datasets looking like FMS history files
+
+import os
+import tarfile
+
+import numpy as np
+import xarray as xr
+
+# days in each month of the noleap calendar
+month_days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype="f8")
+time_attrs = {"units": "days since 0001-01-01 00:00:00", "calendar": "noleap"}
+
+
+def ocean_month_z(year=1, nz=35, ny=180, nx=360, seed=0):
+    """create a year of history looking like ocean_month_z: smooth
+    temperature and salinity on z levels with small-scale noise and
+    land points set to missing
+
+    Args:
+        year (int, optional): year of the history. Defaults to 1.
+        nz (int, optional): number of vertical levels. Defaults to 35.
+        ny (int, optional): number of points in latitude. Defaults to 180.
+        nx (int, optional): number of points in longitude. Defaults to 360.
+        seed (int, optional): seed of the random noise. Defaults to 0.
+
+    Returns:
+        xarray.Dataset: history dataset
+    """
+
+    rng = np.random.default_rng(seed + year)
+    t2 = (year - 1) * 365 + np.cumsum(month_days)
+    t1 = t2 - month_days
+    z = 5 + 6000 * (np.arange(nz) / max(nz - 1, 1)) ** 2
+    lat = np.linspace(-89.5, 89.5, ny)
+    lon = np.linspace(0.5, 359.5, nx)
+
+    # continents where a smooth pattern is positive, deeper levels have more land
+    pattern = (
+        np.sin(np.deg2rad(2 * lon))[None, :] * np.cos(np.deg2rad(3 * lat))[:, None]
+    )
+    depth = 6000 * (0.5 - 0.5 * pattern)
+    land = z[:, None, None] > depth[None, :, :]
+
+    # broadcast profiles to (time, z, lat, lon)
+    season = np.sin(2 * np.pi * (np.arange(12) + 0.5) / 12)[:, None, None, None]
+    decay = np.exp(-z / 1000)[None, :, None, None]
+    coslat = np.cos(np.deg2rad(lat))[None, None, :, None]
+    sinlat = np.sin(np.deg2rad(lat))[None, None, :, None]
+    shape = (12, nz, ny, nx)
+    thetao = 2 + (26 * coslat + 2 * season) * decay
+    thetao = thetao + 0.1 * rng.standard_normal(shape)
+    so = 34.5 + 0.5 * sinlat * decay + 0.01 * rng.standard_normal(shape)
+    thetao = np.where(land[None], np.nan, thetao).astype("f4")
+    so = np.where(land[None], np.nan, so).astype("f4")
+
+    dims = ["time", "z_l", "yh", "xh"]
+    ds = xr.Dataset(
+        data_vars=dict(
+            thetao=(dims, thetao, {"units": "degC"}),
+            so=(dims, so, {"units": "psu"}),
+            average_T1=(["time"], t1, time_attrs),
+            average_T2=(["time"], t2, time_attrs),
+            average_DT=(["time"], month_days, {"units": "days"}),
+            time_bnds=(["time", "nv"], np.stack([t1, t2], axis=1), time_attrs),
+        ),
+        coords=dict(
+            time=xr.DataArray(0.5 * (t1 + t2), dims=("time"), attrs=time_attrs),
+            z_l=xr.DataArray(z, dims=("z_l"), attrs={"units": "meters"}),
+            yh=xr.DataArray(lat, dims=("yh"), attrs={"units": "degrees_north"}),
+            xh=xr.DataArray(lon, dims=("xh"), attrs={"units": "degrees_east"}),
+        ),
+    )
+    return ds
+
+
+# number of records in a year of history at each frequency
+records_per_year = {"1m": 12, "1d": 365, "6hr": 4 * 365, "3hr": 8 * 365}
+
+
+def history_year(year=1, freq="1m", nz=0, ny=90, nx=180, seed=0):
+    """create a year of history at a given frequency with two fields, on
+    z levels (thetao, so) or at the surface (tos, sos) when nz=0
+
+    Args:
+        year (int, optional): year of the history. Defaults to 1.
+        freq (str, optional): 1m, 1d, 6hr or 3hr. Defaults to "1m".
+        nz (int, optional): number of vertical levels, 0 for 2D fields.
+                            Defaults to 0.
+        ny (int, optional): number of points in latitude. Defaults to 90.
+        nx (int, optional): number of points in longitude. Defaults to 180.
+        seed (int, optional): seed of the random fields. Defaults to 0.
+
+    Returns:
+        xarray.Dataset: history dataset
+    """
+
+    if freq not in records_per_year:
+        raise ValueError(f"unknown freq {freq}, available: {list(records_per_year)}")
+
+    if freq == "1m":
+        dt = month_days
+    else:
+        dt = np.full(records_per_year[freq], 365 / records_per_year[freq])
+    t2 = (year - 1) * 365 + np.cumsum(dt)
+    t1 = t2 - dt
+
+    rng = np.random.default_rng(seed + year)
+    lat = np.linspace(-89.5, 89.5, ny)
+    lon = np.linspace(0.5, 359.5, nx)
+    coords = dict(
+        time=xr.DataArray(0.5 * (t1 + t2), dims=("time"), attrs=time_attrs),
+        yh=xr.DataArray(lat, dims=("yh"), attrs={"units": "degrees_north"}),
+        xh=xr.DataArray(lon, dims=("xh"), attrs={"units": "degrees_east"}),
+    )
+    if nz > 0:
+        names, dims, shape = ["thetao", "so"], ["time", "z_l", "yh", "xh"], (nz,)
+        z = 5 + 6000 * (np.arange(nz) / max(nz - 1, 1)) ** 2
+        coords["z_l"] = xr.DataArray(z, dims=("z_l"), attrs={"units": "meters"})
+    else:
+        names, dims, shape = ["tos", "sos"], ["time", "yh", "xh"], ()
+    shape = (len(dt),) + shape + (ny, nx)
+
+    data_vars = dict(
+        average_T1=(["time"], t1, time_attrs),
+        average_T2=(["time"], t2, time_attrs),
+        average_DT=(["time"], dt, {"units": "days"}),
+        time_bnds=(["time", "nv"], np.stack([t1, t2], axis=1), time_attrs),
+    )
+    for offset, name in zip([15, 35], names):
+        data = offset + rng.standard_normal(shape, dtype="f4")
+        data_vars[name] = (dims, data, {"units": "1"})
+    return xr.Dataset(data_vars=data_vars, coords=coords)
+
+
+def write_history(
+    historydir,
+    comesfrom,
+    yearstart,
+    yearend,
+    freq="1m",
+    nz=0,
+    ny=90,
+    nx=180,
+    nsplit=0,
+    ntiles=0,
+    seed=0,
+):
+    """write yearly YYYY0101.nc.tar archives of synthetic history
+
+    Args:
+        historydir (str): directory where archives are written
+        comesfrom (str): name of the component, e.g. ocean_month
+        yearstart (int): first year
+        yearend (int): last year
+        freq (str, optional): 1m, 1d, 6hr or 3hr. Defaults to "1m".
+        nz (int, optional): number of vertical levels, 0 for 2D fields.
+        ny (int, optional): number of points in latitude. Defaults to 90.
+        nx (int, optional): number of points in longitude. Defaults to 180.
+        nsplit (int, optional): split each file in latitude bands stored as
+                                .nc.0000, .nc.0001, ... with their
+                                domain_decomposition. Defaults to 0.
+        ntiles (int, optional): store tile1.nc ... tileN.nc files instead of
+                                a single .nc file. Defaults to 0.
+        seed (int, optional): seed of the random fields. Defaults to 0.
+
+    Returns:
+        list of str: archives written
+    """
+
+    os.makedirs(historydir, exist_ok=True)
+    archives = []
+    for year in range(yearstart, yearend + 1):
+        ds = history_year(year, freq=freq, nz=nz, ny=ny, nx=nx, seed=seed)
+        members = {}
+        if ntiles > 0:
+            for tile in range(1, ntiles + 1):
+                members[f"{year:04d}0101.{comesfrom}.tile{tile}.nc"] = ds
+        elif nsplit > 0:
+            bounds = np.linspace(0, ny, nsplit + 1).astype(int)
+            for k in range(nsplit):
+                band = ds.isel(yh=slice(bounds[k], bounds[k + 1]))
+                # as written by FMS: global and local start and end, 1-based
+                yh = [1, ny, bounds[k] + 1, bounds[k + 1]]
+                band = band.assign_coords(
+                    yh=band["yh"].assign_attrs(domain_decomposition=yh),
+                    xh=band["xh"].assign_attrs(domain_decomposition=[1, nx, 1, nx]),
+                )
+                members[f"{year:04d}0101.{comesfrom}.nc.{k:04d}"] = band
+        else:
+            members[f"{year:04d}0101.{comesfrom}.nc"] = ds
+
+        archive = f"{historydir}/{year:04d}0101.nc.tar"
+        with tarfile.open(archive, "w:") as tar:
+            for name, member in members.items():
+                ncfile = f"{historydir}/{name}"
+                member.to_netcdf(ncfile)
+                tar.add(ncfile, arcname=f"./{name}")
+                os.remove(ncfile)
+        archives.append(archive)
+    return archives
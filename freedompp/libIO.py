@@ -1,38 +1,330 @@
 import os
 import subprocess
 import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import xarray as xr
-
-
-def filelike(archive, filename):
+from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK
+
+from freedompp.libchunk import plan_chunks, plan_read_chunks
+from freedompp.libcompute import aux_time_vars, stack_tiles
+from freedompp.librecombine import decomposition, recombine_pieces
+from freedompp.libtar import MappedMember, extract_member, match_members
+from freedompp.libtar import missing_members, open_member
+
+# per-run compression options accepted by write_ncfile
+compression_options = [
+    "method",
+    "complevel",
+    "shuffle",
+    "least_significant_digit",
+    "bitround",
+]
+
+# netcdf-c keeps state of the files being created between the calls locked by
+# xarray, so concurrent threads (e.g. writers or jobs) create files, or write
+# them whole, one at a time. The data of delayed writes are stored when
+# computed, under the per-call lock of xarray only
+netcdf_write_lock = threading.Lock()
+
+
+def filelike(archive, filename, use_index=True, indexdir=None):
     """create an in-memory copy of a file extracted from archive
 
     Args:
         archive (str): name of the tar archive used containing file
         filename (str): name of the file to extract virtually
+        use_index (bool, optional): seek to the file using the archive index
+                                    instead of scanning the archive.
+                                    Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
 
     Returns:
         path to file-like object
     """
 
+    if use_index:
+        return open_member(archive, filename, indexdir=indexdir)
+
     tar = tarfile.open(name=archive, mode="r:")
     flike = tar.extractfile(filename)
     return flike
 
 
+def mapped_filelike(archive, filename, indexdir=None):
+    """memory-map a file stored in an (uncompressed) archive and open it
+    with the netCDF4 reader directly from the mapped buffer
+
+    Args:
+        archive (str): name of the tar archive used containing file
+        filename (str): name of the file to map
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+
+    Returns:
+        freedompp.libtar.MappedMember: mapped file, with the opened
+                                       netCDF4.Dataset as reader
+    """
+
+    import netCDF4
+
+    mapped = MappedMember(archive, filename, indexdir=indexdir)
+    # netcdf-c is not thread-safe, share the lock used by xarray
+    with NETCDF4_PYTHON_LOCK:
+        mapped.reader = netCDF4.Dataset(filename, mode="r", memory=mapped.buffer)
+    return mapped
+
+
+def open_from_archive(
+    archive,
+    members,
+    in_memory=True,
+    tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+):
+    """open (or extract) members of a single archive
+
+    Args:
+        archive (str): name of the tar archive containing members
+        members (list): list of files to open from the archive
+        in_memory (bool, optional): Extract files into memory not disk.
+                                    Defaults to True.
+        tmpdir (str, optional): Where to extract data files.
+                                Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map files from the archive.
+                                   Defaults to False.
+
+    Returns:
+        list: file-like objects, mapped files or paths to extracted files
+    """
+
+    if not in_memory and not use_index:
+        htar = tarfile.open(archive)
+    open_files = []
+    for member in members:
+        if use_mmap:
+            open_files.append(mapped_filelike(archive, member, indexdir=indexdir))
+        elif in_memory:
+            open_files.append(
+                filelike(archive, member, use_index=use_index, indexdir=indexdir)
+            )
+        else:
+            if not os.path.exists(f"{tmpdir}/{member}"):
+                print(f"extracting {member} into {tmpdir}")
+                if use_index:
+                    extract_member(archive, member, tmpdir, indexdir=indexdir)
+                else:
+                    htar.extract(member, tmpdir)
+            open_files.append(f"{tmpdir}/{member}")
+
+    if not in_memory and not use_index:
+        htar.close()
+    return open_files
+
+
+def archive_members(filename, recombine=False, nsplit=0):
+    """names of the archive members holding a history file
+
+    Args:
+        filename (str): name of the history file
+        recombine (bool, optional): file is split in files at the format
+                                    *.nc.????. Defaults to False.
+        nsplit (int, optional): with recombine=True, total number of files.
+
+    Returns:
+        list of str: names of the members
+    """
+
+    if recombine:
+        return [f"{filename}.{kn:04d}" for kn in range(nsplit)]
+    return [filename]
+
+
+def history_tiles(filename, archive, recombine=False, indexdir=None):
+    """find the tiles of a history file given as a pattern, e.g.
+    ./00010101.atmos_month.tile*.nc
+
+    Args:
+        filename (str): name of the history file, * standing for the tile
+        archive (str): archive containing the file
+        recombine (bool, optional): files are split. Defaults to False.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+
+    Returns:
+        list of str: labels of the tiles, sorted by number
+    """
+
+    if not os.path.exists(archive):
+        return []
+    # with split files, tiles are found from the first piece
+    pattern = f"{filename}.0000" if recombine else filename
+    tiles = set(match_members(archive, pattern, indexdir=indexdir).values())
+    return sorted(tiles, key=lambda t: (len(t), t))
+
+
+def check_members(files, archives, recombine=False, nsplit=0, indexdir=None):
+    """check all the files are in their archives before reading any of them
+
+    Args:
+        files (list): list of files to open
+        archives (list): list of archives containing these files
+        recombine (bool, optional): files are split. Defaults to False.
+        nsplit (int, optional): with recombine=True, total number of files.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+    """
+
+    missing = []
+    for f, a in zip(files, archives):
+        tiles = history_tiles(f, a, recombine, indexdir) if "*" in f else [None]
+        if len(tiles) == 0:
+            missing.append(f"{a}:{f}")
+        for tile in tiles:
+            tf = f if tile is None else f.replace("*", tile)
+            members = archive_members(tf, recombine=recombine, nsplit=nsplit)
+            missing += [f"{a}:{m}" for m in missing_members(a, members, indexdir)]
+    if len(missing) > 0:
+        raise FileNotFoundError(f"missing history files: {', '.join(missing)}")
+    return None
+
+
+def open_recombined(
+    filename,
+    archive,
+    nsplit,
+    chunks=None,
+    in_memory=True,
+    tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+):
+    """open a history file split by distributed IO (*.nc.????) as a single
+    dataset. Pieces are placed in the global domain given by their
+    domain_decomposition attributes, or combined from their coordinates
+    if they have none. When extracting to tmpdir, the recombined file is
+    written there once and reused by later runs instead of the pieces.
+
+    Args:
+        filename (str): name of the history file
+        archive (str): archive containing the pieces
+        nsplit (int): total number of pieces
+        chunks (dict, optional): dask chunks of each piece. Defaults to None.
+        in_memory (bool, optional): Extract files into memory not disk.
+                                    Defaults to True.
+        tmpdir (str, optional): Where to extract data files.
+                                Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map files from the archive.
+                                   Defaults to False.
+
+    Returns:
+        xr.core.dataset.Dataset: recombined dataset
+        list: open files
+    """
+
+    chunks = {} if chunks is None or chunks == "auto" else chunks
+    recombined = None if in_memory else f"{tmpdir}/{filename}"
+    if recombined is not None and os.path.exists(recombined):
+        ds = xr.open_dataset(recombined, decode_times=False, chunks=chunks)
+        return ds, [recombined]
+
+    members = archive_members(filename, recombine=True, nsplit=nsplit)
+    open_files = open_from_archive(
+        archive,
+        members,
+        in_memory=in_memory,
+        tmpdir=tmpdir,
+        use_index=use_index,
+        indexdir=indexdir,
+        use_mmap=use_mmap,
+    )
+    if use_mmap:
+        sources = [xr.backends.NetCDF4DataStore(f.reader) for f in open_files]
+    else:
+        sources = open_files
+    pieces = [
+        xr.open_dataset(source, decode_times=False, chunks=chunks) for source in sources
+    ]
+    if len(decomposition(pieces[0])) > 0:
+        ds = recombine_pieces(pieces)
+    else:
+        ds = xr.combine_by_coords(pieces, data_vars="minimal")
+
+    if recombined is not None:
+        # written atomically, a partial file must never be reused
+        print(f"writing recombined {filename} into {tmpdir}")
+        tmpfile = f"{recombined}.{os.getpid()}.tmp"
+        # files are recombined concurrently with max_workers > 1
+        with netcdf_write_lock:
+            ds.to_netcdf(tmpfile, engine="netcdf4", format="NETCDF4")
+        ds.close()
+        for piece in pieces:
+            piece.close()
+        os.replace(tmpfile, recombined)
+        for fid in open_files:
+            os.remove(fid)
+        ds = xr.open_dataset(recombined, decode_times=False, chunks=chunks)
+        open_files = [recombined]
+    return ds, open_files
+
+
 def open_files_from_archives(
-    files, archives, in_memory=True, recombine=False, nsplit=0, chunks=None, tmpdir=None
+    files,
+    archives,
+    in_memory=True,
+    recombine=False,
+    nsplit=0,
+    chunks=None,
+    tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
 ):
-    """build a dataset from list of files and their corresponding archives
+    """build a dataset from list of files and their corresponding archives.
+    Files given as a pattern such as ./00010101.atmos_month.tile*.nc are
+    opened for every tile and stacked along a tile dimension.
 
     Args:
         files (list): list of files to open
         archives (list): list of archives containing these files
         in_memory (bool, optional): Extract files into memory not disk.
                                     Defaults to True.
+        chunks (dict or str, optional): dask chunks, only used with
+                                        recombine=True, or "auto" to let
+                                        the chunk planner choose.
+                                        Defaults to None.
         tmpdir (str, optional): Where to extract data files.
                                 Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map files from the archives instead
+                                   of reading them through python.
+                                   Requires in_memory and use_index.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives
+                                     concurrently, also enables the parallel
+                                     opening of datasets. Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds
+                                       the size of chunks="auto".
+                                       Defaults to None.
 
     Returns:
         xr.core.dataset.Dataset: produced dataset
@@ -54,42 +346,94 @@ def open_files_from_archives(
             "when not uncompressing files in memory, `tmpdir` must be set explicitly"
         )
 
+    if use_mmap and not (in_memory and use_index):
+        raise ValueError("use_mmap=True requires in_memory=True and use_index=True")
+
     kwargs = dict(combine="by_coords", decode_times=False)
-    if recombine:
-        kwargs.update({"data_vars": "minimal"})
-        if chunks is None:
-            raise ValueError(
-                "chunks must be explicitly passed when using recombine=True"
+    if recombine and chunks is None:
+        raise ValueError("chunks must be explicitly passed when using recombine=True")
+
+    if use_index:
+        # fail now rather than after opening part of the files
+        check_members(
+            files, archives, recombine=recombine, nsplit=nsplit, indexdir=indexdir
+        )
+
+    if any("*" in f for f in files):
+        # open each tile and stack them, tiles are found in the first archive
+        tiles = history_tiles(files[0], archives[0], recombine, indexdir)
+        if len(tiles) == 0:
+            raise FileNotFoundError(f"no tile matching {files[0]} in {archives[0]}")
+        datasets, open_files = [], []
+        for tile in tiles:
+            ds, fids = open_files_from_archives(
+                [f.replace("*", tile) for f in files],
+                archives,
+                in_memory=in_memory,
+                recombine=recombine,
+                nsplit=nsplit,
+                chunks=chunks,
+                tmpdir=tmpdir,
+                use_index=use_index,
+                indexdir=indexdir,
+                use_mmap=use_mmap,
+                max_workers=max_workers,
+                memory_budget=memory_budget,
             )
-        else:
-            kwargs.update({"chunks": chunks})
+            datasets.append(ds)
+            open_files += fids
+        labels = [int(t) if t.isdigit() else t for t in tiles]
+        return stack_tiles(datasets, labels), open_files
 
-    open_files = []
-    for f, a in zip(files, archives):
-        if not in_memory:
-            htar = tarfile.open(a)
+    def open_one(f, a):
         if recombine:
-            for kn in range(nsplit):
-                fnnnn = f"{f}.{kn:04d}"
-                if in_memory:
-                    open_files.append(filelike(a, fnnnn))
-                else:
-                    if not os.path.exists(f"{tmpdir}/{fnnnn}"):
-                        print(f"extracting {fnnnn} into {tmpdir}")
-                        htar.extract(fnnnn, tmpdir)
-                    open_files.append(f"{tmpdir}/{fnnnn}")
+            # pieces are placed from their decomposition, not by open_mfdataset
+            return open_recombined(
+                f,
+                a,
+                nsplit,
+                chunks=chunks,
+                in_memory=in_memory,
+                tmpdir=tmpdir,
+                use_index=use_index,
+                indexdir=indexdir,
+                use_mmap=use_mmap,
+            )
+        return open_from_archive(
+            a,
+            [f],
+            in_memory=in_memory,
+            tmpdir=tmpdir,
+            use_index=use_index,
+            indexdir=indexdir,
+            use_mmap=use_mmap,
+        )
+
+    if max_workers > 1:
+        # map returns results in submission order, so the list of files
+        # (and hence the combined dataset) is identical to the serial one
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            opened = list(pool.map(open_one, files, archives))
+        kwargs.update({"parallel": True})
+    else:
+        opened = [open_one(f, a) for f, a in zip(files, archives)]
+
+    if recombine:
+        open_files = [fid for _, fids in opened for fid in fids]
+        ds = xr.combine_by_coords([ds for ds, _ in opened], data_vars="minimal")
+    else:
+        open_files = [fid for fids in opened for fid in fids]
+        if use_mmap:
+            stores = [xr.backends.NetCDF4DataStore(f.reader) for f in open_files]
+            ds = xr.open_mfdataset(stores, **kwargs)
         else:
-            if in_memory:
-                open_files.append(filelike(a, f))
-            else:
-                if not os.path.exists(f"{tmpdir}/{f}"):
-                    print(f"extracting {f} into {tmpdir}")
-                    htar.extract(f, tmpdir)
-                open_files.append(f"{tmpdir}/{f}")
+            ds = xr.open_mfdataset(open_files, **kwargs)
 
-        if not in_memory:
-            htar.close()
-    ds = xr.open_mfdataset(open_files, **kwargs)
+    if chunks == "auto":
+        # files are opened with one chunk each, then split or merged
+        plan = plan_read_chunks(ds, memory_budget=memory_budget)
+        print(f"reading history with chunks {plan}")
+        ds = ds.chunk(plan)
 
     return ds, open_files
 
@@ -108,45 +452,380 @@ def close_all_filelikes(flikes):
     return None
 
 
-def write_ncfile(ds, filename, chunks=None, avedim="time"):
+def compression_encoding(ds, var, compression=None):
+    """translate per-run compression options into the netcdf encoding
+    of a variable. Lossy options (least_significant_digit, bitround) are
+    only applied to floating point fields, never to coordinates or to the
+    time variables.
+
+    Args:
+        ds (xarray.core.dataset.Dataset): dataset to write
+        var (str): name of the variable
+        compression (dict, optional): compression options, e.g.
+                                      {'method': 'zstd', 'complevel': 4,
+                                       'shuffle': True, 'bitround': 12}.
+                                      Defaults to None (no compression).
+
+    Returns:
+        dict: netcdf encoding of the variable
+    """
+
+    if compression is None:
+        return {}
+    unknown = set(compression) - set(compression_options)
+    if len(unknown) > 0:
+        raise ValueError(
+            f"unknown compression options {sorted(unknown)}, "
+            f"available: {', '.join(compression_options)}"
+        )
+
+    encoding = {}
+    method = compression.get("method", "zlib")
+    if method not in ["zlib", "zstd", None]:
+        raise ValueError(f"unknown compression {method}, available: zlib / zstd")
+    if method is not None:
+        encoding["compression"] = method
+        encoding["complevel"] = compression.get("complevel", 4)
+        encoding["shuffle"] = compression.get("shuffle", True)
+
+    lossy = (
+        ds[var].dtype.kind == "f" and var not in ds.coords and var not in aux_time_vars
+    )
+    if lossy and compression.get("least_significant_digit") is not None:
+        encoding["least_significant_digit"] = compression["least_significant_digit"]
+    if lossy and compression.get("bitround") is not None:
+        # number of mantissa bits retained
+        encoding["significant_digits"] = compression["bitround"]
+        encoding["quantize_mode"] = "BitRound"
+
+    return encoding
+
+
+def parse_encoding(options):
+    """read per-variable netcdf encodings given on the command line, either
+    as var:key=value items or as a json (or yaml) file {var: {key: value}}.
+    The per-run compression options method and bitround are translated into
+    their netcdf encoding, other keys (e.g. complevel, shuffle,
+    least_significant_digit) are netcdf encoding keys.
+
+    Args:
+        options (list of str): e.g. ['so:complevel=6', 'so:bitround=10'],
+                               or ['encoding.yaml']
+
+    Returns:
+        dict: per-variable encoding, e.g. {'so': {'complevel': 6}}
+    """
+
+    if len(options) == 1 and options[0].endswith((".json", ".yaml", ".yml")):
+        with open(options[0]) as fid:
+            if options[0].endswith(".json"):
+                import json
+
+                items = json.load(fid)
+            else:
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("pyyaml is needed to read yaml encodings")
+                items = yaml.safe_load(fid)
+    else:
+        items = {}
+        for option in options:
+            var, sep, keyvalue = option.partition(":")
+            key, equal, value = keyvalue.partition("=")
+            if sep == "" or equal == "" or var == "" or key == "":
+                raise ValueError(f"encoding {option} is not in the form var:key=value")
+            # numbers and booleans are converted, anything else is a string
+            if value.lower() in ["true", "false"]:
+                value = value.lower() == "true"
+            else:
+                for convert in [int, float]:
+                    try:
+                        value = convert(value)
+                        break
+                    except ValueError:
+                        pass
+            items.setdefault(var, {})[key] = value
+
+    encoding = {}
+    for var, keys in items.items():
+        encoding[var] = {}
+        for key, value in keys.items():
+            if key == "method":
+                encoding[var]["compression"] = value
+            elif key == "bitround":
+                # number of mantissa bits retained
+                encoding[var]["significant_digits"] = value
+                encoding[var]["quantize_mode"] = "BitRound"
+            else:
+                encoding[var][key] = value
+    return encoding
+
+
+def write_ncfile(
+    ds,
+    filename,
+    chunks=None,
+    avedim="time",
+    compute=True,
+    compression=None,
+    encoding=None,
+    pptype="ts",
+):
     """write dataset to netcdf file
 
     Args:
         ds (xarray.core.dataset.Dataset): dataset to write
         filename (str): name of the output file
-        chunks (dict, optional): dictionary containing chunk sizes,
-                                 e.g. {'time': 1, 'z': 35}.
-                                 Defaults to None.
+        chunks (dict or str, optional): dictionary containing chunk sizes,
+                                        e.g. {'time': 1, 'z': 35}, the other
+                                        dimensions are set by the chunk
+                                        planner, or "auto" to plan them all.
+                                        Defaults to None.
         avedim (str, optional): Name of time dimension. Defaults to "time".
+        compute (bool, optional): write immediately. If False, return a
+                                  dask.delayed object to compute later, e.g.
+                                  together with other writes. Defaults to True.
+        compression (dict, optional): compression options for all variables,
+                                      see compression_encoding.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding overriding
+                                   the defaults, e.g. {'so': {'complevel': 6}}.
+                                   Variables not in ds are ignored.
+                                   Defaults to None.
+        pptype (str, optional): type of pp (ts/ann/mm) used to plan chunks.
+                                Defaults to "ts".
+
+    Returns:
+        dask.delayed.Delayed: delayed write if compute=False, else None
     """
     # fix chunksize
     if chunks is not None:
+        chunks = plan_chunks(ds, pptype=pptype, avedim=avedim, chunks=chunks)
+        print(f"writing {os.path.basename(filename)} with chunks {chunks}")
         ds = ds.chunk(chunks)
 
-    encoding = {}
+    var_encoding = {}
     for var in ds:
+        var_encoding[var] = {"_FillValue": 1e20}
         if chunks is not None:
-            chunksizes = ()
-            for dim in ds[var].dims:
-                if dim in chunks:
-                    chunksizes = chunksizes + (chunks[dim],)
-                else:
-                    chunksizes = chunksizes + (len(ds[dim]),)
-            encoding.update({var: {"_FillValue": 1e20, "chunksizes": chunksizes}})
-        else:
-            encoding.update({var: {"_FillValue": 1e20}})
-
-    ds.to_netcdf(
-        filename,
-        unlimited_dims=[avedim],
-        encoding=encoding,
-        engine="netcdf4",
-        format="NETCDF4",
-    )
+            # the plan sets every dimension
+            chunksizes = tuple(chunks[dim] for dim in ds[var].dims)
+            var_encoding[var]["chunksizes"] = chunksizes
+        var_encoding[var].update(compression_encoding(ds, var, compression))
+
+    if encoding is not None:
+        # the same overrides are used for all the files of a run,
+        # each file only gets the ones of its variables
+        for var, options in encoding.items():
+            if var in ds.variables:
+                var_encoding.setdefault(var, {}).update(options)
+
+    # a delayed write only creates the file now, its data are stored when
+    # computed, concurrently with other files
+    with netcdf_write_lock:
+        delayed = ds.to_netcdf(
+            filename,
+            unlimited_dims=[avedim],
+            encoding=var_encoding,
+            engine="netcdf4",
+            format="NETCDF4",
+            compute=compute,
+        )
+
+    return None if compute else delayed
+
+
+def append_ncfile(ds, filename, avedim="time"):
+    """append records of a dataset to an existing netcdf file along its
+    unlimited time dimension, as written by write_ncfile
+
+    Args:
+        ds (xarray.core.dataset.Dataset): dataset to append
+        filename (str): name of the existing file
+        avedim (str, optional): Name of time dimension. Defaults to "time".
+    """
+
+    import netCDF4
+
+    # read the data first, reading may itself need the netCDF lock
+    ds = ds[[var for var in ds.variables if avedim in ds[var].dims]].load()
+
+    # the whole append is locked, see netcdf_write_lock
+    with netcdf_write_lock:
+        with NETCDF4_PYTHON_LOCK, netCDF4.Dataset(filename, mode="a") as nc:
+            if not nc.dimensions[avedim].isunlimited():
+                raise ValueError(
+                    f"{avedim} is not an unlimited dimension in {filename}"
+                )
+            start = len(nc.dimensions[avedim])
+            for var in ds.variables:
+                if avedim not in ds[var].dims:
+                    continue
+                if var not in nc.variables:
+                    raise ValueError(f"{var} is not in {filename}, cannot append")
+                data = ds[var].transpose(*nc.variables[var].dimensions).values
+                if data.dtype.kind == "f":
+                    # missing values are written as _FillValue
+                    data = np.ma.masked_invalid(data)
+                axis = nc.variables[var].dimensions.index(avedim)
+                index = [slice(None)] * data.ndim
+                index[axis] = slice(start, start + data.shape[axis])
+                nc.variables[var][tuple(index)] = data
 
     return None
 
 
+def zarr_encoding(ds, var, compression=None):
+    """translate per-run compression options into the zarr encoding of a
+    variable, compressing with blosc using zlib or zstd
+
+    Args:
+        ds (xarray.core.dataset.Dataset): dataset to write
+        var (str): name of the variable
+        compression (dict, optional): compression options, see
+                                      compression_encoding. Lossy options
+                                      are not available for zarr.
+                                      Defaults to None (zarr default).
+
+    Returns:
+        dict: zarr encoding of the variable
+    """
+
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("zarr is needed to write zarr stores")
+
+    # validate the options the same way as for netcdf
+    encoding = compression_encoding(ds, var, compression)
+    lossy = ["least_significant_digit", "significant_digits"]
+    if any(key in encoding for key in lossy):
+        raise ValueError("lossy compression is only available for netcdf output")
+    if "compression" not in encoding:
+        return {}
+
+    cname = encoding["compression"]
+    clevel = encoding["complevel"]
+    if int(zarr.__version__.split(".")[0]) >= 3:
+        from zarr.codecs import BloscCodec
+
+        shuffle = "shuffle" if encoding["shuffle"] else "noshuffle"
+        codec = BloscCodec(cname=cname, clevel=clevel, shuffle=shuffle)
+        return {"compressors": [codec]}
+    else:
+        from numcodecs import Blosc
+
+        shuffle = Blosc.SHUFFLE if encoding["shuffle"] else Blosc.NOSHUFFLE
+        codec = Blosc(cname=cname, clevel=clevel, shuffle=shuffle)
+        return {"compressor": codec}
+
+
+def write_zarr(
+    ds,
+    store,
+    chunks=None,
+    avedim="time",
+    compute=True,
+    compression=None,
+    encoding=None,
+    pptype="ts",
+):
+    """write dataset to a zarr store (local directory)
+
+    Args:
+        ds (xarray.core.dataset.Dataset): dataset to write
+        store (str): path of the output store
+        chunks (dict or str, optional): dictionary containing chunk sizes,
+                                        e.g. {'time': 1, 'z': 35}, the other
+                                        dimensions are set by the chunk
+                                        planner, or "auto" to plan them all.
+                                        Defaults to None.
+        avedim (str, optional): Name of time dimension. Defaults to "time".
+        compute (bool, optional): write immediately. If False, return a
+                                  dask.delayed object to compute later, e.g.
+                                  together with other writes. Defaults to True.
+        compression (dict, optional): compression options for all variables,
+                                      see zarr_encoding.
+                                      Defaults to None (zarr default).
+        encoding (dict, optional): per-variable zarr encoding overriding
+                                   the defaults. Variables not in ds are
+                                   ignored. Defaults to None.
+        pptype (str, optional): type of pp (ts/ann/mm) used to plan chunks.
+                                Defaults to "ts".
+
+    Returns:
+        dask.delayed.Delayed: delayed write if compute=False, else None
+    """
+    # fix chunksize, zarr chunks are the dask chunks
+    if chunks is not None:
+        chunks = plan_chunks(ds, pptype=pptype, avedim=avedim, chunks=chunks)
+        print(f"writing {os.path.basename(store)} with chunks {chunks}")
+        ds = ds.chunk(chunks)
+
+    var_encoding = {}
+    for var in ds:
+        var_encoding[var] = {"_FillValue": 1e20}
+        var_encoding[var].update(zarr_encoding(ds, var, compression))
+
+    if encoding is not None:
+        for var, options in encoding.items():
+            if var in ds.variables:
+                var_encoding.setdefault(var, {}).update(options)
+
+    # each chunk is written by its own dask task
+    delayed = ds.to_zarr(store, mode="w", encoding=var_encoding, compute=compute)
+
+    return None if compute else delayed
+
+
+def append_zarr(ds, store, avedim="time"):
+    """append records of a dataset to an existing zarr store along its
+    time dimension, only the chunks of the new records are written
+
+    Args:
+        ds (xarray.core.dataset.Dataset): dataset to append
+        store (str): path of the existing store
+        avedim (str, optional): Name of time dimension. Defaults to "time".
+    """
+
+    ds = ds[[var for var in ds.data_vars if avedim in ds[var].dims]]
+    # static coordinates are already in the store
+    ds = ds.drop_vars([var for var in ds.coords if avedim not in ds[var].dims])
+    # a year of a timeserie is small, loading it avoids misaligned dask chunks
+    ds.load().to_zarr(store, append_dim=avedim)
+
+    return None
+
+
+def open_average(paths, avedim="time", output_format="netcdf"):
+    """open the files of an average written in pp (e.g. the 12 files of
+    monthly averages) into one dataset, lazily
+
+    Args:
+        paths (list of str): files (or zarr stores) of the average, in the
+                             order of their records
+        avedim (str, optional): Name of time dimension. Defaults to "time".
+        output_format (str, optional): format of the files, netcdf or zarr.
+                                       Defaults to "netcdf".
+
+    Returns:
+        xarray.core.dataset.Dataset: average dataset
+    """
+
+    if output_format == "zarr":
+        datasets = [xr.open_zarr(path, decode_times=False) for path in paths]
+    else:
+        datasets = [
+            xr.open_dataset(path, decode_times=False, chunks={}) for path in paths
+        ]
+    if len(datasets) == 1:
+        return datasets[0]
+    return xr.concat(
+        datasets, dim=avedim, data_vars="minimal", coords="minimal", compat="override"
+    )
+
+
 def chkdir(ppdir, ppsubdir):
     """create directory if it does not exists
 
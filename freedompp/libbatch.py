@@ -0,0 +1,357 @@
+# this module includes functions to run many pp jobs described in a manifest
+
+import json
+
+from freedompp.libcompute import seasonal_average, select_years
+from freedompp.libfreedompp import average_dataset, average_method
+from freedompp.libfreedompp import average_writes, timeserie_writes
+from freedompp.libIO import close_all_filelikes, open_files_from_archives
+from freedompp.libprofile import profile_compute, profile_stage, start_profile
+from freedompp.libstruct import archives_needed, check_bounds, files_needed
+from freedompp.libstruct import infer_freq
+
+# options used to open the history, jobs sharing them share the dataset
+open_options = [
+    "in_memory",
+    "recombine",
+    "nsplit",
+    "chunks",
+    "tmpdir",
+    "use_index",
+    "indexdir",
+    "use_mmap",
+    "max_workers",
+    "memory_budget",
+]
+# options of the pp products
+product_options = [
+    "rename_to",
+    "freq",
+    "ftype",
+    "prefix",
+    "avedim",
+    "chunks",
+    "compression",
+    "encoding",
+    "output_format",
+]
+
+
+def read_manifest(filename):
+    """read a batch manifest written in yaml (or json)
+
+    Args:
+        filename (str): path to the manifest
+
+    Returns:
+        dict: manifest
+    """
+
+    with open(filename, "r") as fid:
+        if filename.endswith(".json"):
+            manifest = json.load(fid)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("pyyaml is needed to read yaml manifests")
+            manifest = yaml.safe_load(fid)
+
+    for key in ["historydir", "ppdir", "jobs"]:
+        if key not in manifest:
+            raise ValueError(f"{key} must be defined in manifest {filename}")
+    return manifest
+
+
+def expand_jobs(manifest):
+    """expand the jobs of a manifest into one task per pp product type
+    and time segment, e.g. 5-year chunks of a 20-year timeserie
+
+    Args:
+        manifest (dict): manifest with keys historydir, ppdir, jobs
+                         and optional default options
+
+    Returns:
+        list of dict: tasks
+    """
+
+    defaults = manifest.get("options", {})
+    tasks = []
+    for job in manifest["jobs"]:
+        options = dict(defaults, **job)
+        for key in ["comesfrom", "type", "yearstart", "yearend"]:
+            if key not in options:
+                raise ValueError(f"{key} must be defined for each job")
+        yearstart, yearend = options["yearstart"], options["yearend"]
+        check_bounds(yearstart, yearend)
+        segment = options.get("segment", yearend - yearstart + 1)
+        pptypes = options["type"]
+        pptypes = [pptypes] if isinstance(pptypes, str) else pptypes
+
+        for pptype in pptypes:
+            if pptype not in ["ts", "ann", "mm", "seas"]:
+                raise ValueError(
+                    f"unknown type {pptype}. available are ts, ann, mm, seas"
+                )
+            if pptype == "ts" and options.get("fields") is None:
+                raise ValueError("fields must be defined when type=ts")
+            for segstart in range(yearstart, yearend + 1, segment):
+                task = dict(
+                    type=pptype,
+                    comesfrom=options["comesfrom"],
+                    yearstart=segstart,
+                    yearend=min(segstart + segment - 1, yearend),
+                    fields=options.get("fields"),
+                    open={k: options[k] for k in open_options if k in options},
+                )
+                task.update({k: options[k] for k in product_options if k in options})
+                tasks.append(task)
+    return tasks
+
+
+def plan_batch(manifest):
+    """group the tasks of a manifest that can share the same opened dataset,
+    i.e. same component, file type and options to open the history
+
+    Args:
+        manifest (dict): manifest with keys historydir, ppdir, jobs
+                         and optional default options
+
+    Returns:
+        list of dict: groups of tasks, with the years to open
+    """
+
+    groups = {}
+    for task in expand_jobs(manifest):
+        key = json.dumps(
+            [
+                task["comesfrom"],
+                task.get("ftype", "nc"),
+                task.get("prefix", "./"),
+                task["open"],
+            ],
+            sort_keys=True,
+        )
+        if key not in groups:
+            groups[key] = dict(
+                comesfrom=task["comesfrom"],
+                ftype=task.get("ftype", "nc"),
+                prefix=task.get("prefix", "./"),
+                open=task["open"],
+                years=set(),
+                tasks=[],
+            )
+        groups[key]["years"].update(range(task["yearstart"], task["yearend"] + 1))
+        groups[key]["tasks"].append(task)
+
+    for group in groups.values():
+        group["years"] = sorted(group["years"])
+    return list(groups.values())
+
+
+def task_writes(ds, task, ppdir="", monthly=None):
+    """prepare the writes of a task from the dataset of its group
+
+    Args:
+        ds (xarray.Dataset): dataset covering the years of the task
+        task (dict): task from expand_jobs
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        monthly (dict, optional): monthly averages of the group by segment
+                                  of years, shared by its mm and seas tasks.
+                                  Defaults to None.
+
+    Returns:
+        list of dask.delayed.Delayed: writes to compute
+    """
+
+    comesfrom = task["comesfrom"]
+    avedim = task.get("avedim", "time")
+    freq = task.get("freq")
+    ftype = task.get("ftype", "nc")
+    chunks = task.get("chunks")
+    compression = task.get("compression")
+    encoding = task.get("encoding")
+    output_format = task.get("output_format", "netcdf")
+    ppname = comesfrom if task.get("rename_to") is None else task["rename_to"]
+    yearstart, yearend = task["yearstart"], task["yearend"]
+
+    sub = select_years(ds, yearstart, yearend, avedim=avedim)
+    if task["type"] == "ts":
+        return timeserie_writes(
+            sub,
+            task["fields"],
+            ppname,
+            yearstart,
+            yearend,
+            ppdir=ppdir,
+            freq=freq,
+            ftype=ftype,
+            chunks=chunks,
+            compression=compression,
+            encoding=encoding,
+            output_format=output_format,
+        )
+
+    # figure out frequency of dataset or exit if it cannot
+    freq = infer_freq(comesfrom) if freq is None else freq
+    if freq is None:
+        raise ValueError(
+            f"frequency not inferred from {comesfrom} \n"
+            " please provide it explicitly as argument"
+        )
+    method = average_method(task["type"], freq)
+    if method in ["monthly", "seasonal"] and monthly is not None:
+        # seasons are derived from the monthly averages, computed once
+        segment = (yearstart, yearend)
+        if segment not in monthly:
+            monthly[segment] = average_dataset(sub, "monthly", avedim=avedim)
+        ave = monthly[segment]
+        if method == "seasonal":
+            ave = seasonal_average(ave, avedim=avedim)
+    else:
+        ave = average_dataset(sub, method, avedim=avedim)
+    return average_writes(
+        ave,
+        ppname,
+        yearstart,
+        yearend,
+        avtype=task["type"],
+        ppdir=ppdir,
+        freq=freq,
+        ftype=ftype,
+        avedim=avedim,
+        chunks=chunks,
+        compression=compression,
+        encoding=encoding,
+        output_format=output_format,
+    )
+
+
+def run_batch(manifest, profile=None):
+    """run all the jobs of a manifest in this process, opening the history
+    of each component once and writing all its products in one dask compute
+
+    Args:
+        manifest (dict or str): manifest or path to the manifest file
+        profile (Profile or bool, optional): record the time, I/O and memory
+                                             of each stage into this profile,
+                                             or a new one if True.
+                                             Defaults to None.
+
+    Returns:
+        freedompp.libprofile.Profile: profile of the jobs, None if not profiled
+    """
+
+    if isinstance(manifest, str):
+        manifest = read_manifest(manifest)
+
+    historydir = manifest["historydir"]
+    ppdir = manifest["ppdir"]
+    profile = start_profile(profile, "batch")
+
+    for group in plan_batch(manifest):
+        archives, files = [], []
+        for year in group["years"]:
+            archives += archives_needed(year, year, historydir=historydir)
+            files += files_needed(
+                group["comesfrom"],
+                year,
+                year,
+                ftype=group["ftype"],
+                prefix=group["prefix"],
+            )
+        with profile_stage(profile, "open"):
+            ds, fids = open_files_from_archives(files, archives, **group["open"])
+
+        writes, monthly = [], {}
+        for task in group["tasks"]:
+            writes += task_writes(ds, task, ppdir=ppdir, monthly=monthly)
+        print(f"writing {len(writes)} files from {group['comesfrom']}")
+        profile_compute(profile, *writes)
+
+        ds.close()
+        if group["open"].get("in_memory", True):
+            close_all_filelikes(fids)
+
+    return profile
+
+
+def parse_products(products):
+    """read pp products given as type[:segment], e.g. ts:5 for 5-year
+    timeseries, ann:20 for 20-year annual averages or mm for monthly
+    averages over the whole range
+
+    Args:
+        products (list of str or dict): products, dicts are kept as they are
+
+    Returns:
+        list of dict: products with keys type and optionally segment
+    """
+
+    parsed = []
+    for product in products:
+        if isinstance(product, dict):
+            parsed.append(dict(product))
+            continue
+        pptype, _, segment = product.partition(":")
+        parsed.append(dict(type=pptype))
+        if segment != "":
+            if not segment.isdigit() or int(segment) == 0:
+                raise ValueError(f"segment of {product} must be a number of years")
+            parsed[-1]["segment"] = int(segment)
+    return parsed
+
+
+def write_products(
+    comesfrom,
+    yearstart,
+    yearend,
+    products,
+    historydir="",
+    ppdir="",
+    fields="ALL",
+    profile=None,
+    **options,
+):
+    """write several pp products of a component over the same years, e.g.
+    5-year timeseries with 20-year annual and monthly averages, reading
+    the history once and writing all the files in one dask compute
+
+    Args:
+        comesfrom (str): name of netcdf file containing fields without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the products
+        yearend (int): last year of the products
+        products (list of str or dict): products as type[:segment], e.g.
+                                        ["ts:5", "ann:20", "mm:20"], or as
+                                        dicts with keys type and segment
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        fields (list of str, optional): fields of the timeseries, or "ALL".
+                                        Defaults to "ALL".
+        profile (Profile or bool, optional): record the time, I/O and memory
+                                             of each stage into this profile,
+                                             or a new one if True.
+                                             Defaults to None.
+        **options: options to open the history and write the products, as
+                   for write_timeseries (e.g. in_memory, ftype, chunks,
+                   compression)
+
+    Returns:
+        freedompp.libprofile.Profile: profile of the job, None if not profiled
+    """
+
+    unknown = [key for key in options if key not in open_options + product_options]
+    if len(unknown) > 0:
+        raise ValueError(f"options not available for products: {', '.join(unknown)}")
+
+    jobs = []
+    for product in parse_products(products):
+        job = dict(comesfrom=comesfrom, yearstart=yearstart, yearend=yearend)
+        job.update(product)
+        if job["type"] == "ts":
+            job["fields"] = fields
+        jobs.append(job)
+    manifest = dict(historydir=historydir, ppdir=ppdir, options=options, jobs=jobs)
+    return run_batch(manifest, profile=start_profile(profile, f"products {comesfrom}"))
@@ -0,0 +1,147 @@
+# this module includes functions to cache results computed from history
+
+import hashlib
+import json
+import os
+
+import xarray as xr
+
+from freedompp.libIO import write_ncfile
+from freedompp.libtar import archive_stamp
+
+# bump to invalidate existing caches when the content of results changes
+cache_version = 1
+# default maximum size of a cache directory
+cache_max_bytes = 20 * 1024**3
+# cached results are compressed losslessly
+cache_compression = {"method": "zlib", "complevel": 1}
+
+
+def cache_key(archives, files, **params):
+    """build the key of a result from its inputs. Archives are identified
+    by their path, size and modification time, so that a rewritten
+    archive invalidates the results computed from it.
+
+    Args:
+        archives (list of str): archives the result is computed from
+        files (list of str): files read in these archives
+        **params: any other parameter of the computation (field, avtype, ...)
+
+    Returns:
+        str: hexadecimal key
+    """
+
+    content = dict(
+        version=cache_version,
+        archives=[[os.path.abspath(a)] + archive_stamp(a) for a in archives],
+        files=list(files),
+        params=params,
+    )
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def cache_filename(cachedir, key):
+    """path of a cached result
+
+    Args:
+        cachedir (str): cache directory
+        key (str): key of the result
+
+    Returns:
+        str: path to the netcdf file
+    """
+
+    return os.path.join(cachedir, f"{key}.nc")
+
+
+def cache_get(cachedir, key):
+    """open a cached result if it exists and mark it as recently used
+
+    Args:
+        cachedir (str): cache directory
+        key (str): key of the result
+
+    Returns:
+        xarray.Dataset: cached result (lazily opened) or None
+    """
+
+    filename = cache_filename(cachedir, key)
+    if not os.path.exists(filename):
+        return None
+    try:
+        # the access time is not reliable (noatime mounts), mtime is used
+        os.utime(filename)
+        ds = xr.open_dataset(filename, decode_times=False, chunks={})
+    except (OSError, ValueError):
+        # evicted by another process in the meantime, or truncated
+        return None
+    return ds
+
+
+def cache_put(cachedir, key, ds, avedim="time", max_bytes=None):
+    """store a result in the cache, computing it if lazy, and evict the
+    least recently used results if the cache gets too large
+
+    Args:
+        cachedir (str): cache directory
+        key (str): key of the result
+        ds (xarray.Dataset): result to store
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        max_bytes (int, optional): maximum size of the cache.
+                                   Defaults to cache_max_bytes.
+    """
+
+    os.makedirs(cachedir, exist_ok=True)
+    filename = cache_filename(cachedir, key)
+    tmpfile = f"{filename}.{os.getpid()}.tmp"
+    try:
+        write_ncfile(ds, tmpfile, avedim=avedim, compression=cache_compression)
+        # atomic so that concurrent processes never read a partial result
+        os.replace(tmpfile, filename)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    max_bytes = cache_max_bytes if max_bytes is None else max_bytes
+    evict(cachedir, max_bytes, keep=os.path.basename(filename))
+    return None
+
+
+def evict(cachedir, max_bytes, keep=None):
+    """remove the least recently used results until the cache fits in
+    max_bytes
+
+    Args:
+        cachedir (str): cache directory
+        max_bytes (int): maximum size of the cache
+        keep (str, optional): name of a file never removed, e.g. the result
+                              just stored. Defaults to None.
+
+    Returns:
+        list of str: removed files
+    """
+
+    entries = []
+    for name in os.listdir(cachedir):
+        if not name.endswith(".nc") or name == keep:
+            continue
+        try:
+            stat = os.stat(os.path.join(cachedir, name))
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(os.path.join(cachedir, keep)):
+        total += os.path.getsize(os.path.join(cachedir, keep))
+    removed = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cachedir, name))
+        except OSError:
+            continue
+        total -= size
+        removed.append(name)
+    return removed
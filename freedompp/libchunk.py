@@ -0,0 +1,123 @@
+# this module includes functions to choose chunk sizes for reading and writing
+
+import os
+
+# target size of the chunks stored in output files (HDF5 or zarr)
+write_chunk_bytes = 4 * 1024**2
+# target size of the dask chunks used to read history
+read_chunk_bytes = 128 * 1024**2
+
+
+def chunk_bytes(ds, sizes):
+    """size of the largest chunk of any variable of a dataset
+
+    Args:
+        ds (xarray.Dataset): dataset
+        sizes (dict): chunk size for each dimension
+
+    Returns:
+        int: size in bytes
+    """
+
+    nbytes = 0
+    for var in ds.variables:
+        n = ds[var].dtype.itemsize
+        for dim in ds[var].dims:
+            n *= sizes[dim]
+        nbytes = max(nbytes, n)
+    return nbytes
+
+
+def fit_chunks(ds, target_bytes, avedim="time", chunks=None, grow_time=True):
+    """choose chunk sizes so that the largest chunk is close to target_bytes.
+    Dimensions given explicitly are kept, the others start at full length
+    (one record along time) and are split outermost first, e.g. levels
+    before latitude before longitude.
+
+    Args:
+        ds (xarray.Dataset): dataset to chunk
+        target_bytes (int): target size of the largest chunk
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        chunks (dict, optional): explicit chunk sizes. Defaults to None.
+        grow_time (bool, optional): group time records until the chunks
+                                    reach target_bytes. Defaults to True.
+
+    Returns:
+        dict: chunk size for each dimension of ds
+    """
+
+    chunks = {} if chunks is None else chunks
+    sizes = {}
+    for dim in ds.dims:
+        if dim in chunks:
+            sizes[dim] = min(chunks[dim], ds.sizes[dim])
+        elif dim == avedim:
+            sizes[dim] = 1
+        else:
+            sizes[dim] = ds.sizes[dim]
+
+    # split dimensions in the order of the largest variable
+    largest = max(ds.variables, key=lambda var: ds[var].nbytes)
+    for dim in ds[largest].dims:
+        nbytes = chunk_bytes(ds, sizes)
+        if nbytes <= target_bytes:
+            break
+        if dim in chunks or dim == avedim:
+            continue
+        # largest size keeping the chunk below the target
+        sizes[dim] = max(1, sizes[dim] * target_bytes // nbytes)
+
+    if grow_time and avedim in sizes and avedim not in chunks:
+        nrecords = max(1, target_bytes // chunk_bytes(ds, sizes))
+        sizes[avedim] = min(ds.sizes[avedim], nrecords)
+
+    return sizes
+
+
+def plan_chunks(ds, pptype="ts", avedim="time", chunks=None, target_bytes=None):
+    """plan the chunk sizes of an output file. Timeseries group time records
+    into chunks, averages have one record per chunk. Explicit chunk sizes
+    override the plan for their dimensions.
+
+    Args:
+        ds (xarray.Dataset): dataset to write
+        pptype (str, optional): ts, ann or mm. Defaults to "ts".
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        chunks (dict or str, optional): explicit chunk sizes, or "auto".
+                                        Defaults to None.
+        target_bytes (int, optional): target chunk size.
+                                      Defaults to write_chunk_bytes.
+
+    Returns:
+        dict: chunk size for each dimension of ds
+    """
+
+    target_bytes = write_chunk_bytes if target_bytes is None else target_bytes
+    explicit = None if chunks in [None, "auto"] else chunks
+    return fit_chunks(
+        ds, target_bytes, avedim=avedim, chunks=explicit, grow_time=pptype == "ts"
+    )
+
+
+def plan_read_chunks(ds, avedim="time", memory_budget=None, chunks=None):
+    """plan the dask chunks used to read history, as large as possible
+    while every thread can hold a few chunks within the memory budget
+
+    Args:
+        ds (xarray.Dataset): opened history dataset
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        memory_budget (int, optional): memory available in bytes.
+                                       Defaults to None (no limit).
+        chunks (dict or str, optional): explicit chunk sizes, or "auto".
+                                        Defaults to None.
+
+    Returns:
+        dict: chunk size for each dimension of ds
+    """
+
+    target_bytes = read_chunk_bytes
+    if memory_budget is not None:
+        nthreads = os.cpu_count() or 1
+        target_bytes = min(target_bytes, memory_budget // (4 * nthreads))
+    explicit = None if chunks in [None, "auto"] else chunks
+    return fit_chunks(ds, target_bytes, avedim=avedim, chunks=explicit)
@@ -4,6 +4,10 @@ import numpy as np
 
 aux_time_vars = ["time_bnds", "average_T1", "average_T2", "average_DT"]
 
+# months of each season, taken within the same years: DJF averages the
+# January, February and December of every year of the segment
+seasons = {"DJF": [12, 1, 2], "MAM": [3, 4, 5], "JJA": [6, 7, 8], "SON": [9, 10, 11]}
+
 
 def extract_timeserie(ds, field):
     """extract field from dataset containing several fields,
@@ -26,6 +30,28 @@ def extract_timeserie(ds, field):
     return ts
 
 
+def timeserie_fields(ds, avedim="time"):
+    """list the fields of a dataset that can be turned into timeseries,
+    i.e. time-dependent data variables other than time variables
+
+    Args:
+        ds (xr.core.dataset.Dataset): multiple variable dataset
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        list of str: names of the fields
+    """
+
+    if not isinstance(ds, xr.core.dataset.Dataset):
+        raise TypeError("ds must be a xarray.Dataset")
+
+    fields = []
+    for var in ds.data_vars:
+        if var not in aux_time_vars and avedim in ds[var].dims:
+            fields.append(var)
+    return fields
+
+
 def simple_average(ds, avedim="time"):
     """the most simple average, valid for non-weighted averages such as
     interannual from annual means
@@ -94,14 +120,14 @@ def month_by_month_average(ds, avedim="time", bndsdim="nv"):
     # remove aux time variables
     # these dates don't play nice with weighted average
     dsnt = remove_aux_time_vars(ds)
-    # decode times into cftime objects inside a cftime dataset
-    cftime = xr.decode_cf(ds[avedim].to_dataset(name="cftime"), use_cftime=True)
-    # use the cftime to group by month
-    ave = dsnt.groupby(cftime[avedim].dt.month).mean(dim=avedim)
+    # decode times into months once, to group and to compute time variables
+    month = decode_months(ds, avedim=avedim)
+    group = xr.DataArray(month, dims=avedim, name="month")
+    ave = dsnt.groupby(group).mean(dim=avedim)
     # replace month by time
     ave = ave.rename({"month": avedim})
     # add the time variables
-    ave = compute_time_vars_mm(ds, ave, avedim=avedim, bndsdim=bndsdim)
+    ave = compute_time_vars_mm(ds, ave, avedim=avedim, bndsdim=bndsdim, month=month)
     # add attributes
     for var in ave.variables:
         if var in ds.variables:
@@ -109,6 +135,39 @@ def month_by_month_average(ds, avedim="time", bndsdim="nv"):
     return ave
 
 
+def decode_months(ds, avedim="time"):
+    """decode the time axis of a dataset into month numbers
+
+    Args:
+        ds (xr.core.dataset.Dataset): dataset with encoded time axis
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        np.ndarray: month (1-12) of each time record
+    """
+
+    cftime = xr.decode_cf(ds[avedim].to_dataset(name="cftime"), use_cftime=True)
+    return cftime[avedim].dt.month.values
+
+
+def select_years(ds, yearstart, yearend, avedim="time"):
+    """select the time records of a dataset within a segment of years
+
+    Args:
+        ds (xr.core.dataset.Dataset): dataset with encoded time axis
+        yearstart (int): first year of the segment
+        yearend (int): last year of the segment
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xr.core.dataset.Dataset: dataset restricted to the segment
+    """
+
+    cftime = xr.decode_cf(ds[avedim].to_dataset(name="cftime"), use_cftime=True)
+    years = cftime[avedim].dt.year.values
+    return ds.isel({avedim: (years >= yearstart) & (years <= yearend)})
+
+
 def extract_month_number(ave, month, avedim="time"):
     """pick a month between 1-12 and add corresponding time variables
 
@@ -173,7 +232,46 @@ def compute_time_vars_ann(ds_in, ds_out, avedim="time"):
     return ds_out
 
 
-def compute_time_vars_mm(ds_in, ds_out, avedim="time", bndsdim="nv"):
+def month_time_vars(month, time_bnds, average_DT):
+    """compute the time variables of the 12 monthly averages with array
+    operations on the time bookkeeping of all the records
+
+    Args:
+        month (np.ndarray): month (1-12) of each record
+        time_bnds (np.ndarray): time bounds of each record, shape (ntime, 2)
+        average_DT (np.ndarray): length of each record
+
+    Returns:
+        dict: time, average_T1, average_T2 and average_DT of each month
+    """
+
+    ntime = len(month)
+    index = month - 1
+    records = np.arange(ntime)
+    # first and last record of each month
+    first = np.full(12, ntime)
+    np.minimum.at(first, index, records)
+    last = np.full(12, -1)
+    np.maximum.at(last, index, records)
+    if (last < 0).any():
+        missing = [m + 1 for m in range(12) if last[m] < 0]
+        raise ValueError(f"no record for months {missing}")
+
+    # * average_T1 is the first bound (first day) of the given month
+    # of the first year
+    # * average_T2 is the second bound (last day) of the given month
+    # of the last year
+    # * average_DT is the sum of the individual months
+    # * time is the middle of the month in the last year
+    return dict(
+        time=time_bnds[last, 1] - 0.5 * average_DT[last],
+        average_T1=time_bnds[first, 0],
+        average_T2=time_bnds[last, 1],
+        average_DT=np.bincount(index, weights=average_DT, minlength=12),
+    )
+
+
+def compute_time_vars_mm(ds_in, ds_out, avedim="time", bndsdim="nv", month=None):
     """compute and append the time varaibles for a monthly mean dataset
 
     Args:
@@ -181,59 +279,309 @@ def compute_time_vars_mm(ds_in, ds_out, avedim="time", bndsdim="nv"):
         ds_out (xr.core.dataset.Dataset): output (averaged) dataset
         avedim (str, optional): name of time dimension. Defaults to "time".
         bndsdim (str, optional): name of bounds dimension. Defaults to "nv".
+        month (np.ndarray, optional): month of each record of ds_in, if
+                                      already decoded. Defaults to None.
 
     Returns:
         xr.core.dataset.Dataset: appended averaged dataset
     """
 
-    cftime = xr.decode_cf(ds_in["time"].to_dataset(name="cftime"), use_cftime=True)
-    gby = ds_in.groupby(cftime[avedim].dt.month)
+    if month is None:
+        month = decode_months(ds_in, avedim=avedim)
+    # read the time bookkeeping once
+    time_bnds = ds_in["time_bnds"].transpose(avedim, bndsdim).values
+    average_DT = ds_in["average_DT"].values
+    tvars = month_time_vars(month, time_bnds, average_DT)
 
-    average_T1 = []
-    average_T2 = []
-    average_DT = []
-    time = []
+    # add the variables as data arrays:
+    ds_out[avedim] = xr.DataArray(
+        tvars["time"], dims=(avedim), attrs=ds_in[avedim].attrs
+    )
+    for var in ["average_T1", "average_T2", "average_DT"]:
+        ds_out[var] = xr.DataArray(
+            tvars[var], dims=ds_in[var].dims, attrs=ds_in[var].attrs
+        )
+    return ds_out
 
-    for month in range(1, 12 + 1):
-        indexes = gby.groups[month]
-        index_T1 = gby.groups[month][0]
-        index_T2 = gby.groups[month][-1]
 
-        # * average_T1 is the first bound (first day) of the given month
-        # of the first year
-        average_T1.append(
-            ds_in["time_bnds"].isel({avedim: index_T1, bndsdim: 0}).values
-        )
-        # * average_T2 is the second bound (last day) of the given month
-        # of the last year
-        average_T2.append(
-            ds_in["time_bnds"].isel({avedim: index_T2, bndsdim: 1}).values
-        )
-        # * average_DT is the sum of the individual months
-        average_DT.append(
-            ds_in["average_DT"].isel({avedim: indexes}).sum(dim=avedim).values
-        )
-        # * time is the middle of the month in the last year
-        time.append(
-            ds_in["time_bnds"].isel({avedim: index_T2, bndsdim: 1})
-            - 0.5 * ds_in["average_DT"].isel({avedim: index_T2}).values
-        )
+def seasonal_average(ave_mm, avedim="time"):
+    """compute the averages of each season (DJF/MAM/JJA/SON) from the 12
+    monthly averages, each month weighted by its average_DT so that a
+    season is the average of all its records
 
-    # add the variables as data arrays:
-    ds_out[avedim] = xr.DataArray(time, dims=(avedim), attrs=ds_in[avedim].attrs)
+    Args:
+        ave_mm (xr.core.dataset.Dataset): 12 month averaged dataset, e.g.
+                                          from month_by_month_average
+        avedim (str, optional): name of time dimension. Defaults to "time".
 
-    ds_out["average_T1"] = xr.DataArray(
-        average_T1, dims=ds_in["average_T1"].dims, attrs=ds_in["average_T1"].attrs
+    Returns:
+        xr.core.dataset.Dataset: 4 season averaged dataset
+    """
+
+    if ave_mm.sizes[avedim] != 12:
+        raise ValueError("seasonal averages are computed from 12 monthly averages")
+
+    dsnt = remove_aux_time_vars(ave_mm)
+    timevars = [var for var in dsnt.data_vars if avedim in dsnt[var].dims]
+    data = dsnt[timevars]
+    # each weight only counts where data is valid, as in xarray's weighted mean
+    weights = ave_mm["average_DT"]
+    season = np.zeros(12, dtype=int)
+    for k, months in enumerate(seasons.values()):
+        season[np.array(months) - 1] = k
+    group = xr.DataArray(season, dims=avedim, name="season")
+    total = (data * weights).groupby(group).sum(dim=avedim)
+    count = (data.notnull() * weights).groupby(group).sum(dim=avedim)
+    ave = (total / count).rename({"season": avedim})
+    # static variables are left untouched by the averages
+    ave = xr.merge([ave, dsnt.drop_vars(timevars).drop_vars(avedim)])
+    ave = ave[[var for var in ave_mm.data_vars if var in ave.data_vars]]
+    # add the time variables
+    ave = compute_time_vars_seas(ave_mm, ave, avedim=avedim)
+    # add attributes
+    for var in ave.variables:
+        if var in ave_mm.variables:
+            ave[var].attrs = ave_mm[var].attrs
+    return ave
+
+
+def season_time_vars(time, average_T1, average_T2, average_DT):
+    """compute the time variables of the 4 seasonal averages from those of
+    the 12 monthly averages
+
+    Args:
+        time (np.ndarray): time of each month
+        average_T1 (np.ndarray): first bound of each month
+        average_T2 (np.ndarray): second bound of each month
+        average_DT (np.ndarray): length of each month
+
+    Returns:
+        dict: time, average_T1, average_T2 and average_DT of each season
+    """
+
+    index = np.array(list(seasons.values())) - 1
+    # * average_T1 is the first bound of the earliest month of the season
+    # in the first year
+    # * average_T2 is the second bound of the latest month of the season
+    # in the last year
+    # * average_DT is the sum of the months
+    # * time is the middle of the central month of the season in the last
+    # year, as for monthly averages
+    return dict(
+        time=time[index[:, 1]],
+        average_T1=average_T1[index].min(axis=1),
+        average_T2=average_T2[index].max(axis=1),
+        average_DT=average_DT[index].sum(axis=1),
     )
-    ds_out["average_T2"] = xr.DataArray(
-        average_T2, dims=ds_in["average_T2"].dims, attrs=ds_in["average_T2"].attrs
+
+
+def compute_time_vars_seas(ds_in, ds_out, avedim="time"):
+    """compute and append the time variables for a seasonal mean dataset
+
+    Args:
+        ds_in (xr.core.dataset.Dataset): input (12 month averaged) dataset
+        ds_out (xr.core.dataset.Dataset): output (averaged) dataset
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xr.core.dataset.Dataset: appended averaged dataset
+    """
+
+    tvars = season_time_vars(
+        ds_in[avedim].values,
+        ds_in["average_T1"].values,
+        ds_in["average_T2"].values,
+        ds_in["average_DT"].values,
     )
-    ds_out["average_DT"] = xr.DataArray(
-        average_DT, dims=ds_in["average_DT"].dims, attrs=ds_in["average_DT"].attrs
+
+    # add the variables as data arrays:
+    ds_out[avedim] = xr.DataArray(
+        tvars["time"], dims=(avedim), attrs=ds_in[avedim].attrs
     )
+    for var in ["average_T1", "average_T2", "average_DT"]:
+        ds_out[var] = xr.DataArray(
+            tvars[var], dims=ds_in[var].dims, attrs=ds_in[var].attrs
+        )
     return ds_out
 
 
+def extract_season(ave, season, avedim="time"):
+    """pick a season (DJF/MAM/JJA/SON) of a seasonal mean dataset
+
+    Args:
+        ave (xr.core.dataset.Dataset): 4 season averaged dataset
+        season (str): season (DJF/MAM/JJA/SON)
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xr.core.dataset.Dataset: 1 season dataset
+    """
+
+    return ave.isel({avedim: list(seasons).index(season)}).expand_dims(dim=avedim)
+
+
+def combine_averages(pieces, avedim="time"):
+    """combine the averages of consecutive segments (e.g. twenty 5-year
+    annual averages) into the average of the whole segment, each weighted
+    by its average_DT
+
+    Args:
+        pieces (list of xr.core.dataset.Dataset): averages of the segments,
+                                                  with the same records
+                                                  (1 annual, 12 monthly or
+                                                  4 seasonal)
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xr.core.dataset.Dataset: averaged dataset
+    """
+
+    if len(pieces) == 0:
+        raise ValueError("cannot combine averages without data")
+
+    if "time_bnds" in pieces[0].variables:
+        # annual averages: one record per segment, with the bookkeeping of
+        # weighted_by_month_length_average
+        ds = xr.concat(
+            pieces, dim=avedim, data_vars="minimal", coords="minimal", compat="override"
+        )
+        return weighted_by_month_length_average(ds, avedim=avedim)
+
+    # monthly or seasonal averages: combine each record over the segments
+    segdim = "segment"
+    ds = xr.concat(
+        [piece.drop_vars(avedim) for piece in pieces],
+        dim=segdim,
+        data_vars="all",
+        coords="minimal",
+        compat="override",
+    )
+    dsnt = remove_aux_time_vars(ds)
+    ave = dsnt.weighted(ds["average_DT"]).mean(dim=segdim)
+
+    # * average_T1 is the first bound of the first segment
+    # * average_T2 is the second bound of the last segment
+    # * average_DT is the sum of the segments
+    # * time is the one of the last segment (e.g. middle of the month in
+    # the last year)
+    times = np.stack([piece[avedim].values for piece in pieces])
+    last = ds["average_T2"].transpose(segdim, avedim).values.argmax(axis=0)
+    time = times[last, np.arange(times.shape[1])]
+    ave[avedim] = xr.DataArray(time, dims=(avedim), attrs=pieces[0][avedim].attrs)
+    ave["average_T1"] = ds["average_T1"].min(dim=segdim).compute()
+    ave["average_T2"] = ds["average_T2"].max(dim=segdim).compute()
+    ave["average_DT"] = ds["average_DT"].sum(dim=segdim).compute()
+    # add attributes
+    for var in ave.variables:
+        if var in pieces[0].variables:
+            ave[var].attrs = pieces[0][var].attrs
+    return ave
+
+
+def accumulate_average(acc, ds, avtype="ann", weighted=False, avedim="time"):
+    """add a segment of data (e.g. one year) to the running sums of a
+    streaming average. The sums are computed, so memory scales with one
+    segment instead of the whole time serie.
+
+    Args:
+        acc (dict): accumulator returned by a previous call, None to start
+        ds (xr.core.dataset.Dataset): multiple variable dataset
+        avtype (str, optional): annual or monthly average (ann/mm).
+                                Defaults to "ann".
+        weighted (bool, optional): weight by average_DT (e.g. annual mean from
+                                   monthly means). Defaults to False.
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        dict: updated accumulator
+    """
+
+    if not isinstance(ds, xr.core.dataset.Dataset):
+        raise TypeError("ds must be a xarray.Dataset")
+
+    dsnt = remove_aux_time_vars(ds)
+    timevars = [var for var in dsnt.data_vars if avedim in dsnt[var].dims]
+    data = dsnt[timevars]
+    # each weight only counts where data is valid, as in xarray's weighted mean
+    weights = ds["average_DT"] if weighted else xr.ones_like(ds[avedim])
+    valid = data.notnull() * weights
+    data = data * weights
+
+    if avtype == "mm":
+        months = range(1, 12 + 1)
+        month = decode_months(ds, avedim=avedim)
+        month = xr.DataArray(month, dims=avedim, name="month")
+        total = data.groupby(month).sum(dim=avedim).reindex(month=months, fill_value=0)
+        count = valid.groupby(month).sum(dim=avedim).reindex(month=months, fill_value=0)
+    elif avtype == "ann":
+        total = data.sum(dim=avedim)
+        count = valid.sum(dim=avedim)
+    else:
+        raise ValueError(f"unknown average type {avtype}, available: ann / mm")
+
+    total, count = total.compute(), count.compute()
+    timeds = ds[[var for var in aux_time_vars if var in ds.variables]].load()
+
+    if acc is None:
+        acc = dict(
+            total=total,
+            count=count,
+            time=[timeds],
+            static=dsnt.drop_vars(timevars).load(),
+            order=list(ds.data_vars),
+            attrs={var: ds[var].attrs for var in ds.variables},
+        )
+    else:
+        acc["total"] = acc["total"] + total
+        acc["count"] = acc["count"] + count
+        acc["time"].append(timeds)
+    return acc
+
+
+def finalize_average(acc, avtype="ann", avedim="time", bndsdim="nv"):
+    """turn the running sums of a streaming average into the averaged
+    dataset, identical to the one produced from the whole time serie
+
+    Args:
+        acc (dict): accumulator from accumulate_average
+        avtype (str, optional): annual or monthly average (ann/mm).
+                                Defaults to "ann".
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        bndsdim (str, optional): name of bounds dimension. Defaults to "nv".
+
+    Returns:
+        xr.core.dataset.Dataset: averaged dataset
+    """
+
+    if acc is None:
+        raise ValueError("cannot compute an average without data")
+
+    ave = acc["total"] / acc["count"]
+    # static variables are left untouched by the averages
+    ave = xr.merge([ave, acc["static"]])
+    ave = ave[[var for var in acc["order"] if var in ave.data_vars]]
+    # all the time bookkeeping of the segment is small enough to be kept
+    ds_time = xr.concat(acc["time"], dim=avedim)
+
+    if avtype == "mm":
+        ave = ave.rename({"month": avedim})
+        # static variables are broadcast along the months
+        for var in acc["static"].data_vars:
+            ave[var] = ave[var].expand_dims({avedim: ave[avedim]})
+        ave = compute_time_vars_mm(ds_time, ave, avedim=avedim, bndsdim=bndsdim)
+    elif avtype == "ann":
+        ave = ave.expand_dims(dim=avedim)
+        ave = compute_time_vars_ann(ds_time, ave, avedim=avedim)
+    else:
+        raise ValueError(f"unknown average type {avtype}, available: ann / mm")
+
+    # add attributes
+    for var in ave.variables:
+        if var in acc["attrs"]:
+            ave[var].attrs = acc["attrs"][var]
+    return ave
+
+
 def remove_aux_time_vars(ds):
     """remove auxiliary time variables
 
@@ -251,4 +599,61 @@ def remove_aux_time_vars(ds):
     return out
 
 
+def stack_tiles(datasets, tiles, tiledim="tile"):
+    """stack the datasets of the tiles of a grid (e.g. the 6 faces of a
+    cubed sphere) along a new dimension, so that all the tiles are averaged
+    together. Time variables are the same on all tiles and are taken from
+    the first one.
+
+    Args:
+        datasets (list of xr.core.dataset.Dataset): dataset of each tile
+        tiles (list of int or str): label of each tile
+        tiledim (str, optional): name of the new dimension.
+                                 Defaults to "tile".
+
+    Returns:
+        xr.core.dataset.Dataset: stacked dataset
+    """
+
+    fields = [remove_aux_time_vars(ds) for ds in datasets]
+    # grid coordinates differing between tiles get the tile dimension
+    stacked = xr.concat(
+        fields,
+        dim=tiledim,
+        data_vars="all",
+        coords="different",
+        compat="equals",
+        join="override",
+    )
+    for var in aux_time_vars:
+        if var in datasets[0].variables:
+            stacked[var] = datasets[0][var]
+    return stacked.assign_coords({tiledim: tiles})
+
+
+def split_tiles(ds, ftype, tiledim="tile"):
+    """split a dataset stacked by stack_tiles into the dataset and file
+    type of each tile, e.g. tile*.nc into tile1.nc ... tile6.nc
+
+    Args:
+        ds (xr.core.dataset.Dataset): stacked (or single tile) dataset
+        ftype (str): file type, with * standing for the tile label
+        tiledim (str, optional): name of the tile dimension.
+                                 Defaults to "tile".
+
+    Returns:
+        list of (str, xr.core.dataset.Dataset): file type and dataset of
+                                                each tile
+    """
+
+    if "*" not in ftype:
+        return [(ftype, ds)]
+    if tiledim not in ds.dims:
+        raise ValueError(f"file type {ftype} needs a dataset with tiles")
+    return [
+        (ftype.replace("*", str(tile)), ds.isel({tiledim: k}, drop=True))
+        for k, tile in enumerate(ds[tiledim].values)
+    ]
+
+
 # this is where refineDiag should go
@@ -1,18 +1,457 @@
-from freedompp.libcompute import extract_timeserie
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from freedompp.libcache import cache_get, cache_key, cache_put
+from freedompp.libcompute import aux_time_vars, extract_timeserie, timeserie_fields
 from freedompp.libcompute import weighted_by_month_length_average
 from freedompp.libcompute import (
     month_by_month_average,
     simple_average,
     extract_month_number,
 )
+from freedompp.libcompute import extract_season, seasonal_average, seasons
+from freedompp.libcompute import accumulate_average, finalize_average
+from freedompp.libcompute import combine_averages
+from freedompp.libcompute import split_tiles
 from freedompp.libIO import (
+    append_ncfile,
+    append_zarr,
     chkdir,
     close_all_filelikes,
+    open_average,
     open_files_from_archives,
     write_ncfile,
+    write_zarr,
 )
+from freedompp.libpipeline import run_pipeline
+from freedompp.libprofile import profile_compute, profile_index, profile_stage
+from freedompp.libprofile import start_profile
+from freedompp.libstage import ArchiveStager
 from freedompp.libstruct import archives_needed, files_needed, infer_freq
 from freedompp.libstruct import ppsubdirname, tsfilename, avfilename
+from freedompp.libstruct import find_averages, find_timeserie, format_suffix
+
+
+def average_method(avtype, freq):
+    """check that the type of average can be built for the frequency
+    of the dataset and pick the corresponding averaging method
+
+    Args:
+        avtype (str): annual, monthly or seasonal average (ann/mm/seas)
+        freq (str): frequency of the dataset
+
+    Returns:
+        str: averaging method (weighted/simple/monthly/seasonal)
+    """
+
+    if avtype == "ann":
+        if freq == "1m":
+            method = "weighted"
+        elif freq in ["1y", "1d", "6hr", "3hr"]:
+            method = "simple"
+        else:
+            raise ValueError(f"unknown frequency {freq}")
+    elif avtype == "mm":
+        if freq == "1y":
+            raise ValueError("Cannot build monthly averages from yearly files")
+        elif freq in ["1m", "1d", "6hr", "3hr"]:
+            method = "monthly"
+        else:
+            raise ValueError(f"unknown frequency {freq}")
+    elif avtype == "seas":
+        if freq == "1y":
+            raise ValueError("Cannot build seasonal averages from yearly files")
+        elif freq in ["1m", "1d", "6hr", "3hr"]:
+            method = "seasonal"
+        else:
+            raise ValueError(f"unknown frequency {freq}")
+    else:
+        raise ValueError(f"unknown average type {avtype}, available: ann / mm / seas")
+
+    return method
+
+
+def average_dataset(ds, method, avedim="time"):
+    """average a dataset with the chosen method
+
+    Args:
+        ds (xarray.Dataset): dataset to average
+        method (str): averaging method (weighted/simple/monthly/seasonal)
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xarray.Dataset: average dataset
+    """
+
+    if method == "weighted":
+        ave = weighted_by_month_length_average(ds, avedim=avedim)
+    elif method == "simple":
+        ave = simple_average(ds, avedim=avedim)
+    elif method == "monthly":
+        ave = month_by_month_average(ds, avedim=avedim)
+    elif method == "seasonal":
+        # seasons are built from the monthly averages
+        ave = month_by_month_average(ds, avedim=avedim)
+        ave = seasonal_average(ave, avedim=avedim)
+    else:
+        raise ValueError(f"unknown averaging method {method}")
+
+    return ave
+
+
+def stream_average(
+    files,
+    archives,
+    method,
+    avedim="time",
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    metrics=None,
+    **kwargs,
+):
+    """average files contained in tar files one archive at a time, keeping
+    running sums so that memory does not grow with the number of years
+
+    Args:
+        files (list): list of files to average
+        archives (list): list of archives containing these files
+        method (str): averaging method (weighted/simple/monthly/seasonal)
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  while the previous ones are
+                                  averaged. Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): read the next archive in a background
+                                   thread while the current one is
+                                   averaged. Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of archives
+                                     read ahead. Defaults to 2.
+        metrics (dict, optional): filled with the metrics of the pipeline
+                                  queues under "queues". Defaults to None.
+        **kwargs: passed to open_files_from_archives
+
+    Returns:
+        xarray.Dataset: average dataset
+    """
+
+    avtype = "mm" if method in ["monthly", "seasonal"] else "ann"
+    weighted = method == "weighted"
+    in_memory = kwargs.get("in_memory", True)
+
+    acc = None
+    with ArchiveStager(
+        archives,
+        stagedir=stagedir,
+        prefetch=prefetch,
+        max_bytes=stage_budget,
+        indexdir=kwargs.get("indexdir"),
+    ) as stager:
+        if pipeline:
+
+            def read(item):
+                f, a = item
+                ds, fids = open_files_from_archives([f], [stager.get(a)], **kwargs)
+                # load the year here, so that reading overlaps the sums
+                ds = ds.load()
+                ds.close()
+                if in_memory:
+                    close_all_filelikes(fids)
+                stager.release(a)
+                return ds
+
+            def reduce(item, ds):
+                nonlocal acc
+                acc = accumulate_average(
+                    acc, ds, avtype=avtype, weighted=weighted, avedim=avedim
+                )
+                return []
+
+            queues = run_pipeline(
+                list(zip(files, archives)), read, reduce, depth=queue_depth
+            )
+            if metrics is not None:
+                metrics["queues"] = queues
+        else:
+            for f, a in zip(files, archives):
+                ds, fids = open_files_from_archives([f], [stager.get(a)], **kwargs)
+                acc = accumulate_average(
+                    acc, ds, avtype=avtype, weighted=weighted, avedim=avedim
+                )
+                ds.close()
+                if in_memory:
+                    close_all_filelikes(fids)
+                # the sums are computed, the archive is no longer needed
+                stager.release(a)
+
+    ave = finalize_average(acc, avtype=avtype, avedim=avedim)
+    if method == "seasonal":
+        ave = seasonal_average(ave, avedim=avedim)
+    return ave
+
+
+def cached_result(result, cachedir, key, avedim="time"):
+    """compute a result into the cache and return it read back from the
+    cache, so that it no longer depends on the history files
+
+    Args:
+        result (xarray.Dataset): result computed from history
+        cachedir (str): cache directory
+        key (str): key of the result
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xarray.Dataset: cached result
+    """
+
+    cache_put(cachedir, key, result, avedim=avedim)
+    cached = cache_get(cachedir, key)
+    if cached is None:
+        # evicted by another process, keep the result in memory instead
+        return result.load()
+    return cached
+
+
+def timeserie_writes(
+    ds,
+    fields,
+    comesfrom,
+    yearstart,
+    yearend,
+    ppdir="",
+    freq=None,
+    ftype="nc",
+    chunks=None,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+):
+    """prepare the writing of timeseries of several fields of a dataset
+
+    Args:
+        ds (xarray.Dataset): dataset containing the fields
+        fields (list of str): names of the fields to write, or "ALL" for all
+                              the time-dependent fields of the dataset
+        comesfrom (str): name of the component in pp (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
+                               Defaults to "nc".
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+
+    Returns:
+        list of dask.delayed.Delayed: writes to compute
+    """
+
+    if "*" in ftype:
+        # files of each tile, from the dataset with all the tiles
+        writes = []
+        for tile_ftype, tile in split_tiles(ds, ftype):
+            writes += timeserie_writes(
+                tile,
+                fields,
+                comesfrom,
+                yearstart,
+                yearend,
+                ppdir=ppdir,
+                freq=freq,
+                ftype=tile_ftype,
+                chunks=chunks,
+                compression=compression,
+                encoding=encoding,
+                output_format=output_format,
+            )
+        return writes
+
+    # expand the list of fields if needed
+    if fields in ["ALL", ["ALL"]]:
+        fields = timeserie_fields(ds)
+    # define FRE-like pp subdirectory name
+    ppsubdir = ppsubdirname(comesfrom, yearstart, yearend, freq=freq, pptype="ts")
+    # check the output directory exist or create it
+    chkdir(ppdir, ppsubdir)
+    writer = write_zarr if output_format == "zarr" else write_ncfile
+    writes = []
+    for field in fields:
+        # extract the timeserie of the chosen field
+        ts = extract_timeserie(ds, field)
+        # define the FRE-like name of the produced file
+        fname = tsfilename(field, comesfrom, yearstart, yearend, freq=freq, ftype=ftype)
+        fname = format_suffix(fname, output_format=output_format)
+        # prepare the file, data is written when computed
+        fout = f"{ppdir}/{ppsubdir}/{fname}"
+        writes.append(
+            writer(
+                ts,
+                fout,
+                chunks=chunks,
+                compute=False,
+                compression=compression,
+                encoding=encoding,
+            )
+        )
+
+    return writes
+
+
+def average_writes(
+    ave,
+    comesfrom,
+    yearstart,
+    yearend,
+    avtype="ann",
+    ppdir="",
+    freq=None,
+    ftype="nc",
+    avedim="time",
+    chunks=None,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+):
+    """prepare the writing of an average dataset into its pp file(s)
+
+    Args:
+        ave (xarray.Dataset): average dataset
+        comesfrom (str): name of the component in pp (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        avtype (str, optional): annual, monthly or seasonal average
+                                (ann/mm/seas). Defaults to "ann".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
+                               Defaults to "nc".
+        avedim (str, optional): override for name of time dimension.
+                                Defaults to "time".
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+
+    Returns:
+        list of dask.delayed.Delayed: writes to compute
+    """
+
+    if "*" in ftype:
+        # files of each tile, from the average of all the tiles
+        writes = []
+        for tile_ftype, tile in split_tiles(ave, ftype):
+            writes += average_writes(
+                tile,
+                comesfrom,
+                yearstart,
+                yearend,
+                avtype=avtype,
+                ppdir=ppdir,
+                freq=freq,
+                ftype=tile_ftype,
+                avedim=avedim,
+                chunks=chunks,
+                compression=compression,
+                encoding=encoding,
+                output_format=output_format,
+            )
+        return writes
+
+    # define FRE-like pp subdirectory name
+    ppsubdir = ppsubdirname(comesfrom, yearstart, yearend, freq=freq, pptype="av")
+    # check the output directory exist or create it
+    chkdir(ppdir, ppsubdir)
+    writer = write_zarr if output_format == "zarr" else write_ncfile
+
+    writes = []
+    if avtype == "ann":
+        # define the FRE-like name of the produced file
+        fname = avfilename(comesfrom, yearstart, yearend, "ann", ftype=ftype)
+        fname = format_suffix(fname, output_format=output_format)
+        # prepare the file, data is written when computed
+        fout = f"{ppdir}/{ppsubdir}/{fname}"
+        writes.append(
+            writer(
+                ave,
+                fout,
+                chunks=chunks,
+                compute=False,
+                compression=compression,
+                encoding=encoding,
+                pptype=avtype,
+            )
+        )
+    elif avtype == "mm":
+        for month in range(1, 12 + 1):  # loop over month
+            cmonth = f"{month:02d}"  # in format 01-12
+            # pick data for the current month
+            ave_mm = extract_month_number(ave, month, avedim=avedim)
+            # define the FRE-like name of the produced file
+            fname = avfilename(comesfrom, yearstart, yearend, cmonth, ftype=ftype)
+            fname = format_suffix(fname, output_format=output_format)
+            # prepare the file, data is written when computed
+            fout = f"{ppdir}/{ppsubdir}/{fname}"
+            writes.append(
+                writer(
+                    ave_mm,
+                    fout,
+                    chunks=chunks,
+                    compute=False,
+                    compression=compression,
+                    encoding=encoding,
+                    pptype=avtype,
+                )
+            )
+    elif avtype == "seas":
+        for season in seasons:  # loop over DJF/MAM/JJA/SON
+            # pick data for the current season
+            ave_seas = extract_season(ave, season, avedim=avedim)
+            # define the FRE-like name of the produced file
+            fname = avfilename(comesfrom, yearstart, yearend, season, ftype=ftype)
+            fname = format_suffix(fname, output_format=output_format)
+            # prepare the file, data is written when computed
+            fout = f"{ppdir}/{ppsubdir}/{fname}"
+            writes.append(
+                writer(
+                    ave_seas,
+                    fout,
+                    chunks=chunks,
+                    compute=False,
+                    compression=compression,
+                    encoding=encoding,
+                    pptype=avtype,
+                )
+            )
+    else:
+        raise ValueError(f"unknown average type {avtype}, available: ann / mm / seas")
+
+    return writes
 
 
 def load_timeserie(
@@ -28,6 +467,12 @@ def load_timeserie(
     nsplit=0,
     chunks=None,
     tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
+    cachedir=None,
 ):
     """load timeserie of a field from netcdf files contained in tar files
 
@@ -39,7 +484,7 @@ def load_timeserie(
         yearend (int): last year of the time serie
         historydir (str, optional): path to the directory containing "history"
                                     tar files. Defaults to "./".
-        ftype (str, optional): file type (e.g. nc or tileX.nc).
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
                                Defaults to "nc".
         prefix (str, optional): prefix of netcdf files in tar archives.
                                 Defaults to "./".
@@ -49,10 +494,25 @@ def load_timeserie(
                                     Defaults to False.
         nsplit (int, optional): with recombine=True, total number of files.
                                 e.g. nsplit=4 for *.nc.000[0-3]
-        chunks (dict, optional): chunk sizes for output file, e.g. {'time':1}.
-                                 Defaults to None, i.e. original chunking
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
         tmpdir (str, optional): path to a temporary directory to extract history files.
                                 Mandatory if in_memory = False. Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map history files from the archives.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives.
+                                     Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds the
+                                       size of chunks="auto". Defaults to None.
+        cachedir (str, optional): directory caching results, reused when the
+                                  same inputs are requested again.
+                                  Defaults to None (no cache).
 
     Returns:
         xarray.Dataset: timeserie for field and coordinates
@@ -62,6 +522,20 @@ def load_timeserie(
     used_archives = archives_needed(yearstart, yearend, historydir=historydir)
     # infer which files from these archives are needed
     used_files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
+    # reuse the timeserie loaded earlier from the same inputs
+    if cachedir is not None:
+        key = cache_key(
+            used_archives,
+            used_files,
+            result="timeserie",
+            field=field,
+            recombine=recombine,
+            nsplit=nsplit,
+        )
+        ts = cache_get(cachedir, key)
+        if ts is not None:
+            print(f"using cached timeserie of {field} from {comesfrom}")
+            return ts
     # load the dataset from multiple files
     ds, fids = open_files_from_archives(
         used_files,
@@ -71,9 +545,18 @@ def load_timeserie(
         nsplit=nsplit,
         chunks=chunks,
         tmpdir=tmpdir,
+        use_index=use_index,
+        indexdir=indexdir,
+        use_mmap=use_mmap,
+        max_workers=max_workers,
+        memory_budget=memory_budget,
     )
     # extract the timeserie of the chosen field
     ts = extract_timeserie(ds, field)
+    if cachedir is not None:
+        ts = cached_result(ts, cachedir, key)
+        if in_memory:
+            close_all_filelikes(fids)
 
     return ts
 
@@ -94,6 +577,23 @@ def write_timeserie(
     recombine=False,
     nsplit=0,
     tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
+    incremental=False,
+    streaming=False,
+    writers=4,
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+    profile=None,
 ):
     """write timeserie of a field from netcdf files contained in tar files
 
@@ -109,10 +609,12 @@ def write_timeserie(
         rename_to (str, optional): replace parent name "comesfrom" by this
                                    override in pp. Defaults to None.
         freq (str, optional): override for file frequency. Defaults to None.
-        ftype (str, optional): file type (e.g. nc or tileX.nc).
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
                                Defaults to "nc".
-        chunks (dict, optional): chunk sizes for output file, e.g. {'time':1}.
-                                 Defaults to None, i.e. original chunking
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
         prefix (str, optional): prefix of netcdf files in tar archives.
                                 Defaults to "./".
         in_memory (bool, optional): extract data into memory (=no disk IO).
@@ -123,43 +625,742 @@ def write_timeserie(
                                 e.g. nsplit=4 for *.nc.000[0-3]
         tmpdir (str, optional): path to a temporary directory to extract history files.
                                 Mandatory if in_memory = False. Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map history files from the archives.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives.
+                                     Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds the
+                                       size of chunks="auto". Defaults to None.
+        incremental (bool, optional): extend an existing timeserie starting at
+                                      yearstart instead of creating it from
+                                      scratch. Defaults to False.
+        streaming (bool, optional): read one archive at a time for all the
+                                    fields and append it to their files,
+                                    using memory proportional to one year.
+                                    Defaults to False.
+        writers (int, optional): with streaming=True, number of files
+                                 written concurrently. Defaults to 4.
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  with incremental=True or streaming=True.
+                                  Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): stream one archive at a time as with
+                                   streaming=True, reading the next years
+                                   in a background thread and writing the
+                                   previous ones while the current year is
+                                   split. Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of years
+                                     waiting in each queue. Defaults to 2.
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        profile (Profile or bool, optional): record the time, I/O and memory
+                                             of each stage into this profile,
+                                             or a new one if True.
+                                             Defaults to None.
 
+    Returns:
+        freedompp.libprofile.Profile: profile of the job, None if not profiled
     """
 
-    # infer what tar archives are needed
-    used_archives = archives_needed(yearstart, yearend, historydir=historydir)
-    # infer which files from these archives are needed
-    used_files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
-    # load the dataset from multiple files
-    ds, fids = open_files_from_archives(
-        used_files,
-        used_archives,
+    return write_timeseries(
+        [field],
+        comesfrom,
+        yearstart,
+        yearend,
+        historydir=historydir,
+        ppdir=ppdir,
+        rename_to=rename_to,
+        freq=freq,
+        ftype=ftype,
+        chunks=chunks,
+        prefix=prefix,
         in_memory=in_memory,
         recombine=recombine,
         nsplit=nsplit,
-        chunks=chunks,
         tmpdir=tmpdir,
+        use_index=use_index,
+        indexdir=indexdir,
+        use_mmap=use_mmap,
+        max_workers=max_workers,
+        memory_budget=memory_budget,
+        incremental=incremental,
+        streaming=streaming,
+        writers=writers,
+        stagedir=stagedir,
+        prefetch=prefetch,
+        stage_budget=stage_budget,
+        pipeline=pipeline,
+        queue_depth=queue_depth,
+        compression=compression,
+        encoding=encoding,
+        output_format=output_format,
+        profile=profile,
     )
-    # extract the timeserie of the chosen field
-    ts = extract_timeserie(ds, field)
+
+
+def write_timeseries(
+    fields,
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    chunks=None,
+    prefix="./",
+    in_memory=True,
+    recombine=False,
+    nsplit=0,
+    tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
+    incremental=False,
+    streaming=False,
+    writers=4,
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+    profile=None,
+):
+    """write timeseries of several fields from netcdf files contained in tar
+    files, opening the archives once and writing all files in one dask compute
+
+    Args:
+        fields (list of str): names of the fields to write, or "ALL" for all
+                              the time-dependent fields of the component
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "./".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        rename_to (str, optional): replace parent name "comesfrom" by this
+                                   override in pp. Defaults to None.
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
+                               Defaults to "nc".
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
+        prefix (str, optional): prefix of netcdf files in tar archives.
+                                Defaults to "./".
+        in_memory (bool, optional): extract data into memory (=no disk IO).
+                                    Defaults to True.
+        recombine (bool, optional): recombine files at the format *.nc.????
+                                    Defaults to False.
+        nsplit (int, optional): with recombine=True, total number of files.
+                                e.g. nsplit=4 for *.nc.000[0-3]
+        tmpdir (str, optional): path to a temporary directory to extract history files.
+                                Mandatory if in_memory = False. Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map history files from the archives.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives.
+                                     Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds the
+                                       size of chunks="auto". Defaults to None.
+        incremental (bool, optional): extend an existing timeserie starting at
+                                      yearstart instead of creating it from
+                                      scratch. Defaults to False.
+        streaming (bool, optional): read one archive at a time for all the
+                                    fields and append it to their files,
+                                    using memory proportional to one year.
+                                    Defaults to False.
+        writers (int, optional): with streaming=True, number of files
+                                 written concurrently. Defaults to 4.
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  with incremental=True or streaming=True.
+                                  Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): stream one archive at a time as with
+                                   streaming=True, reading the next years
+                                   in a background thread and writing the
+                                   previous ones while the current year is
+                                   split. Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of years
+                                     waiting in each queue. Defaults to 2.
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        profile (Profile or bool, optional): record the time, I/O and memory
+                                             of each stage into this profile,
+                                             or a new one if True.
+                                             Defaults to None.
+
+    Returns:
+        freedompp.libprofile.Profile: profile of the job, None if not profiled
+    """
+
+    profile = start_profile(profile, f"ts {comesfrom} {yearstart}-{yearend}")
+
+    if incremental:
+        # extend the existing timeseries, only the others are fully created
+        with profile_stage(profile, "append"):
+            fields = append_timeseries(
+                fields,
+                comesfrom,
+                yearstart,
+                yearend,
+                historydir=historydir,
+                ppdir=ppdir,
+                rename_to=rename_to,
+                freq=freq,
+                ftype=ftype,
+                prefix=prefix,
+                in_memory=in_memory,
+                recombine=recombine,
+                nsplit=nsplit,
+                chunks=chunks,
+                tmpdir=tmpdir,
+                use_index=use_index,
+                indexdir=indexdir,
+                use_mmap=use_mmap,
+                max_workers=max_workers,
+                memory_budget=memory_budget,
+                output_format=output_format,
+                stagedir=stagedir,
+                prefetch=prefetch,
+                stage_budget=stage_budget,
+            )
+        if len(fields) == 0:
+            return profile
+
+    if streaming or pipeline:
+        # read one archive at a time for all the fields
+        with profile_stage(profile, "stream") as record:
+            stream_timeseries(
+                fields,
+                comesfrom,
+                yearstart,
+                yearend,
+                historydir=historydir,
+                ppdir=ppdir,
+                rename_to=rename_to,
+                freq=freq,
+                ftype=ftype,
+                prefix=prefix,
+                chunks=chunks,
+                compression=compression,
+                encoding=encoding,
+                output_format=output_format,
+                writers=writers,
+                stagedir=stagedir,
+                prefetch=prefetch,
+                stage_budget=stage_budget,
+                pipeline=pipeline,
+                queue_depth=queue_depth,
+                metrics=record,
+                in_memory=in_memory,
+                recombine=recombine,
+                nsplit=nsplit,
+                tmpdir=tmpdir,
+                use_index=use_index,
+                indexdir=indexdir,
+                use_mmap=use_mmap,
+                max_workers=max_workers,
+                memory_budget=memory_budget,
+            )
+        return profile
+
+    # infer what tar archives are needed
+    used_archives = archives_needed(yearstart, yearend, historydir=historydir)
+    # infer which files from these archives are needed
+    used_files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
+    if use_index:
+        profile_index(profile, used_archives, indexdir=indexdir)
+    # load the dataset from multiple files
+    with profile_stage(profile, "open"):
+        ds, fids = open_files_from_archives(
+            used_files,
+            used_archives,
+            in_memory=in_memory,
+            recombine=recombine,
+            nsplit=nsplit,
+            chunks=chunks,
+            tmpdir=tmpdir,
+            use_index=use_index,
+            indexdir=indexdir,
+            use_mmap=use_mmap,
+            max_workers=max_workers,
+            memory_budget=memory_budget,
+        )
     # override directory/file names in pp if override
     if rename_to is not None:
         comesfrom = rename_to
-    # define FRE-like pp subdirectory name
-    ppsubdir = ppsubdirname(comesfrom, yearstart, yearend, freq=freq, pptype="ts")
-    # define the FRE-like name of the produced file
-    fname = tsfilename(field, comesfrom, yearstart, yearend, freq=freq, ftype=ftype)
-    # check the output directory exist or create it
-    chkdir(ppdir, ppsubdir)
-    # write the file
-    write_ncfile(ts, f"{ppdir}/{ppsubdir}/{fname}", chunks=chunks)
+    # prepare the files for all fields
+    writes = timeserie_writes(
+        ds,
+        fields,
+        comesfrom,
+        yearstart,
+        yearend,
+        ppdir=ppdir,
+        freq=freq,
+        ftype=ftype,
+        chunks=chunks,
+        compression=compression,
+        encoding=encoding,
+        output_format=output_format,
+    )
+    # write all the files at once so input chunks are read only once
+    profile_compute(profile, *writes)
     # close files
     if in_memory:
         close_all_filelikes(fids)
 
+    return profile
+
+
+# ioctl cloning a file on linux filesystems with copy-on-write (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def clone_file(source, dest):
+    """copy a file sharing its blocks with the source (reflink) when the
+    filesystem allows it, so that only the blocks written later to the copy
+    are duplicated, or copy its content otherwise
+
+    Args:
+        source (str): path to the file to copy
+        dest (str): path to the copy
+
+    Returns:
+        str: path to the copy
+    """
+
+    try:
+        import fcntl
+
+        with open(source, "rb") as src, open(dest, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    except (ImportError, OSError):
+        return shutil.copy2(source, dest)
+    shutil.copystat(source, dest)
+    return dest
+
+
+def copy_output(source, dest):
+    """copy a pp file, or a zarr store (directory), replacing any leftover
+    copy of a failed run
+
+    Args:
+        source (str): path to the file or store to copy
+        dest (str): path to the copy
+    """
+
+    remove_output(dest)
+    if os.path.isdir(source):
+        shutil.copytree(source, dest, copy_function=clone_file)
+    else:
+        clone_file(source, dest)
     return None
 
 
+def remove_output(path):
+    """remove a pp file or a zarr store (directory) if it exists
+
+    Args:
+        path (str): path to the file or store
+    """
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    return None
+
+
+def replace_output(source, dest):
+    """rename a complete pp file or zarr store (directory) to its final name,
+    replacing an existing one. A store is renamed aside first, as a directory
+    cannot be replaced by a rename
+
+    Args:
+        source (str): path to the complete file or store
+        dest (str): final path
+    """
+
+    if os.path.isdir(dest):
+        old = f"{dest}.old"
+        remove_output(old)
+        os.replace(dest, old)
+        os.replace(source, dest)
+        shutil.rmtree(old)
+    else:
+        os.replace(source, dest)
+    return None
+
+
+def append_timeseries(
+    fields,
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    prefix="./",
+    output_format="netcdf",
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    **kwargs,
+):
+    """extend existing timeseries up to yearend, reading only the archives
+    of the missing years and appending them along the unlimited time dimension
+
+    Args:
+        fields (list of str): names of the fields to extend, or "ALL" for all
+                              the time-dependent fields of the component
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "./".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        rename_to (str, optional): replace parent name "comesfrom" by this
+                                   override in pp. Defaults to None.
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc or tileX.nc).
+                               Defaults to "nc".
+        prefix (str, optional): prefix of netcdf files in tar archives.
+                                Defaults to "./".
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  while the previous years are
+                                  appended. Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        **kwargs: passed to open_files_from_archives
+
+    Returns:
+        list of str: fields without an existing timeserie to extend
+    """
+
+    if "*" in ftype:
+        raise ValueError("incremental timeseries are extended one tile at a time")
+
+    in_memory = kwargs.get("in_memory", True)
+    ppname = comesfrom if rename_to is None else rename_to
+
+    # find the fields in the last year if needed
+    if fields in ["ALL", ["ALL"]]:
+        ds, fids = open_files_from_archives(
+            files_needed(comesfrom, yearend, yearend, ftype=ftype, prefix=prefix),
+            archives_needed(yearend, yearend, historydir=historydir),
+            **kwargs,
+        )
+        fields = timeserie_fields(ds)
+        ds.close()
+        if in_memory:
+            close_all_filelikes(fids)
+
+    # define FRE-like pp subdirectory name
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="ts")
+
+    # group the fields by last year of their existing timeserie
+    missing = []
+    existing = {}
+    for field in fields:
+        newname = tsfilename(field, ppname, yearstart, yearend, freq=freq, ftype=ftype)
+        newname = format_suffix(newname, output_format=output_format)
+        if os.path.exists(f"{ppdir}/{ppsubdir}/{newname}"):
+            # already extended up to yearend (e.g. by a previous run)
+            print(f"{ppdir}/{ppsubdir}/{newname} is up to date")
+            continue
+        fname, lastyear = find_timeserie(
+            ppdir,
+            field,
+            ppname,
+            yearstart,
+            yearend,
+            freq=freq,
+            ftype=ftype,
+            output_format=output_format,
+        )
+        if fname is None:
+            missing.append(field)
+        else:
+            existing.setdefault(lastyear, []).append((field, fname))
+
+    # check the output directory exist or create it
+    chkdir(ppdir, ppsubdir)
+    # only the chunks of the new records are written to zarr stores
+    append = append_zarr if output_format == "zarr" else append_ncfile
+
+    for lastyear, group in existing.items():
+        # copy files to their final directory under a temporary name, they
+        # are renamed once complete and the existing timeseries are kept.
+        # Copies are cloned where the filesystem allows it, so that only the
+        # appended blocks are written
+        tmpfiles = {}
+        try:
+            for field, fname in group:
+                newname = tsfilename(
+                    field, ppname, yearstart, yearend, freq=freq, ftype=ftype
+                )
+                newname = format_suffix(newname, output_format=output_format)
+                tmpfiles[field] = f"{ppdir}/{ppsubdir}/{newname}.tmp"
+                copy_output(fname, tmpfiles[field])
+
+            # append the new years one archive at a time
+            years = list(range(lastyear + 1, yearend + 1))
+            with ArchiveStager(
+                [
+                    archives_needed(year, year, historydir=historydir)[0]
+                    for year in years
+                ],
+                stagedir=stagedir,
+                prefetch=prefetch,
+                max_bytes=stage_budget,
+                indexdir=kwargs.get("indexdir"),
+            ) as stager:
+                for year, archive in zip(years, stager.archives):
+                    ds, fids = open_files_from_archives(
+                        files_needed(comesfrom, year, year, ftype=ftype, prefix=prefix),
+                        [stager.get(archive)],
+                        **kwargs,
+                    )
+                    for field, _ in group:
+                        append(extract_timeserie(ds, field), tmpfiles[field])
+                    ds.close()
+                    if in_memory:
+                        close_all_filelikes(fids)
+                    stager.release(archive)
+
+            for field in tmpfiles:
+                replace_output(tmpfiles[field], tmpfiles[field][: -len(".tmp")])
+        finally:
+            # remove the partial copies of a failed append
+            for tmpfile in tmpfiles.values():
+                remove_output(tmpfile)
+
+    return missing
+
+
+def stream_timeseries(
+    fields,
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    prefix="./",
+    chunks=None,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+    writers=4,
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    metrics=None,
+    **kwargs,
+):
+    """write the timeseries of many fields (e.g. all the fields of a
+    component) one year at a time: each year is read once for all the
+    fields, then written into all the files by a pool of writers, so that
+    memory is proportional to one year of the component
+
+    Args:
+        fields (list of str): names of the fields to write, or "ALL" for all
+                              the time-dependent fields of the component
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "./".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        rename_to (str, optional): replace parent name "comesfrom" by this
+                                   override in pp. Defaults to None.
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
+                               Defaults to "nc".
+        prefix (str, optional): prefix of netcdf files in tar archives.
+                                Defaults to "./".
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        writers (int, optional): number of files written concurrently.
+                                 Defaults to 4.
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read.
+                                  Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): read the next archives in a background
+                                   thread and write the previous years
+                                   while the current one is split into
+                                   timeseries. Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of years
+                                     waiting in each queue. Defaults to 2.
+        metrics (dict, optional): filled with the metrics of the pipeline
+                                  queues under "queues". Defaults to None.
+        **kwargs: passed to open_files_from_archives
+
+    Returns:
+        list of str: files written
+    """
+
+    in_memory = kwargs.get("in_memory", True)
+    ppname = comesfrom if rename_to is None else rename_to
+    # define FRE-like pp subdirectory name
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="ts")
+    # check the output directory exist or create it
+    chkdir(ppdir, ppsubdir)
+    writer = write_zarr if output_format == "zarr" else write_ncfile
+    append = append_zarr if output_format == "zarr" else append_ncfile
+
+    years = list(range(yearstart, yearend + 1))
+    archives = [archives_needed(year, year, historydir=historydir)[0] for year in years]
+    tmpfiles = []
+
+    def read(item):
+        nonlocal fields
+        year, archive = item
+        ds, fids = open_files_from_archives(
+            files_needed(comesfrom, year, year, ftype=ftype, prefix=prefix),
+            [stager.get(archive)],
+            chunks=chunks,
+            **kwargs,
+        )
+        if fields in ["ALL", ["ALL"]]:
+            fields = timeserie_fields(ds)
+        # read the year once for all the fields
+        timevars = [var for var in aux_time_vars if var in ds.variables]
+        data = ds[list(fields) + timevars].load()
+        ds.close()
+        if in_memory:
+            close_all_filelikes(fids)
+        stager.release(archive)
+        return data
+
+    def reduce(item, data):
+        nonlocal tmpfiles
+        year = item[0]
+        # files are written under a temporary name, renamed once complete
+        outputs = []
+        for tile_ftype, tile in split_tiles(data, ftype):
+            for field in fields:
+                fname = tsfilename(
+                    field, ppname, yearstart, yearend, freq=freq, ftype=tile_ftype
+                )
+                fname = format_suffix(fname, output_format=output_format)
+                tmpfile = f"{ppdir}/{ppsubdir}/{fname}.tmp"
+                outputs.append((tmpfile, (year, extract_timeserie(tile, field))))
+        if year == yearstart:
+            tmpfiles = [tmpfile for tmpfile, _ in outputs]
+        return outputs
+
+    def write(tmpfile, output):
+        year, ts = output
+        if year == yearstart:
+            writer(
+                ts, tmpfile, chunks=chunks, compression=compression, encoding=encoding
+            )
+        else:
+            append(ts, tmpfile)
+
+    with ArchiveStager(
+        archives,
+        stagedir=stagedir,
+        prefetch=prefetch,
+        max_bytes=stage_budget,
+        indexdir=kwargs.get("indexdir"),
+    ) as stager:
+        if pipeline:
+            # each file is always written by the same writer, in order
+            queues = run_pipeline(
+                list(zip(years, archives)),
+                read,
+                reduce,
+                write,
+                depth=queue_depth,
+                writers=writers,
+            )
+            if metrics is not None:
+                metrics["queues"] = queues
+        else:
+            with ThreadPoolExecutor(max_workers=writers) as pool:
+                for item in zip(years, archives):
+                    outputs = reduce(item, read(item))
+                    futures = [pool.submit(write, *output) for output in outputs]
+                    # the year is written before reading the next one,
+                    # bounding memory
+                    for future in futures:
+                        future.result()
+
+    for tmpfile in tmpfiles:
+        replace_output(tmpfile, tmpfile[: -len(".tmp")])
+    return [tmpfile[: -len(".tmp")] for tmpfile in tmpfiles]
+
+
 def compute_average(
     comesfrom,
     yearstart,
@@ -175,6 +1376,18 @@ def compute_average(
     nsplit=0,
     chunks=None,
     tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
+    streaming=False,
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    cachedir=None,
 ):
     """compute averages of fields from netcdf files contained in tar files
 
@@ -185,10 +1398,10 @@ def compute_average(
         yearend (int): last year of the time serie
         historydir (str, optional): path to the directory containing "history"
                                     tar files. Defaults to "./".
-        avtype (str, optional): annual or monthly average (ann/mm).
-                                Defaults to "ann".
+        avtype (str, optional): annual, monthly or seasonal average
+                                (ann/mm/seas). Defaults to "ann".
         freq (str, optional): override for file frequency. Defaults to None.
-        ftype (str, optional): file type (e.g. nc or tileX.nc).
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
                                Defaults to "nc".
         prefix (str, optional): prefix of netcdf files in tar archives.
                                 Defaults to "./".
@@ -200,10 +1413,44 @@ def compute_average(
                                     Defaults to False.
         nsplit (int, optional): with recombine=True, total number of files.
                                 e.g. nsplit=4 for *.nc.000[0-3]
-        chunks (dict, optional): chunk sizes for output file, e.g. {'time':1}.
-                                 Defaults to None, i.e. original chunking
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
         tmpdir (str, optional): path to a temporary directory to extract history files.
                                 Mandatory if in_memory = False. Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map history files from the archives.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives.
+                                     Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds the
+                                       size of chunks="auto". Defaults to None.
+        streaming (bool, optional): average one archive at a time with running
+                                    sums, using memory proportional to one
+                                    year instead of the whole segment.
+                                    Defaults to False.
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  with streaming=True. Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): stream one archive at a time as with
+                                   streaming=True, reading the next years
+                                   in a background thread while the
+                                   current one is averaged.
+                                   Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of years
+                                     read ahead. Defaults to 2.
+        cachedir (str, optional): directory caching results, reused when the
+                                  same inputs are requested again.
+                                  Defaults to None (no cache).
 
     Returns:
         xarray.Dataset: average dataset
@@ -213,17 +1460,6 @@ def compute_average(
     used_archives = archives_needed(yearstart, yearend, historydir=historydir)
     # infer which files from these archives are needed
     used_files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
-    # load the dataset from multiple files
-    ds, fids = open_files_from_archives(
-        used_files,
-        used_archives,
-        in_memory=in_memory,
-        recombine=recombine,
-        nsplit=nsplit,
-        chunks=chunks,
-        tmpdir=tmpdir,
-    )
-
     # figure out frequency of dataset or exit if it cannot
     freq = infer_freq(comesfrom) if freq is None else freq
     if freq is None:
@@ -231,27 +1467,173 @@ def compute_average(
             f"frequency not inferred from {comesfrom} \n"
             " please provide it explicitly as argument"
         )
+    # check the average can be built from this frequency
+    method = average_method(avtype, freq)
 
-    if avtype == "ann":
-        if freq == "1m":
-            ave = weighted_by_month_length_average(ds, avedim=avedim)
-        elif freq in ["1y", "1d", "6hr", "3hr"]:
-            ave = simple_average(ds, avedim=avedim)
-        else:
-            raise ValueError(f"unknown frequency {freq}")
-    elif avtype == "mm":
-        if freq == "1y":
-            raise ValueError("Cannot build monthly averages from yearly files")
-        elif freq in ["1m", "1d", "6hr", "3hr"]:
-            ave = month_by_month_average(ds, avedim=avedim)
-        else:
-            raise ValueError(f"unknown frequency {freq}")
+    # reuse the average computed earlier from the same inputs
+    cached = None
+    if cachedir is not None:
+        key = cache_key(
+            used_archives,
+            used_files,
+            result="average",
+            avtype=avtype,
+            freq=freq,
+            avedim=avedim,
+            recombine=recombine,
+            nsplit=nsplit,
+        )
+        cached = cache_get(cachedir, key)
+
+    if cached is not None:
+        print(f"using cached {avtype} average of {comesfrom}")
+        ave, fids = cached, []
+    elif streaming or pipeline:
+        # read one archive at a time and keep running sums
+        ave = stream_average(
+            used_files,
+            used_archives,
+            method,
+            avedim=avedim,
+            in_memory=in_memory,
+            recombine=recombine,
+            nsplit=nsplit,
+            chunks=chunks,
+            tmpdir=tmpdir,
+            use_index=use_index,
+            indexdir=indexdir,
+            use_mmap=use_mmap,
+            max_workers=max_workers,
+            memory_budget=memory_budget,
+            stagedir=stagedir,
+            prefetch=prefetch,
+            stage_budget=stage_budget,
+            pipeline=pipeline,
+            queue_depth=queue_depth,
+        )
+        fids = []
     else:
-        raise ValueError(f"unknown average type {avtype}, available: ann / mm")
+        # load the dataset from multiple files
+        ds, fids = open_files_from_archives(
+            used_files,
+            used_archives,
+            in_memory=in_memory,
+            recombine=recombine,
+            nsplit=nsplit,
+            chunks=chunks,
+            tmpdir=tmpdir,
+            use_index=use_index,
+            indexdir=indexdir,
+            use_mmap=use_mmap,
+            max_workers=max_workers,
+            memory_budget=memory_budget,
+        )
+        ave = average_dataset(ds, method, avedim=avedim)
+
+    if cachedir is not None and cached is None:
+        ave = cached_result(ave, cachedir, key, avedim=avedim)
+        if in_memory:
+            close_all_filelikes(fids)
 
     return ave
 
 
+def hierarchical_average(
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    avtype="ann",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    avedim="time",
+    output_format="netcdf",
+    **kwargs,
+):
+    """average a segment by combining the existing averages of shorter
+    segments in pp (e.g. twenty 5-year averages for a 100-year average),
+    weighted by their average_DT. Only the years that no existing average
+    covers are read from history.
+
+    Args:
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "".
+        ppdir (str, optional): path for pp files. Defaults to "".
+        avtype (str, optional): annual, monthly or seasonal average
+                                (ann/mm/seas). Defaults to "ann".
+        rename_to (str, optional): name of the component in pp, if not
+                                   comesfrom. Defaults to None.
+        freq (str, optional): override for file frequency. Defaults to None.
+        ftype (str, optional): file type (e.g. nc or tileX.nc).
+                               Defaults to "nc".
+        avedim (str, optional): override for name of time dimension.
+                                Defaults to "time".
+        output_format (str, optional): format of pp files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        **kwargs: passed to compute_average
+
+    Returns:
+        xarray.Dataset: average dataset
+    """
+
+    if "*" in ftype:
+        raise ValueError("hierarchical averages are built one tile at a time")
+
+    ppname = comesfrom if rename_to is None else rename_to
+    found = find_averages(
+        ppdir,
+        ppname,
+        yearstart,
+        yearend,
+        avtype=avtype,
+        freq=freq,
+        ftype=ftype,
+        output_format=output_format,
+    )
+    pieces = {}
+    covered = set()
+    for first, last, paths in found:
+        pieces[first] = open_average(paths, avedim=avedim, output_format=output_format)
+        covered.update(range(first, last + 1))
+
+    # contiguous years without an existing average are read from history
+    gaps = []
+    for year in range(yearstart, yearend + 1):
+        if year in covered:
+            continue
+        if len(gaps) > 0 and gaps[-1][1] == year - 1:
+            gaps[-1][1] = year
+        else:
+            gaps.append([year, year])
+    nyears = yearend - yearstart + 1 - len(covered)
+    print(
+        f"combining {len(found)} existing {avtype} averages of {ppname}"
+        f" with {nyears} years of history"
+    )
+    for first, last in gaps:
+        pieces[first] = compute_average(
+            comesfrom,
+            first,
+            last,
+            historydir=historydir,
+            avtype=avtype,
+            freq=freq,
+            ftype=ftype,
+            avedim=avedim,
+            **kwargs,
+        )
+
+    if len(pieces) == 1:
+        return list(pieces.values())[0]
+    return combine_averages([pieces[first] for first in sorted(pieces)], avedim=avedim)
+
+
 def write_average(
     comesfrom,
     yearstart,
@@ -269,6 +1651,23 @@ def write_average(
     recombine=False,
     nsplit=0,
     tmpdir=None,
+    use_index=True,
+    indexdir=None,
+    use_mmap=False,
+    max_workers=1,
+    memory_budget=None,
+    streaming=False,
+    stagedir=None,
+    prefetch=2,
+    stage_budget=None,
+    pipeline=False,
+    queue_depth=2,
+    cachedir=None,
+    hierarchical=False,
+    compression=None,
+    encoding=None,
+    output_format="netcdf",
+    profile=None,
 ):
     """write averages of fields from netcdf files contained in tar files
 
@@ -280,19 +1679,23 @@ def write_average(
         historydir (str, optional): path to the directory containing "history"
                                     tar files. Defaults to "./".
         ppdir (str, optional): path for pp (output) files. Defaults to "".
-        avtype (str, optional): annual or monthly average (ann/mm).
-                                Defaults to "ann".
+        avtype (str or list, optional): annual, monthly or seasonal average
+                                        (ann/mm/seas), or several of them
+                                        computed from one read, e.g.
+                                        ["mm", "seas"]. Defaults to "ann".
         rename_to (str, optional): replace parent name "comesfrom" by this
                                    override in pp. Defaults to None.
         freq (str, optional): override for file frequency. Defaults to None.
-        ftype (str, optional): file type (e.g. nc or tileX.nc).
+        ftype (str, optional): file type (e.g. nc, tileX.nc or tile*.nc).
                                Defaults to "nc".
         prefix (str, optional): prefix of netcdf files in tar archives.
                                 Defaults to "./".
         avedim (str, optional): override for name of time dimension.
                                 Defaults to "time".
-        chunks (dict, optional): chunk sizes for output file, e.g. {'time':1}.
-                                 Defaults to None, i.e. original chunking
+        chunks (dict or str, optional): chunk sizes for output file, e.g.
+                                        {'time':1}, or "auto" for planned
+                                        chunks. Defaults to None, i.e.
+                                        original chunking
         in_memory (bool, optional): extract data into memory (=no disk IO).
                                     Defaults to True.
         recombine (bool, optional): recombine files at the format *.nc.????
@@ -301,24 +1704,64 @@ def write_average(
                                 e.g. nsplit=4 for *.nc.000[0-3]
         tmpdir (str, optional): path to a temporary directory to extract history files.
                                 Mandatory if in_memory = False. Defaults to None.
+        use_index (bool, optional): locate files in archives with a persistent
+                                    member index. Defaults to True.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+        use_mmap (bool, optional): memory-map history files from the archives.
+                                   Defaults to False.
+        max_workers (int, optional): number of threads opening archives.
+                                     Defaults to 1.
+        memory_budget (int, optional): memory available in bytes, bounds the
+                                       size of chunks="auto". Defaults to None.
+        streaming (bool, optional): average one archive at a time with running
+                                    sums, using memory proportional to one
+                                    year instead of the whole segment.
+                                    Defaults to False.
+        stagedir (str, optional): local directory where archives are copied
+                                  from slow storage ahead of being read,
+                                  with streaming=True. Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being read. Defaults to 2.
+        stage_budget (int, optional): disk space in bytes used by staged
+                                      archives. Defaults to None, i.e.
+                                      libstage.stage_max_bytes.
+        pipeline (bool, optional): stream one archive at a time as with
+                                   streaming=True, reading the next years
+                                   in a background thread while the
+                                   current one is averaged.
+                                   Defaults to False.
+        queue_depth (int, optional): with pipeline=True, number of years
+                                     read ahead. Defaults to 2.
+        cachedir (str, optional): directory caching results, reused when the
+                                  same inputs are requested again.
+                                  Defaults to None (no cache).
+        hierarchical (bool, optional): build the average from the existing
+                                       averages of shorter segments in
+                                       ppdir, reading the history only for
+                                       the years they do not cover.
+                                       Defaults to False.
+        compression (dict, optional): compression options of output files,
+                                      e.g. {'method': 'zstd', 'bitround': 12}.
+                                      Defaults to None (no compression).
+        encoding (dict, optional): per-variable netcdf encoding of output
+                                   files, e.g. {'so': {'complevel': 6}}.
+                                   Defaults to None.
+        output_format (str, optional): format of output files, netcdf or zarr
+                                       (chunked store). Defaults to "netcdf".
+        profile (Profile or bool, optional): record the time, I/O and memory
+                                             of each stage into this profile,
+                                             or a new one if True.
+                                             Defaults to None.
 
+    Returns:
+        freedompp.libprofile.Profile: profile of the job, None if not profiled
     """
 
     # infer what tar archives are needed
     used_archives = archives_needed(yearstart, yearend, historydir=historydir)
     # infer which files from these archives are needed
     used_files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
-    # load the dataset from multiple files
-    ds, fids = open_files_from_archives(
-        used_files,
-        used_archives,
-        in_memory=in_memory,
-        recombine=recombine,
-        nsplit=nsplit,
-        chunks=chunks,
-        tmpdir=tmpdir,
-    )
-
     # figure out frequency of dataset or exit if it cannot
     freq = infer_freq(comesfrom) if freq is None else freq
     if freq is None:
@@ -326,51 +1769,172 @@ def write_average(
             f"frequency not inferred from {comesfrom} \n"
             " please provide it explicitly as argument"
         )
+    avtypes = [avtype] if isinstance(avtype, str) else list(avtype)
+    # check the averages can be built from this frequency
+    for av in avtypes:
+        average_method(av, freq)
+    # seasons are derived from the monthly averages, so that both are
+    # computed in the same pass when both are requested
+    bases = []
+    for av in avtypes:
+        base = "mm" if av == "seas" else av
+        if base not in bases:
+            bases.append(base)
+    profile = start_profile(
+        profile, f"{'+'.join(avtypes)} {comesfrom} {yearstart}-{yearend}"
+    )
 
-    if avtype == "ann":
-        if freq == "1m":
-            ave = weighted_by_month_length_average(ds, avedim=avedim)
-        elif freq in ["1y", "1d", "6hr", "3hr"]:
-            ave = simple_average(ds, avedim=avedim)
-        else:
-            raise ValueError(f"unknown frequency {freq}")
-    elif avtype == "mm":
-        if freq == "1y":
-            raise ValueError("Cannot build monthly averages from yearly files")
-        elif freq in ["1m", "1d", "6hr", "3hr"]:
-            ave = month_by_month_average(ds, avedim=avedim)
-        else:
-            raise ValueError(f"unknown frequency {freq}")
-    else:
-        raise ValueError(f"unknown average type {avtype}, available: ann / mm")
+    aves, keys = {}, {}
+    if hierarchical:
+        # combine the averages of shorter segments already in pp, the
+        # history is only read for the years they do not cover
+        with profile_stage(profile, "combine"):
+            for av in avtypes:
+                if av == "seas" and "mm" in avtypes:
+                    continue
+                aves[av] = hierarchical_average(
+                    comesfrom,
+                    yearstart,
+                    yearend,
+                    historydir=historydir,
+                    ppdir=ppdir,
+                    avtype=av,
+                    rename_to=rename_to,
+                    freq=freq,
+                    ftype=ftype,
+                    prefix=prefix,
+                    avedim=avedim,
+                    in_memory=in_memory,
+                    recombine=recombine,
+                    nsplit=nsplit,
+                    chunks=chunks,
+                    tmpdir=tmpdir,
+                    use_index=use_index,
+                    indexdir=indexdir,
+                    use_mmap=use_mmap,
+                    max_workers=max_workers,
+                    memory_budget=memory_budget,
+                    streaming=streaming,
+                    stagedir=stagedir,
+                    prefetch=prefetch,
+                    stage_budget=stage_budget,
+                    pipeline=pipeline,
+                    queue_depth=queue_depth,
+                    cachedir=cachedir,
+                    output_format=output_format,
+                )
+        bases = []
+
+    # reuse the averages computed earlier from the same inputs
+    if cachedir is not None:
+        for base in bases:
+            keys[base] = cache_key(
+                used_archives,
+                used_files,
+                result="average",
+                avtype=base,
+                freq=freq,
+                avedim=avedim,
+                recombine=recombine,
+                nsplit=nsplit,
+            )
+            with profile_stage(profile, "cache"):
+                cached = cache_get(cachedir, keys[base])
+            if cached is not None:
+                print(f"using cached {base} average of {comesfrom}")
+                aves[base] = cached
+    missing = [base for base in bases if base not in aves]
+
+    if len(missing) > 0 and use_index:
+        profile_index(profile, used_archives, indexdir=indexdir)
+
+    fids = []
+    if streaming or pipeline:
+        # read one archive at a time and keep running sums
+        for base in missing:
+            with profile_stage(profile, "stream") as record:
+                aves[base] = stream_average(
+                    used_files,
+                    used_archives,
+                    average_method(base, freq),
+                    avedim=avedim,
+                    in_memory=in_memory,
+                    recombine=recombine,
+                    nsplit=nsplit,
+                    chunks=chunks,
+                    tmpdir=tmpdir,
+                    use_index=use_index,
+                    indexdir=indexdir,
+                    use_mmap=use_mmap,
+                    max_workers=max_workers,
+                    memory_budget=memory_budget,
+                    stagedir=stagedir,
+                    prefetch=prefetch,
+                    stage_budget=stage_budget,
+                    pipeline=pipeline,
+                    queue_depth=queue_depth,
+                    metrics=record,
+                )
+    elif len(missing) > 0:
+        # load the dataset from multiple files
+        with profile_stage(profile, "open"):
+            ds, fids = open_files_from_archives(
+                used_files,
+                used_archives,
+                in_memory=in_memory,
+                recombine=recombine,
+                nsplit=nsplit,
+                chunks=chunks,
+                tmpdir=tmpdir,
+                use_index=use_index,
+                indexdir=indexdir,
+                use_mmap=use_mmap,
+                max_workers=max_workers,
+                memory_budget=memory_budget,
+            )
+        with profile_stage(profile, "average"):
+            for base in missing:
+                aves[base] = average_dataset(
+                    ds, average_method(base, freq), avedim=avedim
+                )
+
+    if cachedir is not None:
+        for base in missing:
+            with profile_stage(profile, "cache"):
+                aves[base] = cached_result(
+                    aves[base], cachedir, keys[base], avedim=avedim
+                )
+
+    if "seas" in avtypes and "seas" not in aves:
+        aves["seas"] = seasonal_average(aves["mm"], avedim=avedim)
 
     # override directory/file names in pp if override
     if rename_to is not None:
         comesfrom = rename_to
-    # define FRE-like pp subdirectory name
-    ppsubdir = ppsubdirname(comesfrom, yearstart, yearend, freq=freq, pptype="av")
-    # check the output directory exist or create it
-    chkdir(ppdir, ppsubdir)
-
-    if avtype == "ann":
-        # define the FRE-like name of the produced file
-        fname = avfilename(comesfrom, yearstart, yearend, "ann", ftype=ftype)
-        # write the file
-        write_ncfile(ave, f"{ppdir}/{ppsubdir}/{fname}", chunks=chunks)
-    elif avtype == "mm":
-        for month in range(1, 12 + 1):  # loop over month
-            cmonth = f"{month:02d}"  # in format 01-12
-            # pick data for the current month
-            ave_mm = extract_month_number(ave, month, avedim=avedim)
-            # define the FRE-like name of the produced file
-            fname = avfilename(comesfrom, yearstart, yearend, cmonth, ftype=ftype)
-            # write the file
-            write_ncfile(ave_mm, f"{ppdir}/{ppsubdir}/{fname}", chunks=chunks)
-    else:
-        raise ValueError(f"unknown average type {avtype}, available: ann / mm")
+    # prepare the files
+    writes = []
+    for av in avtypes:
+        writes += average_writes(
+            aves[av],
+            comesfrom,
+            yearstart,
+            yearend,
+            avtype=av,
+            ppdir=ppdir,
+            freq=freq,
+            ftype=ftype,
+            avedim=avedim,
+            chunks=chunks,
+            compression=compression,
+            encoding=encoding,
+            output_format=output_format,
+        )
+    # write all the files in one compute so that averages are evaluated once
+    # instead of re-reading the history for each file (e.g. for each month)
+    profile_compute(profile, *writes)
 
     # close files
     if in_memory:
         close_all_filelikes(fids)
 
-    return None
+    return profile
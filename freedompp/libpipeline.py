@@ -0,0 +1,194 @@
+# this module includes a pipeline overlapping the reads, reductions and writes
+# of pp jobs processed one archive at a time
+
+import queue
+import threading
+import time
+
+# end of the items put in a queue
+_done = object()
+
+
+class MeteredQueue:
+    """bounded queue recording its depth and the time spent waiting on it.
+    A queue often full (producers waiting) means its consumer is the
+    bottleneck, a queue often empty (consumers waiting) means its producer
+    is.
+
+    Args:
+        name (str): name of the queue in the metrics
+        maxsize (int): maximum number of items in the queue
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.items = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"MeteredQueue({self.name}, {self.items} items)"
+
+    def put(self, item):
+        """put an item, waiting while the queue is full
+
+        Args:
+            item: item to put
+        """
+
+        start = time.perf_counter()
+        self._queue.put(item)
+        wait = time.perf_counter() - start
+        depth = self._queue.qsize()
+        with self._lock:
+            self.put_wait += wait
+            if item is not _done:
+                self.items += 1
+                self.total_depth += depth
+                self.max_depth = max(self.max_depth, depth)
+        return None
+
+    def get(self):
+        """get an item, waiting while the queue is empty
+
+        Returns:
+            item
+        """
+
+        start = time.perf_counter()
+        item = self._queue.get()
+        with self._lock:
+            self.get_wait += time.perf_counter() - start
+        return item
+
+    def drain(self):
+        """remove the items left in the queue, unblocking its producer"""
+
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return None
+
+    def metrics(self):
+        """depth and waiting times of the queue
+
+        Returns:
+            dict: maxsize, items, max and mean depth (when an item is put),
+                  time (s) producers waited for room and consumers waited
+                  for items
+        """
+
+        return dict(
+            maxsize=self.maxsize,
+            items=self.items,
+            max_depth=self.max_depth,
+            mean_depth=self.total_depth / self.items if self.items > 0 else 0.0,
+            put_wait=self.put_wait,
+            get_wait=self.get_wait,
+        )
+
+
+def run_pipeline(items, read, reduce, write=None, depth=2, writers=1):
+    """process items (e.g. yearly archives) in three overlapping stages
+    connected by bounded queues: a reader thread reads item N+1 while item N
+    is reduced in the calling thread, and writer threads write the outputs
+    of the items already reduced. At most depth items wait in each queue,
+    which bounds memory.
+
+    Args:
+        items (list): items to process, reduced in this order
+        read (callable): read(item) -> data, called in the reader thread
+        reduce (callable): reduce(item, data) -> list of (key, output),
+                           called in the calling thread
+        write (callable, optional): write(key, output), called in a writer
+                                    thread. Outputs with the same key (e.g.
+                                    the same file) are written in order by
+                                    the same writer. Defaults to None, reduce
+                                    then returns no outputs.
+        depth (int, optional): maximum number of items waiting in each
+                               queue. Defaults to 2.
+        writers (int, optional): number of writer threads. Defaults to 1.
+
+    Returns:
+        dict: metrics of each queue (read, write0, write1...)
+    """
+
+    if depth < 1:
+        raise ValueError("the depth of the pipeline queues must be at least 1")
+    if write is not None and writers < 1:
+        raise ValueError("a pipeline writing outputs needs at least 1 writer")
+
+    errors = []
+    stop = threading.Event()
+    read_queue = MeteredQueue("read", depth)
+    write_queues = []
+    if write is not None:
+        write_queues = [MeteredQueue(f"write{k}", depth) for k in range(writers)]
+
+    def reader():
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                read_queue.put((item, read(item)))
+        except BaseException as error:
+            errors.append(error)
+        read_queue.put(_done)
+
+    def writer(write_queue):
+        while True:
+            job = write_queue.get()
+            if job is _done:
+                return
+            # after an error, outputs are dropped so that nothing waits
+            if len(errors) == 0:
+                try:
+                    write(*job)
+                except BaseException as error:
+                    errors.append(error)
+
+    threads = [threading.Thread(target=reader, daemon=True)]
+    threads += [
+        threading.Thread(target=writer, args=(q,), daemon=True) for q in write_queues
+    ]
+    for thread in threads:
+        thread.start()
+
+    # outputs with the same key always go to the same writer
+    assigned = {}
+    try:
+        while True:
+            task = read_queue.get()
+            if task is _done or len(errors) > 0:
+                break
+            item, data = task
+            outputs = reduce(item, data)
+            if write is None and len(outputs) > 0:
+                raise ValueError(f"no write for the outputs of {item}")
+            for key, output in outputs:
+                if key not in assigned:
+                    assigned[key] = len(assigned) % len(write_queues)
+                write_queues[assigned[key]].put((key, output))
+    except BaseException as error:
+        errors.append(error)
+    finally:
+        stop.set()
+        # unblock the reader until it stops, then let the writers finish
+        while threads[0].is_alive():
+            read_queue.drain()
+            threads[0].join(timeout=0.1)
+        for write_queue in write_queues:
+            write_queue.put(_done)
+        for thread in threads[1:]:
+            thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+    queues = [read_queue] + write_queues
+    return {q.name: q.metrics() for q in queues}
@@ -0,0 +1,470 @@
+# this module includes functions to plan pp jobs from metadata only (dry run)
+
+import os
+
+import dask.array
+import xarray as xr
+
+from freedompp.libchunk import chunk_bytes, plan_chunks, plan_read_chunks
+from freedompp.libcompute import extract_timeserie, timeserie_fields
+from freedompp.libIO import archive_members, close_all_filelikes, history_tiles
+from freedompp.libstruct import archives_needed, avfilename, avsuffixes, files_needed
+from freedompp.libstruct import format_suffix, infer_freq, ppsubdirname
+from freedompp.libstruct import tsfilename
+from freedompp.libtar import open_member, tar_index
+
+
+def plan_inputs(
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ftype="nc",
+    prefix="./",
+    recombine=False,
+    nsplit=0,
+    indexdir=None,
+):
+    """find the history files of a segment in their archives, using the
+    archive indexes only
+
+    Args:
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the segment
+        yearend (int): last year of the segment
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "".
+        ftype (str, optional): file type. Defaults to "nc".
+        prefix (str, optional): prefix of files in archive. Defaults to "./".
+        recombine (bool, optional): files are split. Defaults to False.
+        nsplit (int, optional): with recombine=True, total number of files.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+
+    Returns:
+        dict: archives, files, missing members (as archive:member),
+              bytes to read in total and for each year, and the labels
+              of the tiles if files are given as tile*.nc
+    """
+
+    archives = archives_needed(yearstart, yearend, historydir=historydir)
+    files = files_needed(comesfrom, yearstart, yearend, ftype=ftype, prefix=prefix)
+    missing, year_bytes, tiles = [], [], None
+    for f, a in zip(files, archives):
+        members = []
+        if "*" in f:
+            # every tile of the file
+            year_tiles = history_tiles(f, a, recombine=recombine, indexdir=indexdir)
+            tiles = year_tiles if tiles is None and len(year_tiles) > 0 else tiles
+            for tile in year_tiles if len(year_tiles) > 0 else ["*"]:
+                tf = f.replace("*", tile)
+                members += archive_members(tf, recombine=recombine, nsplit=nsplit)
+        else:
+            members = archive_members(f, recombine=recombine, nsplit=nsplit)
+        index = tar_index(a, indexdir=indexdir) if os.path.exists(a) else {}
+        nbytes = 0
+        for member in members:
+            name = member.rstrip("/")
+            if name in index:
+                nbytes += index[name][1]
+            else:
+                missing.append(f"{a}:{member}")
+        year_bytes.append(nbytes)
+
+    return dict(
+        archives=archives,
+        files=files,
+        missing=missing,
+        read_bytes=sum(year_bytes),
+        year_bytes=year_bytes,
+        tiles=tiles,
+    )
+
+
+def history_metadata(inputs, recombine=False, nsplit=0, indexdir=None):
+    """open the first history file of a plan lazily, only its header (and
+    the coordinates needed to recombine split files) is read
+
+    Args:
+        inputs (dict): result of plan_inputs
+        recombine (bool, optional): files are split. Defaults to False.
+        nsplit (int, optional): with recombine=True, total number of files.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+
+    Returns:
+        xarray.Dataset: lazy dataset of one year of history, None if
+                        all the history files are missing
+        list: open file-like objects, to close when done
+    """
+
+    for f, a in zip(inputs["files"], inputs["archives"]):
+        if "*" in f:
+            # tiles have the same shape, the first one is representative
+            if inputs["tiles"] is None:
+                continue
+            f = f.replace("*", inputs["tiles"][0])
+        members = archive_members(f, recombine=recombine, nsplit=nsplit)
+        if any(f"{a}:{m}" in inputs["missing"] for m in members):
+            continue
+        fids = [open_member(a, m, indexdir=indexdir) for m in members]
+        ds = xr.open_mfdataset(
+            fids,
+            combine="by_coords",
+            data_vars="minimal",
+            decode_times=False,
+            chunks={},
+        )
+        return ds, fids
+    return None, []
+
+
+def tile_ftypes(ftype, tiles=None):
+    """file types of each tile, e.g. tile*.nc into tile1.nc ... tile6.nc
+
+    Args:
+        ftype (str): file type, with * standing for the tile label
+        tiles (list of str, optional): labels of the tiles. Defaults to None.
+
+    Returns:
+        list of str: file types
+    """
+
+    if "*" not in ftype or tiles is None:
+        return [ftype]
+    return [ftype.replace("*", tile) for tile in tiles]
+
+
+def shape_template(ds, nrecords, avedim="time"):
+    """dataset with the variables of ds and nrecords along time, backed by
+    empty dask arrays so that nothing is allocated
+
+    Args:
+        ds (xarray.Dataset): dataset giving dimensions and types
+        nrecords (int): length of the time dimension
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        xarray.Dataset: template dataset
+    """
+
+    sizes = dict(ds.sizes)
+    if avedim in sizes:
+        sizes[avedim] = nrecords
+    variables = {}
+    for var in ds.variables:
+        shape = tuple(sizes[dim] for dim in ds[var].dims)
+        data = dask.array.empty(shape, dtype=ds[var].dtype, chunks=-1)
+        variables[var] = xr.Variable(ds[var].dims, data, ds[var].attrs)
+    coords = [var for var in ds.coords if var in variables]
+    template = xr.Dataset({v: variables[v] for v in variables if v not in coords})
+    return template.assign_coords({v: variables[v] for v in coords})
+
+
+def estimate_peak_memory(
+    inputs,
+    ds,
+    in_memory=True,
+    use_mmap=False,
+    streaming=False,
+    chunks=None,
+    memory_budget=None,
+    result_bytes=0,
+    avedim="time",
+):
+    """rough estimate of the peak memory of a job: the history held in
+    memory, a few dask chunks per thread and the computed result
+
+    Args:
+        inputs (dict): result of plan_inputs
+        ds (xarray.Dataset): lazy dataset of one year of history
+        in_memory (bool, optional): history read into memory.
+                                    Defaults to True.
+        use_mmap (bool, optional): history memory-mapped, it is then page
+                                   cache rather than process memory.
+                                   Defaults to False.
+        streaming (bool, optional): history read one year at a time.
+                                    Defaults to False.
+        chunks (dict or str, optional): dask chunks used to read history.
+                                        Defaults to None (one per file).
+        memory_budget (int, optional): memory budget used with chunks="auto".
+        result_bytes (int, optional): size of the result held in memory.
+                                      Defaults to 0.
+        avedim (str, optional): name of time dimension. Defaults to "time".
+
+    Returns:
+        int: estimated peak memory in bytes
+    """
+
+    history = 0
+    if in_memory and not use_mmap:
+        years = inputs["year_bytes"]
+        history = max(years, default=0) if streaming else sum(years)
+
+    if chunks == "auto":
+        sizes = plan_read_chunks(ds, avedim=avedim, memory_budget=memory_budget)
+    else:
+        sizes = dict(ds.sizes)
+        sizes.update({} if chunks is None else chunks)
+    nthreads = os.cpu_count() or 1
+    # each thread holds about one chunk in and one chunk out
+    working = 2 * nthreads * chunk_bytes(ds, sizes)
+
+    return history + working + result_bytes
+
+
+def plan_outputs(outputs, pptype="ts", avedim="time", chunks=None):
+    """estimate the uncompressed size and chunking of output files
+
+    Args:
+        outputs (dict): output path -> template of its content
+        pptype (str, optional): ts, ann or mm. Defaults to "ts".
+        avedim (str, optional): name of time dimension. Defaults to "time".
+        chunks (dict or str, optional): chunk sizes of output files.
+                                        Defaults to None.
+
+    Returns:
+        list of dict: path, bytes and chunks (None if same as input)
+    """
+
+    planned = []
+    for path, content in outputs.items():
+        planned.append(
+            dict(
+                path=path,
+                bytes=int(content.nbytes),
+                chunks=(
+                    None
+                    if chunks is None
+                    else plan_chunks(content, pptype, avedim=avedim, chunks=chunks)
+                ),
+            )
+        )
+    return planned
+
+
+def plan_timeseries(
+    fields,
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    chunks=None,
+    prefix="./",
+    in_memory=True,
+    recombine=False,
+    nsplit=0,
+    indexdir=None,
+    use_mmap=False,
+    memory_budget=None,
+    streaming=False,
+    output_format="netcdf",
+    **kwargs,
+):
+    """plan the writing of timeseries without reading any data: archives
+    and members to read, output files with their size and chunks, and
+    peak memory
+
+    Args:
+        fields (list of str): names of the fields to write, or "ALL"
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        **kwargs: other options of write_timeseries, see there.
+                  Options that do not change the plan are ignored.
+
+    Returns:
+        dict: plan of the job, see print_plan
+    """
+
+    inputs = plan_inputs(
+        comesfrom,
+        yearstart,
+        yearend,
+        historydir=historydir,
+        ftype=ftype,
+        prefix=prefix,
+        recombine=recombine,
+        nsplit=nsplit,
+        indexdir=indexdir,
+    )
+    plan = dict(job=f"ts {comesfrom} {yearstart}-{yearend}", outputs=[], **inputs)
+    ds, fids = history_metadata(
+        inputs, recombine=recombine, nsplit=nsplit, indexdir=indexdir
+    )
+    if ds is None:
+        plan["peak_memory"] = 0
+        return plan
+    ntime = ds.sizes.get("time", 1) * len(inputs["files"])
+    template = shape_template(ds, ntime)
+    if fields in ["ALL", ["ALL"]]:
+        fields = timeserie_fields(template)
+
+    ppname = comesfrom if rename_to is None else rename_to
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="ts")
+    outputs = {}
+    for tile_ftype in tile_ftypes(ftype, inputs["tiles"]):
+        for field in fields:
+            filename = tsfilename(
+                field, ppname, yearstart, yearend, freq=freq, ftype=tile_ftype
+            )
+            filename = format_suffix(filename, output_format=output_format)
+            outputs[f"{ppdir}/{ppsubdir}/{filename}"] = extract_timeserie(
+                template, field
+            )
+    plan["outputs"] = plan_outputs(outputs, pptype="ts", chunks=chunks)
+    plan["peak_memory"] = estimate_peak_memory(
+        inputs,
+        ds,
+        in_memory=in_memory,
+        use_mmap=use_mmap,
+        streaming=streaming,
+        chunks=chunks if recombine or chunks == "auto" else None,
+        memory_budget=memory_budget,
+        # streamed years are loaded for all the fields before being written
+        result_bytes=max(inputs["year_bytes"], default=0) if streaming else 0,
+    )
+
+    ds.close()
+    close_all_filelikes(fids)
+    return plan
+
+
+def plan_average(
+    comesfrom,
+    yearstart,
+    yearend,
+    historydir="",
+    ppdir="",
+    avtype="ann",
+    rename_to=None,
+    freq=None,
+    ftype="nc",
+    prefix="./",
+    avedim="time",
+    chunks=None,
+    in_memory=True,
+    recombine=False,
+    nsplit=0,
+    indexdir=None,
+    use_mmap=False,
+    memory_budget=None,
+    streaming=False,
+    output_format="netcdf",
+    **kwargs,
+):
+    """plan the writing of averages without reading any data: archives
+    and members to read, output files with their size and chunks, and
+    peak memory
+
+    Args:
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        avtype (str, optional): annual, monthly or seasonal average
+                                (ann/mm/seas). Defaults to "ann".
+        **kwargs: other options of write_average, see there.
+                  Options that do not change the plan are ignored.
+
+    Returns:
+        dict: plan of the job, see print_plan
+    """
+
+    inputs = plan_inputs(
+        comesfrom,
+        yearstart,
+        yearend,
+        historydir=historydir,
+        ftype=ftype,
+        prefix=prefix,
+        recombine=recombine,
+        nsplit=nsplit,
+        indexdir=indexdir,
+    )
+    plan = dict(job=f"{avtype} {comesfrom} {yearstart}-{yearend}", outputs=[], **inputs)
+    ds, fids = history_metadata(
+        inputs, recombine=recombine, nsplit=nsplit, indexdir=indexdir
+    )
+    if ds is None:
+        plan["peak_memory"] = 0
+        return plan
+    # every average file has a single record
+    template = shape_template(ds, 1, avedim=avedim)
+
+    ppname = comesfrom if rename_to is None else rename_to
+    freq = infer_freq(comesfrom) if freq is None else freq
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="av")
+    suffixes = avsuffixes(avtype)
+    outputs = {}
+    for tile_ftype in tile_ftypes(ftype, inputs["tiles"]):
+        for suffix in suffixes:
+            filename = avfilename(ppname, yearstart, yearend, suffix, ftype=tile_ftype)
+            filename = format_suffix(filename, output_format=output_format)
+            outputs[f"{ppdir}/{ppsubdir}/{filename}"] = template
+    plan["outputs"] = plan_outputs(outputs, pptype=avtype, avedim=avedim, chunks=chunks)
+    # the averages of all the files are computed together
+    result_bytes = sum(output["bytes"] for output in plan["outputs"])
+    if streaming:
+        # running sums and weights next to the result
+        result_bytes *= 2
+    plan["peak_memory"] = estimate_peak_memory(
+        inputs,
+        ds,
+        in_memory=in_memory,
+        use_mmap=use_mmap,
+        streaming=streaming,
+        chunks=chunks if recombine or chunks == "auto" else None,
+        memory_budget=memory_budget,
+        result_bytes=result_bytes,
+        avedim=avedim,
+    )
+
+    ds.close()
+    close_all_filelikes(fids)
+    return plan
+
+
+def check_plan(plan):
+    """raise if history files needed by a plan are missing
+
+    Args:
+        plan (dict): result of plan_timeseries or plan_average
+    """
+
+    if len(plan["missing"]) > 0:
+        raise FileNotFoundError(
+            f"{plan['job']}: missing history files: {', '.join(plan['missing'])}"
+        )
+    return None
+
+
+def print_plan(plan):
+    """print a plan in a human readable form
+
+    Args:
+        plan (dict): result of plan_timeseries or plan_average
+    """
+
+    mb = 1024**2
+    print(f"plan for {plan['job']}")
+    print(f"  archives to open: {len(plan['archives'])}")
+    for archive in plan["archives"]:
+        print(f"    {archive}")
+    print(f"  bytes to read: {plan['read_bytes'] / mb:.1f} MB")
+    if len(plan["missing"]) > 0:
+        print(f"  MISSING history files: {len(plan['missing'])}")
+        for missing in plan["missing"]:
+            print(f"    {missing}")
+    print(f"  output files: {len(plan['outputs'])}")
+    for output in plan["outputs"]:
+        chunks = "" if output["chunks"] is None else f", chunks {output['chunks']}"
+        print(f"    {output['path']} ({output['bytes'] / mb:.1f} MB{chunks})")
+    print(f"  estimated peak memory: {plan['peak_memory'] / mb:.1f} MB")
+    return None
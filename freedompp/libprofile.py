@@ -0,0 +1,248 @@
+# this module includes functions to profile the stages of pp jobs
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+import dask
+from dask.callbacks import Callback
+from dask.utils import key_split
+
+from freedompp.libtar import tar_index
+
+
+def peak_rss():
+    """peak resident memory of this process
+
+    Returns:
+        int: peak RSS in bytes
+    """
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return maxrss if sys.platform == "darwin" else 1024 * maxrss
+
+
+def io_counters():
+    """bytes read and written by this process so far, through read and
+    write calls (memory-mapped reads are not counted)
+
+    Returns:
+        int, int: bytes read and written, None, None if not available
+    """
+
+    try:
+        with open("/proc/self/io", "r") as fid:
+            counters = dict(line.split(":") for line in fid)
+    except OSError:
+        return None, None
+    return int(counters["rchar"]), int(counters["wchar"])
+
+
+class TaskTimer(Callback):
+    """dask callback adding up the time spent in each type of task,
+    e.g. reading (open_dataset), reducing (mean_chunk) or writing (store)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.times = {}
+        self._starts = {}
+
+    def _pretask(self, key, dsk, state):
+        self._starts[key] = time.perf_counter()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        name = key_split(key)
+        elapsed = time.perf_counter() - self._starts.pop(key)
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+
+
+class Profile:
+    """report of the stages of pp jobs: wall time, bytes read and written,
+    dask tasks and peak memory of each stage
+
+    Args:
+        name (str, optional): name of the job. Defaults to "".
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.stages = []
+
+    def __repr__(self):
+        return f"Profile({self.name}, {len(self.stages)} stages)"
+
+    @contextmanager
+    def stage(self, name):
+        """record a stage around a block of code, the block can add its own
+        counters to the yielded record
+
+        Args:
+            name (str): name of the stage (e.g. open, compute)
+        """
+
+        record = dict(job=self.name, stage=name)
+        read0, written0 = io_counters()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["time"] = time.perf_counter() - start
+            read1, written1 = io_counters()
+            record["read_bytes"] = None if read0 is None else read1 - read0
+            record["written_bytes"] = None if read0 is None else written1 - written0
+            record["peak_rss"] = peak_rss()
+            self.stages.append(record)
+
+    def compute(self, *collections, name="compute"):
+        """dask.compute collections as a stage, with the number of tasks and
+        the time spent in each type of task
+
+        Args:
+            *collections: dask collections (e.g. delayed writes)
+            name (str, optional): name of the stage. Defaults to "compute".
+
+        Returns:
+            tuple: computed results
+        """
+
+        with self.stage(name) as record:
+            # collections built from the same dataset share tasks
+            graphs = [c.__dask_graph__() for c in collections]
+            record["tasks"] = len(set().union(*(g.keys() for g in graphs)))
+            with TaskTimer() as timer:
+                results = dask.compute(*collections)
+            record["task_time"] = timer.times
+        return results
+
+    def total(self):
+        """totals over all stages
+
+        Returns:
+            dict: time, bytes read and written, tasks and peak memory
+        """
+
+        def add(key):
+            values = [s.get(key) for s in self.stages if s.get(key) is not None]
+            return sum(values) if len(values) > 0 else None
+
+        return dict(
+            job=self.name,
+            stage="total",
+            time=add("time"),
+            read_bytes=add("read_bytes"),
+            written_bytes=add("written_bytes"),
+            tasks=add("tasks"),
+            peak_rss=max([s["peak_rss"] for s in self.stages], default=peak_rss()),
+        )
+
+    def to_json(self):
+        """stages and total as json lines
+
+        Returns:
+            str: one json object per line
+        """
+
+        return "\n".join(json.dumps(s) for s in self.stages + [self.total()])
+
+    def print_table(self):
+        """print a summary table of the stages"""
+
+        def mb(nbytes):
+            return "-" if nbytes is None else f"{nbytes / 1024**2:.1f}"
+
+        print(f"profile of {self.name}")
+        print(
+            f"{'stage':12s} {'time (s)':>10s} {'read (MB)':>10s} {'written (MB)':>13s}"
+            f" {'tasks':>8s} {'peak RSS (MB)':>14s}"
+        )
+        for s in self.stages + [self.total()]:
+            tasks = "-" if s.get("tasks") is None else str(s["tasks"])
+            print(
+                f"{s['stage']:12s} {s['time']:10.3f} {mb(s['read_bytes']):>10s}"
+                f" {mb(s['written_bytes']):>13s} {tasks:>8s}"
+                f" {mb(s['peak_rss']):>14s}"
+            )
+        # depth of the queues of pipelined stages, to tune the pipeline
+        for s in self.stages:
+            for name, q in s.get("queues", {}).items():
+                print(
+                    f"{s['stage']} queue {name}: {q['items']} items, depth"
+                    f" {q['mean_depth']:.1f} (max {q['max_depth']}/{q['maxsize']}),"
+                    f" waited {q['put_wait']:.3f}s to put, {q['get_wait']:.3f}s to get"
+                )
+        return None
+
+
+def start_profile(profile, name=""):
+    """profile to record a job into
+
+    Args:
+        profile (Profile or bool): existing profile, True to create one,
+                                   None or False not to profile
+        name (str, optional): name of a new profile. Defaults to "".
+
+    Returns:
+        Profile: profile, or None
+    """
+
+    if profile is None or profile is False:
+        return None
+    if profile is True:
+        return Profile(name)
+    return profile
+
+
+def profile_stage(profile, name):
+    """context recording a stage if profiling, doing nothing otherwise
+
+    Args:
+        profile (Profile): profile, or None
+        name (str): name of the stage
+    """
+
+    if profile is None:
+        return nullcontext({})
+    return profile.stage(name)
+
+
+def profile_compute(profile, *collections):
+    """dask.compute collections, recorded as a stage if profiling
+
+    Args:
+        profile (Profile): profile, or None
+        *collections: dask collections (e.g. delayed writes)
+
+    Returns:
+        tuple: computed results
+    """
+
+    if profile is None:
+        return dask.compute(*collections)
+    return profile.compute(*collections)
+
+
+def profile_index(profile, archives, indexdir=None):
+    """load or build the member indexes of archives as a stage when
+    profiling, so that scanning tar files is told apart from opening
+    the datasets
+
+    Args:
+        profile (Profile): profile, or None
+        archives (list of str): archives to index
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+    """
+
+    if profile is None:
+        return None
+    with profile.stage("index"):
+        for archive in archives:
+            # missing archives are reported when opening
+            if os.path.exists(archive):
+                tar_index(archive, indexdir=indexdir)
+    return None
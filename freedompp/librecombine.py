@@ -0,0 +1,211 @@
+# this module includes functions to recombine files split by distributed IO
+
+import dask.array
+import numpy as np
+import xarray as xr
+
+# encodings describing the storage of a piece, not of the global variable
+piece_encodings = ["chunksizes", "contiguous", "original_shape", "preferred_chunks"]
+
+
+def decomposition(ds):
+    """read the decomposition of a split file from the domain_decomposition
+    attribute of its axes: global start, global end, local start and local
+    end (1-based, inclusive)
+
+    Args:
+        ds (xarray.Dataset): one piece of a split file
+
+    Returns:
+        dict: decomposed dimension -> (gstart, gend, lstart, lend)
+    """
+
+    layout = {}
+    for dim in ds.dims:
+        if dim in ds.variables and "domain_decomposition" in ds[dim].attrs:
+            values = [int(v) for v in ds[dim].attrs["domain_decomposition"]]
+            if len(values) != 4:
+                raise ValueError(f"unexpected domain_decomposition of {dim}: {values}")
+            layout[dim] = tuple(values)
+    return layout
+
+
+def decomposition_grid(layouts):
+    """arrange the pieces of a split file on the grid of their blocks
+
+    Args:
+        layouts (list of dict): decomposition of each piece
+
+    Returns:
+        dict: dimension -> (global size, list of block starts, list of
+              block sizes), relative to the global start
+        dict: block index along each dimension -> index of the piece
+    """
+
+    dims = list(layouts[0])
+    blocks = {}
+    for dim in dims:
+        gstart, gend = layouts[0][dim][:2]
+        extents = {}
+        for layout in layouts:
+            if dim not in layout or layout[dim][:2] != (gstart, gend):
+                raise ValueError(f"pieces disagree on the decomposition of {dim}")
+            lstart, lend = layout[dim][2:]
+            if extents.setdefault(lstart, lend) != lend:
+                raise ValueError(f"overlapping blocks along {dim}")
+        starts = sorted(extents)
+        # blocks must tile the whole axis
+        bounds = [gstart] + [extents[s] + 1 for s in starts]
+        if starts != bounds[:-1] or bounds[-1] != gend + 1:
+            raise ValueError(f"blocks do not cover {dim}, missing a whole band?")
+        blocks[dim] = (
+            gend - gstart + 1,
+            [s - gstart for s in starts],
+            [extents[s] - s + 1 for s in starts],
+        )
+
+    grid = {}
+    for k, layout in enumerate(layouts):
+        position = tuple(
+            blocks[dim][1].index(layout[dim][2] - layout[dim][0]) for dim in dims
+        )
+        if position in grid:
+            raise ValueError("two pieces cover the same block")
+        grid[position] = k
+    return blocks, grid
+
+
+def fill_value(var):
+    """value of the parts of the domain without a piece (e.g. masked land):
+    missing values (NaN) when the pieces are decoded, as their filled values
+    are, and the raw _FillValue of undecoded or integer data
+
+    Args:
+        var (xarray.Variable): variable of a piece
+
+    Returns:
+        scalar: fill value
+    """
+
+    # undecoded pieces (mask_and_scale=False) keep _FillValue in attrs
+    if "_FillValue" in var.attrs:
+        return var.attrs["_FillValue"]
+    if np.issubdtype(var.dtype, np.floating):
+        return np.nan
+    return var.encoding.get("_FillValue", 0)
+
+
+def global_encoding(var):
+    """encoding of a piece variable valid for the global variable
+
+    Args:
+        var (xarray.Variable): variable of a piece
+
+    Returns:
+        dict: encoding without the storage layout of the piece
+    """
+
+    return {k: v for k, v in var.encoding.items() if k not in piece_encodings}
+
+
+def stitch_variable(name, pieces, blocks, grid):
+    """assemble a variable from its pieces, lazily with dask when the pieces
+    are lazy: each piece becomes a block of the global array
+
+    Args:
+        name (str): name of the variable
+        pieces (list of xarray.Dataset): pieces of the split file
+        blocks (dict): blocks along each decomposed dimension
+        grid (dict): piece at each block position
+
+    Returns:
+        xarray.Variable: global variable
+    """
+
+    dims = list(blocks)
+    first = pieces[0][name].variable
+    decomposed = [dim for dim in first.dims if dim in blocks]
+    others = [dim for dim in first.dims if dim not in blocks]
+    # one piece for each block the variable spans, the other dims are free
+    axes = [dims.index(dim) for dim in decomposed]
+    spans = {}
+    for position, k in grid.items():
+        spans.setdefault(tuple(position[a] for a in axes), k)
+
+    def nest(prefix):
+        level = len(prefix)
+        if level == len(decomposed):
+            if prefix in spans:
+                var = pieces[spans[prefix]][name].variable
+                return var.transpose(*others, *decomposed).data
+            # hole in the domain, e.g. a processor masked over land
+            shape = [first.sizes[dim] for dim in others]
+            shape += [blocks[dim][2][prefix[n]] for n, dim in enumerate(decomposed)]
+            return dask.array.full(shape, fill_value(first), dtype=first.dtype)
+        nblocks = len(blocks[decomposed[level]][1])
+        return [nest(prefix + (n,)) for n in range(nblocks)]
+
+    data = dask.array.block(nest(()))
+    var = xr.Variable(others + decomposed, data, first.attrs, global_encoding(first))
+    return var.transpose(*first.dims)
+
+
+def stitch_axis(dim, pieces, layouts, blocks):
+    """assemble the values of a decomposed axis
+
+    Args:
+        dim (str): name of the axis
+        pieces (list of xarray.Dataset): pieces of the split file
+        layouts (list of dict): decomposition of each piece
+        blocks (dict): blocks along each decomposed dimension
+
+    Returns:
+        xarray.Variable: global axis, without its domain_decomposition
+    """
+
+    first = pieces[0][dim].variable
+    values = np.zeros(blocks[dim][0], dtype=first.dtype)
+    for piece, layout in zip(pieces, layouts):
+        gstart, _, lstart, lend = layout[dim]
+        values[lstart - gstart : lend - gstart + 1] = piece[dim].values
+    attrs = {k: v for k, v in first.attrs.items() if k != "domain_decomposition"}
+    return xr.Variable((dim,), values, attrs, global_encoding(first))
+
+
+def recombine_pieces(pieces):
+    """recombine the pieces of a file split by distributed IO (e.g.
+    file.nc.0000 ... file.nc.0003) by placing each piece in the global
+    domain described by its domain_decomposition attributes
+
+    Args:
+        pieces (list of xarray.Dataset): pieces of the split file, opened
+                                         lazily (any order)
+
+    Returns:
+        xarray.Dataset: recombined dataset
+    """
+
+    layouts = [decomposition(piece) for piece in pieces]
+    if len(layouts[0]) == 0:
+        raise ValueError("pieces have no domain_decomposition attributes")
+    blocks, grid = decomposition_grid(layouts)
+
+    variables = {}
+    for name in pieces[0].variables:
+        if name in blocks:
+            variables[name] = stitch_axis(name, pieces, layouts, blocks)
+        elif any(dim in blocks for dim in pieces[0][name].dims):
+            variables[name] = stitch_variable(name, pieces, blocks, grid)
+        else:
+            # not decomposed, the same in all pieces
+            variables[name] = pieces[0][name].variable
+
+    coords = [name for name in pieces[0].coords if name in variables]
+    ds = xr.Dataset({v: variables[v] for v in variables if v not in coords})
+    ds = ds.assign_coords({v: variables[v] for v in coords})
+    attrs = dict(pieces[0].attrs)
+    attrs.pop("NumFilesInSet", None)
+    ds.attrs = attrs
+    ds.encoding = dict(pieces[0].encoding)
+    ds.encoding.pop("source", None)
+    return ds
@@ -0,0 +1,312 @@
+# this module includes a small dependency-aware scheduler for pp jobs
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from freedompp.libfreedompp import write_average, write_timeseries
+from freedompp.libstruct import archives_needed, infer_freq
+from freedompp.libstruct import ppsubdirname, tsfilename, avfilename
+from freedompp.libstruct import avsuffixes, format_suffix
+
+
+class Job:
+    """a pp job declaring the files it reads and the files it produces
+
+    Args:
+        name (str): unique name of the job
+        func (callable): function doing the work
+        inputs (list of str): files read by the job (history archives
+                              or pp products of other jobs)
+        outputs (list of str): files produced by the job
+        args (tuple, optional): positional arguments of func
+        kwargs (dict, optional): keyword arguments of func
+    """
+
+    def __init__(self, name, func, inputs, outputs, args=(), kwargs=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.args = args
+        self.kwargs = {} if kwargs is None else kwargs
+
+    def __repr__(self):
+        return f"Job({self.name})"
+
+    def is_up_to_date(self):
+        """outputs all exist and are newer than the existing inputs
+
+        Returns:
+            bool: True if the job does not need to run
+        """
+
+        if not all(os.path.exists(f) for f in self.outputs):
+            return False
+        mtimes = [os.path.getmtime(f) for f in self.inputs if os.path.exists(f)]
+        if len(mtimes) == 0:
+            return True
+        return min(os.path.getmtime(f) for f in self.outputs) >= max(mtimes)
+
+    def run(self):
+        """run the job"""
+        return self.func(*self.args, **self.kwargs)
+
+
+def job_dependencies(jobs):
+    """find which jobs produce the inputs of each job
+
+    Args:
+        jobs (list of Job): jobs to schedule
+
+    Returns:
+        dict: job name -> set of names of the jobs it depends on
+    """
+
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("job names must be unique")
+
+    producers = {}
+    for job in jobs:
+        for output in job.outputs:
+            output = os.path.abspath(output)
+            if output in producers:
+                raise ValueError(
+                    f"{output} is produced by {producers[output]} and {job.name}"
+                )
+            producers[output] = job.name
+
+    deps = {}
+    for job in jobs:
+        deps[job.name] = set()
+        for inp in job.inputs:
+            producer = producers.get(os.path.abspath(inp))
+            if producer is not None and producer != job.name:
+                deps[job.name].add(producer)
+
+    # check there is no cycle, by peeling off jobs without dependencies
+    remaining = {name: set(d) for name, d in deps.items()}
+    while remaining:
+        ready = [name for name, d in remaining.items() if len(d) == 0]
+        if len(ready) == 0:
+            raise ValueError(f"cyclic dependencies between {sorted(remaining)}")
+        for name in ready:
+            remaining.pop(name)
+        for d in remaining.values():
+            d.difference_update(ready)
+
+    return deps
+
+
+def run_jobs(jobs, max_concurrent=1, force=False):
+    """run jobs in dependency order, independent jobs running concurrently.
+    Jobs whose outputs are newer than their inputs are skipped.
+
+    Args:
+        jobs (list of Job): jobs to run
+        max_concurrent (int, optional): maximum number of jobs running at
+                                        the same time. Defaults to 1.
+        force (bool, optional): run jobs even if up to date.
+                                Defaults to False.
+
+    Returns:
+        dict: job name -> status (done/skipped/failed/blocked)
+    """
+
+    deps = job_dependencies(jobs)
+    byname = {job.name: job for job in jobs}
+    status = {}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as pool:
+        while len(status) < len(jobs):
+            for name, job in byname.items():
+                if name in status or name in running.values():
+                    continue
+                if any(status.get(d) in ["failed", "blocked"] for d in deps[name]):
+                    print(f"{name}: blocked by failed dependency")
+                    status[name] = "blocked"
+                elif all(d in status for d in deps[name]):
+                    # checked now, once the inputs produced by other jobs exist
+                    if not force and job.is_up_to_date():
+                        print(f"{name}: up to date, skipping")
+                        status[name] = "skipped"
+                    elif len(running) < max_concurrent:
+                        print(f"{name}: running")
+                        running[pool.submit(job.run)] = name
+
+            if len(running) == 0:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    print(f"{name}: failed with {future.exception()!r}")
+                    status[name] = "failed"
+                else:
+                    status[name] = "done"
+
+    return status
+
+
+def timeserie_files(fields, comesfrom, yearstart, yearend, ppdir="", **kwargs):
+    """pp files of the timeseries of fields, as written by write_timeseries
+
+    Args:
+        fields (list of str): names of the fields
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        **kwargs: options of write_timeseries (rename_to, freq, ftype,
+                  output_format)
+
+    Returns:
+        list of str: path of each file
+    """
+
+    ppname = kwargs.get("rename_to") or comesfrom
+    freq = kwargs.get("freq")
+    ftype = kwargs.get("ftype", "nc")
+    output_format = kwargs.get("output_format", "netcdf")
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="ts")
+    return [
+        f"{ppdir}/{ppsubdir}/"
+        + format_suffix(
+            tsfilename(field, ppname, yearstart, yearend, freq=freq, ftype=ftype),
+            output_format=output_format,
+        )
+        for field in fields
+    ]
+
+
+def average_files(comesfrom, yearstart, yearend, ppdir="", **kwargs):
+    """pp files of the averages of a segment, as written by write_average
+
+    Args:
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the segment
+        yearend (int): last year of the segment
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        **kwargs: options of write_average (avtype, rename_to, freq, ftype,
+                  output_format)
+
+    Returns:
+        list of str: path of each file
+    """
+
+    ppname = kwargs.get("rename_to") or comesfrom
+    avtype = kwargs.get("avtype", "ann")
+    ftype = kwargs.get("ftype", "nc")
+    freq = kwargs.get("freq")
+    freq = infer_freq(comesfrom) if freq is None else freq
+    output_format = kwargs.get("output_format", "netcdf")
+    ppsubdir = ppsubdirname(ppname, yearstart, yearend, freq=freq, pptype="av")
+    return [
+        f"{ppdir}/{ppsubdir}/"
+        + format_suffix(
+            avfilename(ppname, yearstart, yearend, suffix, ftype=ftype),
+            output_format=output_format,
+        )
+        for suffix in avsuffixes(avtype)
+    ]
+
+
+def timeserie_job(
+    fields, comesfrom, yearstart, yearend, historydir="", ppdir="", **kwargs
+):
+    """job writing timeseries from history with write_timeseries. With
+    incremental=True, the shorter timeseries it extends are inputs too, so
+    that the job runs after the jobs writing them.
+
+    Args:
+        fields (list of str): names of the fields to write
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        **kwargs: passed to write_timeseries
+
+    Returns:
+        Job: job with history archives (and extended ts files) as inputs and
+             ts files as outputs
+    """
+
+    if fields in ["ALL", ["ALL"]]:
+        raise ValueError("fields must be listed explicitly to declare outputs")
+
+    ppname = kwargs.get("rename_to") or comesfrom
+    inputs = archives_needed(yearstart, yearend, historydir=historydir)
+    if kwargs.get("incremental", False):
+        # any timeserie starting at yearstart can be extended
+        for lastyear in range(yearstart, yearend):
+            inputs += timeserie_files(
+                fields, comesfrom, yearstart, lastyear, ppdir=ppdir, **kwargs
+            )
+    return Job(
+        f"ts:{ppname}:{yearstart}-{yearend}:{','.join(fields)}",
+        write_timeseries,
+        inputs,
+        timeserie_files(fields, comesfrom, yearstart, yearend, ppdir=ppdir, **kwargs),
+        args=(fields, comesfrom, yearstart, yearend),
+        kwargs=dict(historydir=historydir, ppdir=ppdir, **kwargs),
+    )
+
+
+def average_job(
+    comesfrom, yearstart, yearend, historydir="", ppdir="", segment=None, **kwargs
+):
+    """job writing averages with write_average, from history or, with
+    segment, from the averages of shorter segments written by other jobs
+
+    Args:
+        comesfrom (str): name of netcdf file containing field without date
+                         prefix and filetype suffix (e.g. ocean_annual_z)
+        yearstart (int): first year of the time serie
+        yearend (int): last year of the time serie
+        historydir (str, optional): path to the directory containing "history"
+                                    tar files. Defaults to "".
+        ppdir (str, optional): path for pp (output) files. Defaults to "".
+        segment (int, optional): build the average from the averages of the
+                                 segment-year chunks of yearstart-yearend
+                                 (e.g. 5), declared as inputs, reading the
+                                 history only for the years left over.
+                                 Defaults to None (from history).
+        **kwargs: passed to write_average
+
+    Returns:
+        Job: job with history archives (or av files) as inputs and av files
+             as outputs
+    """
+
+    ppname = kwargs.get("rename_to") or comesfrom
+    avtype = kwargs.get("avtype", "ann")
+    avtypes = [avtype] if isinstance(avtype, str) else avtype
+    if segment is None:
+        inputs = archives_needed(yearstart, yearend, historydir=historydir)
+    elif segment >= yearend - yearstart + 1:
+        raise ValueError("segment must be shorter than the averaged years")
+    else:
+        kwargs["hierarchical"] = True
+        inputs = []
+        first = yearstart
+        while first + segment - 1 <= yearend:
+            inputs += average_files(
+                comesfrom, first, first + segment - 1, ppdir=ppdir, **kwargs
+            )
+            first += segment
+        if first <= yearend:
+            inputs += archives_needed(first, yearend, historydir=historydir)
+    return Job(
+        f"{'+'.join(avtypes)}:{ppname}:{yearstart}-{yearend}",
+        write_average,
+        inputs,
+        average_files(comesfrom, yearstart, yearend, ppdir=ppdir, **kwargs),
+        args=(comesfrom, yearstart, yearend),
+        kwargs=dict(historydir=historydir, ppdir=ppdir, **kwargs),
+    )
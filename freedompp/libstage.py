@@ -0,0 +1,202 @@
+# this module includes functions to stage archives from slow storage ahead of use
+
+import os
+import shutil
+import threading
+
+from freedompp.libtar import index_filename
+
+# default disk space used by staged archives
+stage_max_bytes = 50 * 1024**3
+
+
+class ArchiveStager:
+    """copy archives from slow storage (tape-backed or remote mounts) into a
+    local staging directory in the background, a few archives ahead of the
+    one being processed and within a disk budget. Without stagedir,
+    archives are used in place.
+
+    Args:
+        archives (list of str): archives in the order they are processed
+        stagedir (str, optional): local staging directory. Defaults to None.
+        prefetch (int, optional): number of archives staged ahead of the one
+                                  being processed. Defaults to 2.
+        max_bytes (int, optional): disk space used by staged archives.
+                                   Defaults to stage_max_bytes.
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+    """
+
+    def __init__(
+        self, archives, stagedir=None, prefetch=2, max_bytes=None, indexdir=None
+    ):
+        self.archives = list(archives)
+        self.stagedir = stagedir
+        self.prefetch = prefetch
+        self.max_bytes = stage_max_bytes if max_bytes is None else max_bytes
+        self.indexdir = indexdir
+        self.staged = {}
+        self.errors = {}
+        self.used_bytes = 0
+        self._sizes = {}
+        self._held = set()
+        self._stop = False
+        self._condition = threading.Condition()
+        self._thread = None
+        if stagedir is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def __repr__(self):
+        return f"ArchiveStager({self.stagedir}, {len(self.archives)} archives)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _wait_for_room(self, nbytes):
+        # with the condition held: wait until the archive fits in the
+        # read-ahead and the budget, a single archive is always allowed
+        def room():
+            if self._stop:
+                return True
+            if len(self._held) > self.prefetch:
+                return False
+            return len(self._held) == 0 or self.used_bytes + nbytes <= self.max_bytes
+
+        self._condition.wait_for(room)
+        return not self._stop
+
+    def _run(self):
+        for archive in self.archives:
+            if archive in self.staged or archive in self.errors:
+                # the same archive listed twice
+                continue
+            if not os.path.exists(archive):
+                # reported by whoever opens it, as without staging
+                with self._condition:
+                    self.staged[archive] = archive
+                    self._condition.notify_all()
+                continue
+            nbytes = os.path.getsize(archive)
+            with self._condition:
+                if not self._wait_for_room(nbytes):
+                    return
+                self._held.add(archive)
+                self._sizes[archive] = nbytes
+                self.used_bytes += nbytes
+            try:
+                staged = stage_archive(archive, self.stagedir, indexdir=self.indexdir)
+            except OSError as error:
+                with self._condition:
+                    self._held.discard(archive)
+                    self.used_bytes -= nbytes
+                    self.errors[archive] = error
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                self.staged[archive] = staged
+                self._condition.notify_all()
+
+    def get(self, archive):
+        """wait for an archive to be staged
+
+        Args:
+            archive (str): path to the archive
+
+        Returns:
+            str: path to the staged copy, or archive without staging
+        """
+
+        if self.stagedir is None:
+            return archive
+        with self._condition:
+            self._condition.wait_for(
+                lambda: archive in self.staged or archive in self.errors
+            )
+            if archive in self.errors:
+                raise self.errors[archive]
+            return self.staged[archive]
+
+    def release(self, archive):
+        """remove the staged copy of an archive once it is processed, making
+        room for the next ones
+
+        Args:
+            archive (str): path to the archive
+        """
+
+        if self.stagedir is None:
+            return None
+        with self._condition:
+            if archive not in self._held or archive not in self.staged:
+                return None
+            remove_staged(self.staged[archive], indexdir=self.indexdir)
+            self._held.discard(archive)
+            self.used_bytes -= self._sizes[archive]
+            self._condition.notify_all()
+        return None
+
+    def close(self):
+        """stop staging and remove the staged copies"""
+
+        if self.stagedir is None:
+            return None
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        self._thread.join()
+        for archive in list(self._held):
+            self.release(archive)
+        return None
+
+
+def stage_archive(archive, stagedir, indexdir=None):
+    """copy an archive and its member index into a staging directory. The
+    copy keeps the size and modification time of the archive, so that
+    its index stays valid.
+
+    Args:
+        archive (str): path to the archive
+        stagedir (str): staging directory
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+
+    Returns:
+        str: path to the staged copy
+    """
+
+    os.makedirs(stagedir, exist_ok=True)
+    staged = os.path.join(stagedir, os.path.basename(archive))
+    print(f"staging {archive} into {stagedir}")
+    # copied under a temporary name, a partial copy must never be read
+    tmpfile = f"{staged}.{os.getpid()}.tmp"
+    try:
+        shutil.copy2(archive, tmpfile)
+        os.replace(tmpfile, staged)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    idxfile = index_filename(archive, indexdir=indexdir)
+    if os.path.exists(idxfile):
+        shutil.copy2(idxfile, index_filename(staged, indexdir=indexdir))
+    return staged
+
+
+def remove_staged(staged, indexdir=None):
+    """remove a staged archive and its index
+
+    Args:
+        staged (str): path to the staged copy
+        indexdir (str, optional): where archive indexes are stored.
+                                  Defaults to None, i.e. next to archives.
+    """
+
+    for filename in [staged, index_filename(staged, indexdir=indexdir)]:
+        if os.path.exists(filename):
+            os.remove(filename)
+    return None
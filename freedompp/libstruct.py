@@ -1,5 +1,6 @@
 # this module includes functions relative to pp structure and names
 
+import os
 import warnings
 
 allowed_1m_tags = ["monthly", "month", "1m"]
@@ -56,7 +57,8 @@ def avfilename(comesfrom, yearstart, yearend, suffix, ftype="nc"):
         comesfrom (str): parent dataset
         yearstart (int): first bound of time segment
         yearend (int): second bound of time segment
-        suffix (str): "ann" for annual, 01-12 for months
+        suffix (str): "ann" for annual, 01-12 for months, DJF/MAM/JJA/SON
+                      for seasons
         ftype (str, optional): file type (nc or tile[1-6].nc).
                                Defaults to "nc".
 
@@ -76,6 +78,31 @@ def avfilename(comesfrom, yearstart, yearend, suffix, ftype="nc"):
     return filename
 
 
+def avsuffixes(avtype):
+    """list the suffixes of the files of an average
+
+    Args:
+        avtype (str or list): annual, monthly or seasonal average
+                              (ann/mm/seas), or several of them
+
+    Returns:
+        list of str: "ann", 01-12 for months, DJF/MAM/JJA/SON for seasons
+    """
+
+    avtypes = [avtype] if isinstance(avtype, str) else avtype
+    suffixes = []
+    for av in avtypes:
+        if av == "ann":
+            suffixes += ["ann"]
+        elif av == "mm":
+            suffixes += [f"{m:02d}" for m in range(1, 12 + 1)]
+        elif av == "seas":
+            suffixes += ["DJF", "MAM", "JJA", "SON"]
+        else:
+            raise ValueError(f"unknown average type {av}, available: ann / mm / seas")
+    return suffixes
+
+
 def tsfilename(field, comesfrom, yearstart, yearend, freq=None, ftype="nc"):
     """construct the name of a timeserie pp file
 
@@ -124,6 +151,126 @@ def tsfilename(field, comesfrom, yearstart, yearend, freq=None, ftype="nc"):
     return filename
 
 
+def format_suffix(filename, output_format="netcdf"):
+    """give the name of a pp file the suffix of the output format,
+    e.g. ocean_month.0001-0005.ann.nc -> ocean_month.0001-0005.ann.zarr
+
+    Args:
+        filename (str): name of the pp file with a netcdf suffix
+        output_format (str, optional): netcdf or zarr. Defaults to "netcdf".
+
+    Returns:
+        str: name of the pp file (or store)
+    """
+
+    if output_format == "netcdf":
+        return filename
+    elif output_format == "zarr":
+        if filename.endswith(".nc"):
+            filename = filename[: -len(".nc")]
+        return f"{filename}.zarr"
+    else:
+        raise ValueError(
+            f"unknown output format {output_format}, available: netcdf / zarr"
+        )
+
+
+def find_timeserie(
+    ppdir,
+    field,
+    comesfrom,
+    yearstart,
+    yearend,
+    freq=None,
+    ftype="nc",
+    output_format="netcdf",
+):
+    """find the longest existing timeserie starting at yearstart and ending
+    before yearend, that can be extended up to yearend
+
+    Args:
+        ppdir (str): path to pp directory
+        field (str): name of the physical field
+        comesfrom (str): parent dataset
+        yearstart (int): first bound of time segment
+        yearend (int): second bound of time segment
+        freq (str, optional): override frequency for dataset.
+                              Defaults to None.
+        ftype (str, optional): file type (nc or tile[1-6].nc).
+                               Defaults to "nc".
+        output_format (str, optional): netcdf or zarr. Defaults to "netcdf".
+
+    Returns:
+        str, int: path to the timeserie and its last year, or None, None
+    """
+
+    check_bounds(yearstart, yearend)
+    for lastyear in range(yearend - 1, yearstart - 1, -1):
+        ppsubdir = ppsubdirname(comesfrom, yearstart, lastyear, freq=freq, pptype="ts")
+        fname = tsfilename(
+            field, comesfrom, yearstart, lastyear, freq=freq, ftype=ftype
+        )
+        fname = format_suffix(fname, output_format=output_format)
+        if os.path.exists(f"{ppdir}/{ppsubdir}/{fname}"):
+            return f"{ppdir}/{ppsubdir}/{fname}", lastyear
+
+    return None, None
+
+
+def find_averages(
+    ppdir,
+    comesfrom,
+    yearstart,
+    yearend,
+    avtype="ann",
+    freq=None,
+    ftype="nc",
+    output_format="netcdf",
+):
+    """find existing averages of shorter segments within a segment, longest
+    first and without overlap, from which its average can be built
+
+    Args:
+        ppdir (str): path to pp directory
+        comesfrom (str): parent dataset
+        yearstart (int): first bound of time segment
+        yearend (int): second bound of time segment
+        avtype (str, optional): annual, monthly or seasonal average
+                                (ann/mm/seas). Defaults to "ann".
+        freq (str, optional): override frequency for dataset.
+                              Defaults to None.
+        ftype (str, optional): file type (nc or tile[1-6].nc).
+                               Defaults to "nc".
+        output_format (str, optional): netcdf or zarr. Defaults to "netcdf".
+
+    Returns:
+        list of tuple: first year, last year and paths to the files (one per
+                       suffix) of each average, in chronological order
+    """
+
+    check_bounds(yearstart, yearend)
+    suffixes = avsuffixes(avtype)
+    found = []
+    covered = set()
+    for length in range(yearend - yearstart, 0, -1):
+        for first in range(yearstart, yearend - length + 2):
+            last = first + length - 1
+            if not covered.isdisjoint(range(first, last + 1)):
+                continue
+            ppsubdir = ppsubdirname(comesfrom, first, last, freq=freq, pptype="av")
+            paths = []
+            for suffix in suffixes:
+                fname = avfilename(comesfrom, first, last, suffix, ftype=ftype)
+                fname = format_suffix(fname, output_format=output_format)
+                paths.append(f"{ppdir}/{ppsubdir}/{fname}")
+            # an average is only usable when all its files exist
+            if all(os.path.exists(path) for path in paths):
+                found.append((first, last, paths))
+                covered.update(range(first, last + 1))
+
+    return sorted(found)
+
+
 def infer_freq(comesfrom):
     """ infer dataset frequency from its name, testing from low to high
     frequency from list of tags. The order of tests matter because of
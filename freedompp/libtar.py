@@ -0,0 +1,309 @@
+# this module includes functions to index and access members of tar archives
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import tarfile
+
+# in-process cache of the indexes already loaded, keyed by archive path
+_tar_indexes = {}
+
+
+def index_filename(archive, indexdir=None):
+    """construct the name of the index file of an archive
+
+    Args:
+        archive (str): path to the tar archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        str: path to the index file
+    """
+
+    if indexdir is None:
+        return f"{archive}.idx"
+    # archives of different experiments share the same names
+    # (e.g. 00010101.nc.tar) so the full path is hashed into the name
+    tag = hashlib.sha1(os.path.abspath(archive).encode()).hexdigest()[:12]
+    return os.path.join(indexdir, f"{os.path.basename(archive)}.{tag}.idx")
+
+
+def archive_stamp(archive):
+    """size and modification time of archive, used to detect stale indexes
+
+    Args:
+        archive (str): path to the tar archive
+
+    Returns:
+        list of int: size and modification time (ns) of the archive
+    """
+
+    stat = os.stat(archive)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def build_tar_index(archive):
+    """scan the headers of an uncompressed tar archive once and record
+    the location of each regular member
+
+    Args:
+        archive (str): path to the tar archive
+
+    Returns:
+        dict: member name -> (offset, size) in bytes
+    """
+
+    members = {}
+    with tarfile.open(name=archive, mode="r:") as tar:
+        for tarinfo in tar:
+            if tarinfo.isreg() and not tarinfo.issparse():
+                members[tarinfo.name] = (tarinfo.offset_data, tarinfo.size)
+    return members
+
+
+def read_tar_index(archive, indexdir=None):
+    """read the stored index of an archive if it is still valid
+
+    Args:
+        archive (str): path to the tar archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        dict: member name -> (offset, size), or None if no valid index
+    """
+
+    idxfile = index_filename(archive, indexdir=indexdir)
+    if not os.path.exists(idxfile):
+        return None
+    try:
+        with open(idxfile, "r") as fid:
+            content = json.load(fid)
+    except (OSError, ValueError):
+        return None
+    if content.get("stamp") != archive_stamp(archive):
+        return None
+    return {k: tuple(v) for k, v in content["members"].items()}
+
+
+def write_tar_index(archive, members, indexdir=None):
+    """store the index of an archive, silently giving up if the location
+    is not writable (e.g. read-only archive filesystem)
+
+    Args:
+        archive (str): path to the tar archive
+        members (dict): member name -> (offset, size)
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        bool: True if the index was written
+    """
+
+    idxfile = index_filename(archive, indexdir=indexdir)
+    content = dict(
+        archive=os.path.abspath(archive),
+        stamp=archive_stamp(archive),
+        members={k: list(v) for k, v in members.items()},
+    )
+    tmpfile = f"{idxfile}.{os.getpid()}.tmp"
+    try:
+        if indexdir is not None:
+            os.makedirs(indexdir, exist_ok=True)
+        with open(tmpfile, "w") as fid:
+            json.dump(content, fid)
+        # atomic so that concurrent processes never read a partial index
+        os.replace(tmpfile, idxfile)
+    except OSError:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        return False
+    return True
+
+
+def tar_index(archive, indexdir=None, persist=True):
+    """get the member index of an archive, from memory, from the stored
+    index or by scanning the archive (in that order)
+
+    Args:
+        archive (str): path to the tar archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+        persist (bool, optional): store a newly built index on disk.
+                                  Defaults to True.
+
+    Returns:
+        dict: member name -> (offset, size)
+    """
+
+    stamp = archive_stamp(archive)
+    if archive in _tar_indexes:
+        cached_stamp, members = _tar_indexes[archive]
+        if cached_stamp == stamp:
+            return members
+
+    members = read_tar_index(archive, indexdir=indexdir)
+    if members is None:
+        members = build_tar_index(archive)
+        if persist:
+            write_tar_index(archive, members, indexdir=indexdir)
+
+    _tar_indexes[archive] = (stamp, members)
+    return members
+
+
+def member_location(archive, member, indexdir=None):
+    """find where a member is stored in an archive
+
+    Args:
+        archive (str): path to the tar archive
+        member (str): name of the member in the archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        int, int: offset and size in bytes of the member data
+    """
+
+    members = tar_index(archive, indexdir=indexdir)
+    name = member.rstrip("/")
+    if name not in members:
+        raise KeyError(f"filename {member} not found in {archive}")
+    return members[name]
+
+
+def missing_members(archive, members, indexdir=None):
+    """find which members are not in an archive, using its index
+
+    Args:
+        archive (str): path to the tar archive
+        members (list of str): names of the members
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        list of str: members not found, all of them if the archive is missing
+    """
+
+    if not os.path.exists(archive):
+        return list(members)
+    index = tar_index(archive, indexdir=indexdir)
+    return [member for member in members if member.rstrip("/") not in index]
+
+
+def match_members(archive, pattern, indexdir=None):
+    """find the members of an archive matching a pattern, e.g. the tiles
+    ./00010101.atmos_month.tile*.nc
+
+    Args:
+        archive (str): path to the tar archive
+        pattern (str): name of the members, * matching any string
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        dict: member name -> string matched by *
+    """
+
+    regex = re.compile(re.escape(pattern.rstrip("/")).replace(r"\*", "(.+)") + "$")
+    matches = {}
+    for name in tar_index(archive, indexdir=indexdir):
+        match = regex.match(name)
+        if match is not None:
+            matches[name] = match.group(1)
+    return matches
+
+
+def open_member(archive, member, indexdir=None):
+    """open a member of an archive as a file-like object, seeking directly
+    to its data instead of scanning the archive headers
+
+    Args:
+        archive (str): path to the tar archive
+        member (str): name of the member in the archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        tarfile.ExFileObject: file-like object
+    """
+
+    offset, size = member_location(archive, member, indexdir=indexdir)
+    tarinfo = tarfile.TarInfo(member)
+    tarinfo.offset_data = offset
+    tarinfo.size = size
+    # opening only reads the first header, the member is then read in place
+    tar = tarfile.open(name=archive, mode="r:")
+    return tar.extractfile(tarinfo)
+
+
+def extract_member(archive, member, path, indexdir=None):
+    """copy a member of an archive to disk
+
+    Args:
+        archive (str): path to the tar archive
+        member (str): name of the member in the archive
+        path (str): directory where to extract the member
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+
+    Returns:
+        str: path to the extracted file
+    """
+
+    offset, size = member_location(archive, member, indexdir=indexdir)
+    outfile = os.path.normpath(os.path.join(path, member))
+    os.makedirs(os.path.dirname(outfile), exist_ok=True)
+    with open(archive, "rb") as src, open(outfile, "wb") as dst:
+        src.seek(offset)
+        remaining = size
+        while remaining > 0:
+            buf = src.read(min(remaining, 16 * 1024 * 1024))
+            if not buf:
+                raise IOError(f"{archive} is truncated, cannot extract {member}")
+            dst.write(buf)
+            remaining -= len(buf)
+    return outfile
+
+
+class MappedMember:
+    """read-only memory map of the byte range of an archive member
+
+    The buffer is shared through the page cache with every other process
+    mapping the same archive and nothing is copied or extracted.
+
+    Args:
+        archive (str): path to the tar archive
+        member (str): name of the member in the archive
+        indexdir (str, optional): directory where indexes are stored.
+                                  Defaults to None, i.e. next to the archive.
+    """
+
+    def __init__(self, archive, member, indexdir=None):
+        offset, size = member_location(archive, member, indexdir=indexdir)
+        # mappings must start on a multiple of the allocation granularity
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with open(archive, "rb") as fid:
+            self._mmap = mmap.mmap(
+                fid.fileno(),
+                offset - start + size,
+                offset=start,
+                access=mmap.ACCESS_READ,
+            )
+        self.name = member
+        self.buffer = memoryview(self._mmap)[offset - start : offset - start + size]
+        # netCDF4.Dataset reading from the buffer, closed before the map
+        self.reader = None
+
+    def close(self):
+        """close the reader then release the buffer and the map"""
+        if self.reader is not None:
+            # the reader may already be closed by xarray
+            if self.reader.isopen():
+                self.reader.close()
+            self.reader = None
+        self.buffer.release()
+        self._mmap.close()
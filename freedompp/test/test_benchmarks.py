@@ -0,0 +1,42 @@
+import os
+import tarfile
+
+import pytest
+
+
+@pytest.mark.parametrize("FREQ", ["1m", "1d", "6hr", "3hr"])
+def test_history_year(FREQ):
+    from freedompp.benchmarks.synthetic import history_year, records_per_year
+
+    ds = history_year(2, freq=FREQ, nz=3, ny=4, nx=5)
+    assert ds["thetao"].shape == (records_per_year[FREQ], 3, 4, 5)
+    assert float(ds["average_DT"].sum()) == pytest.approx(365)
+    assert float(ds["average_T1"][0]) == 365
+    assert "tos" in history_year(freq=FREQ, ny=4, nx=5)
+
+
+def test_write_history(tmpdir):
+    from freedompp.benchmarks.synthetic import write_history
+
+    archives = write_history(tmpdir, "ocean_month", 1, 2, ny=8, nx=4, nsplit=4)
+    assert archives == [f"{tmpdir}/00010101.nc.tar", f"{tmpdir}/00020101.nc.tar"]
+    with tarfile.open(archives[0]) as tar:
+        assert tar.getnames() == [
+            f"./00010101.ocean_month.nc.{k:04d}" for k in range(4)
+        ]
+
+    write_history(f"{tmpdir}/tiled", "atmos_month", 1, 1, ny=8, nx=4, ntiles=6)
+    with tarfile.open(f"{tmpdir}/tiled/00010101.nc.tar") as tar:
+        assert len(tar.getnames()) == 6
+    assert sorted(os.listdir(f"{tmpdir}/tiled")) == ["00010101.nc.tar"]
+
+
+def test_run_case(tmpdir):
+    from freedompp.benchmarks.pipeline import run_case
+    from freedompp.benchmarks.synthetic import write_history
+
+    write_history(f"{tmpdir}/history", "ocean_month_z", 1, 2, nz=2, ny=8, nx=4)
+    result = run_case("ann-1m-3d", f"{tmpdir}/history", f"{tmpdir}/work")
+    assert result["read_bytes"] > 0
+    assert result["throughput"] > 0
+    assert result["peak_rss"] > 0
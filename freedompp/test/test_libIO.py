@@ -77,8 +77,294 @@ def test_open_files_from_archives(tmpdir, INMEM):
             )
 
 
+def make_archives(tmpdir, datasets):
+    """write each dataset in its own yearly archive"""
+    archives = []
+    for k, ds in enumerate(datasets):
+        ncfile = f"{tmpdir}/dummy.{k:04d}0101.nc"
+        ds.to_netcdf(ncfile)
+        archives.append(f"{tmpdir}/{k:04d}0101.nc.tar")
+        with tarfile.open(archives[-1], "w:") as tar_handle:
+            tar_handle.add(ncfile, arcname=f"./dummy.{k:04d}0101.nc")
+    return archives
+
+
+@pytest.mark.parametrize("MMAP", [True, False])
+def test_open_files_from_archives_workers(tmpdir, MMAP):
+    from freedompp.libIO import open_files_from_archives, close_all_filelikes
+
+    datasets = [testds + 10 * k for k in range(6)]
+    archives = make_archives(tmpdir, datasets)
+    files = [f"./dummy.{k:04d}0101.nc" for k in range(6)]
+
+    ds, fids = open_files_from_archives(files, archives, use_mmap=MMAP, max_workers=3)
+    assert np.allclose(ds["x"].values, np.arange(60))
+    ds.close()
+    close_all_filelikes(fids)
+
+
+def test_open_files_from_archives_mmap(tmpdir):
+    from freedompp.libIO import open_files_from_archives, close_all_filelikes
+
+    archives = make_archives(tmpdir, [testds, testds2])
+
+    ds, fids = open_files_from_archives(
+        ["./dummy.00000101.nc", "./dummy.00010101.nc"], archives, use_mmap=True,
+    )
+    assert isinstance(ds, xr.core.dataset.Dataset)
+    assert np.allclose(ds["x"].values, np.arange(20))
+    ds.close()
+    close_all_filelikes(fids)
+
+    with pytest.raises(ValueError):
+        open_files_from_archives(
+            ["./dummy.00000101.nc"], archives[:1], use_mmap=True, use_index=False,
+        )
+
+
+def test_open_files_from_archives_missing(tmpdir):
+    from freedompp.libIO import open_files_from_archives
+
+    archives = make_archives(tmpdir, [testds, testds2])
+
+    # the missing file is reported before any file is opened
+    with pytest.raises(FileNotFoundError, match="dummy.00010101.nc.0001"):
+        open_files_from_archives(
+            ["./dummy.00000101.nc", "./dummy.00010101.nc"],
+            archives,
+            recombine=True,
+            nsplit=2,
+            chunks={},
+        )
+
+
+@pytest.mark.parametrize("METHOD", ["zlib", "zstd"])
+def test_write_ncfile_compression(tmpdir, METHOD):
+    import netCDF4
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libIO import write_ncfile
+
+    ds = ocean_month_z(nz=3, ny=10, nx=20)
+    write_ncfile(ds, f"{tmpdir}/raw.nc")
+    write_ncfile(
+        ds,
+        f"{tmpdir}/compressed.nc",
+        compression={"method": METHOD, "complevel": 5, "bitround": 8},
+        encoding={"so": {"complevel": 1}},
+    )
+    assert os.path.getsize(f"{tmpdir}/compressed.nc") < os.path.getsize(
+        f"{tmpdir}/raw.nc"
+    )
+
+    with netCDF4.Dataset(f"{tmpdir}/compressed.nc") as nc:
+        assert nc["thetao"].filters()[METHOD]
+        assert nc["thetao"].filters()["complevel"] == 5
+        assert nc["so"].filters()["complevel"] == 1
+        assert nc["thetao"].quantization() == (8, "BitRound")
+        # time variables are never quantized
+        assert nc["average_T1"].quantization() is None
+
+    out = xr.open_dataset(f"{tmpdir}/compressed.nc", decode_times=False)
+    assert np.allclose(out["thetao"], ds["thetao"], rtol=1e-2, equal_nan=True)
+    assert np.array_equal(out["time_bnds"], ds["time_bnds"])
+
+    with pytest.raises(ValueError):
+        write_ncfile(ds, f"{tmpdir}/bad.nc", compression={"level": 4})
+
+
+def test_parse_encoding(tmpdir):
+    import json
+
+    import netCDF4
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libIO import parse_encoding, write_ncfile
+
+    options = ["so:method=zstd", "so:complevel=6", "thetao:bitround=10"]
+    options += ["thetao:method=zlib", "thetao:shuffle=false"]
+    encoding = parse_encoding(options)
+    assert encoding == {
+        "so": {"compression": "zstd", "complevel": 6},
+        "thetao": {
+            "significant_digits": 10,
+            "quantize_mode": "BitRound",
+            "compression": "zlib",
+            "shuffle": False,
+        },
+    }
+    # the same encoding from a file
+    with open(f"{tmpdir}/encoding.json", "w") as fid:
+        json.dump({"so": {"method": "zstd", "complevel": 6}}, fid)
+    assert parse_encoding([f"{tmpdir}/encoding.json"])["so"] == encoding["so"]
+
+    ds = ocean_month_z(nz=3, ny=10, nx=20)
+    compression = {"complevel": 1}
+    write_ncfile(ds, f"{tmpdir}/out.nc", compression=compression, encoding=encoding)
+    with netCDF4.Dataset(f"{tmpdir}/out.nc") as nc:
+        assert nc["so"].filters()["zstd"]
+        assert nc["so"].filters()["complevel"] == 6
+        assert nc["thetao"].filters()["zlib"]
+        assert not nc["thetao"].filters()["shuffle"]
+        assert nc["thetao"].quantization() == (10, "BitRound")
+        # the other variables use the per-run options
+        assert nc["average_DT"].filters()["complevel"] == 1
+
+    with pytest.raises(ValueError):
+        parse_encoding(["so=6"])
+
+
+def test_write_ncfile_chunks(tmpdir):
+    import netCDF4
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libIO import write_ncfile
+
+    ds = ocean_month_z(nz=3, ny=10, nx=20)
+    # missing dimensions are planned instead of set to their full length
+    write_ncfile(ds, f"{tmpdir}/partial.nc", chunks={"time": 1})
+    write_ncfile(ds, f"{tmpdir}/auto.nc", chunks="auto", pptype="ann")
+    with netCDF4.Dataset(f"{tmpdir}/partial.nc") as nc:
+        assert nc["thetao"].chunking() == [1, 3, 10, 20]
+        assert nc["time_bnds"].chunking() == [1, 2]
+    with netCDF4.Dataset(f"{tmpdir}/auto.nc") as nc:
+        assert nc["thetao"].chunking() == [1, 3, 10, 20]
+
+
+def test_write_ncfile_concurrent(tmpdir, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libIO import append_ncfile, netcdf_write_lock, write_ncfile
+
+    # count the netcdf files being written at the same time
+    active, overlaps = [], []
+    count = threading.Lock()
+    to_netcdf = xr.Dataset.to_netcdf
+
+    def track(write, *args, **kwargs):
+        assert netcdf_write_lock.locked()
+        with count:
+            active.append(1)
+            overlaps.append(len(active))
+        # leave time to the other writers to start
+        time.sleep(0.01)
+        try:
+            return write(*args, **kwargs)
+        finally:
+            with count:
+                active.pop()
+
+    # data appended are masked while the file is open
+    appends = []
+    masked_invalid = np.ma.masked_invalid
+
+    def mask(data):
+        assert netcdf_write_lock.locked()
+        appends.append(data)
+        return masked_invalid(data)
+
+    monkeypatch.setattr(
+        xr.Dataset, "to_netcdf", lambda *a, **k: track(to_netcdf, *a, **k)
+    )
+    monkeypatch.setattr(np.ma, "masked_invalid", mask)
+
+    years = [ocean_month_z(year=y, nz=2, ny=6, nx=8) for y in [1, 2]]
+    files = [f"{tmpdir}/out{k}.nc" for k in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda f: write_ncfile(years[0], f), files))
+        list(pool.map(lambda f: append_ncfile(years[1], f), files))
+    # files are written one at a time
+    assert max(overlaps) == 1
+    assert len(appends) > 0
+    monkeypatch.undo()
+
+    for fname in files:
+        out = xr.open_dataset(fname, decode_times=False)
+        assert len(out["time"]) == 24
+        assert np.allclose(out["so"][12:], years[1]["so"], equal_nan=True)
+        out.close()
+
+
+def test_write_zarr(tmpdir):
+    pytest.importorskip("zarr")
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libIO import append_zarr, write_zarr
+
+    ds = ocean_month_z(nz=3, ny=10, nx=20)
+    store = f"{tmpdir}/out.zarr"
+    write_zarr(ds, store, chunks={"time": 6}, compression={"method": "zstd"})
+    out = xr.open_zarr(store, decode_times=False)
+    assert out["thetao"].encoding["chunks"] == (6, 3, 10, 20)
+    assert np.allclose(out["thetao"], ds["thetao"], equal_nan=True)
+
+    nextyear = ocean_month_z(year=2, nz=3, ny=10, nx=20)
+    append_zarr(nextyear, store)
+    out = xr.open_zarr(store, decode_times=False)
+    assert len(out["time"]) == 24
+    assert np.allclose(out["so"][12:], nextyear["so"], equal_nan=True)
+
+    with pytest.raises(ValueError):
+        write_zarr(ds, f"{tmpdir}/lossy.zarr", compression={"bitround": 8})
+
+
 def test_chkdir(tmpdir):
     from freedompp.libIO import chkdir
 
     chkdir(tmpdir, "test/test/test")
     assert os.path.exists(os.path.join(tmpdir, "test/test/test"))
+
+
+def test_open_files_from_archives_recombine(tmpdir, monkeypatch):
+    from freedompp.benchmarks.synthetic import history_year, write_history
+    from freedompp.libIO import open_files_from_archives
+
+    archives = write_history(f"{tmpdir}/history", "ocean", 1, 2, ny=6, nx=4, nsplit=3)
+    files = ["./00010101.ocean.nc", "./00020101.ocean.nc"]
+    expected = xr.concat(
+        [history_year(1, ny=6, nx=4), history_year(2, ny=6, nx=4)], "time"
+    )
+
+    ds, _ = open_files_from_archives(
+        files, archives, recombine=True, nsplit=3, chunks={}
+    )
+    assert np.allclose(ds["tos"].values, expected["tos"].values)
+
+    # the recombined files are written once then reused
+    for _ in range(2):
+        ds, fids = open_files_from_archives(
+            files,
+            archives,
+            recombine=True,
+            nsplit=3,
+            chunks={},
+            in_memory=False,
+            tmpdir=f"{tmpdir}/extracted",
+        )
+        assert fids == [f"{tmpdir}/extracted/{f}" for f in files]
+        assert sorted(os.listdir(f"{tmpdir}/extracted")) == sorted(f[2:] for f in files)
+        assert np.allclose(ds["tos"].values, expected["tos"].values)
+        ds.close()
+
+    # recombined concurrently, the files are written one at a time
+    from freedompp.libIO import netcdf_write_lock
+
+    to_netcdf = xr.Dataset.to_netcdf
+
+    def locked(ds, *args, **kwargs):
+        assert netcdf_write_lock.locked()
+        return to_netcdf(ds, *args, **kwargs)
+
+    monkeypatch.setattr(xr.Dataset, "to_netcdf", locked)
+    ds, fids = open_files_from_archives(
+        files,
+        archives,
+        recombine=True,
+        nsplit=3,
+        chunks={},
+        in_memory=False,
+        tmpdir=f"{tmpdir}/workers",
+        max_workers=2,
+    )
+    assert len(os.listdir(f"{tmpdir}/workers")) == 2
+    assert np.allclose(ds["tos"].values, expected["tos"].values)
+    ds.close()
@@ -0,0 +1,165 @@
+import os
+import pytest
+
+import numpy as np
+import xarray as xr
+
+from freedompp.test.test_libfreedompp import make_history, monthly_history
+
+
+def test_expand_jobs():
+    from freedompp.libbatch import expand_jobs
+
+    manifest = dict(
+        historydir="/history",
+        ppdir="/pp",
+        options=dict(max_workers=2),
+        jobs=[
+            dict(
+                comesfrom="ocean_month",
+                type="ts",
+                fields=["tos"],
+                yearstart=1,
+                yearend=20,
+                segment=5,
+            ),
+            dict(comesfrom="ocean_month", type=["ann", "mm"], yearstart=1, yearend=20),
+        ],
+    )
+    tasks = expand_jobs(manifest)
+    assert len(tasks) == 6
+    assert [t["yearstart"] for t in tasks[:4]] == [1, 6, 11, 16]
+    assert tasks[3]["yearend"] == 20
+    assert tasks[0]["open"] == {"max_workers": 2}
+    assert tasks[5]["type"] == "mm"
+
+    with pytest.raises(ValueError):
+        expand_jobs(dict(jobs=[dict(comesfrom="ocean", type="ts")]))
+
+
+def test_plan_batch():
+    from freedompp.libbatch import plan_batch
+
+    manifest = dict(
+        historydir="/history",
+        ppdir="/pp",
+        jobs=[
+            dict(
+                comesfrom="ocean_month",
+                type="ts",
+                fields=["tos"],
+                yearstart=1,
+                yearend=5,
+            ),
+            dict(comesfrom="ocean_month", type="ann", yearstart=11, yearend=15),
+            dict(comesfrom="ice_month", type="ann", yearstart=1, yearend=5),
+        ],
+    )
+    groups = plan_batch(manifest)
+    assert len(groups) == 2
+    assert groups[0]["years"] == [1, 2, 3, 4, 5, 11, 12, 13, 14, 15]
+    assert len(groups[0]["tasks"]) == 2
+
+
+def test_run_batch(tmpdir):
+    from freedompp.libbatch import run_batch
+
+    make_history(tmpdir, 1, 4)
+    manifest = f"{tmpdir}/manifest.json"
+    with open(manifest, "w") as fid:
+        fid.write(
+            f"""{{"historydir": "{tmpdir}", "ppdir": "{tmpdir}",
+            "jobs": [{{"comesfrom": "ocean_month", "type": "ts", "fields": ["tos"],
+                      "yearstart": 1, "yearend": 4, "segment": 2}},
+                     {{"comesfrom": "ocean_month", "type": "ann",
+                      "yearstart": 1, "yearend": 4}}]}}"""
+        )
+    run_batch(manifest)
+
+    expected = xr.concat([monthly_history(y) for y in range(3, 5)], dim="time")
+    ts = xr.open_dataset(
+        f"{tmpdir}/ocean_month/ts/monthly/2yr/ocean_month.000301-000412.tos.nc",
+        decode_times=False,
+    )
+    assert np.allclose(ts["tos"].values, expected["tos"].values)
+    avdir = f"{tmpdir}/ocean_month/av/monthly_4yr"
+    assert os.path.exists(f"{avdir}/ocean_month.0001-0004.ann.nc")
+
+
+def test_parse_products():
+    from freedompp.libbatch import parse_products
+
+    assert parse_products(["ts:5", "ann:20", "mm"]) == [
+        dict(type="ts", segment=5),
+        dict(type="ann", segment=20),
+        dict(type="mm"),
+    ]
+    assert parse_products([dict(type="ann", segment=2)]) == [
+        dict(type="ann", segment=2)
+    ]
+    with pytest.raises(ValueError):
+        parse_products(["ts:five"])
+
+
+def test_write_products(tmpdir, monkeypatch):
+    import freedompp.libbatch
+    from freedompp.libbatch import write_products
+    from freedompp.libfreedompp import write_average
+    from freedompp.libIO import open_files_from_archives
+
+    make_history(tmpdir, 1, 4)
+    os.makedirs(f"{tmpdir}/pp")
+    opened = []
+
+    def open_files(files, archives, **kwargs):
+        opened.append(files)
+        return open_files_from_archives(files, archives, **kwargs)
+
+    monkeypatch.setattr(freedompp.libbatch, "open_files_from_archives", open_files)
+    profile = write_products(
+        "ocean_month",
+        1,
+        4,
+        ["ts:2", "ann:4", "mm:4", "seas:4"],
+        historydir=tmpdir,
+        ppdir=f"{tmpdir}/pp",
+        profile=True,
+    )
+    # the history is opened once for all the products
+    assert len(opened) == 1
+    assert [s["stage"] for s in profile.stages] == ["open", "compute"]
+
+    tsdir = f"{tmpdir}/pp/ocean_month/ts/monthly/2yr"
+    assert sorted(os.listdir(tsdir)) == [
+        f"ocean_month.{y:04d}01-{y + 1:04d}12.{field}.nc"
+        for y in [1, 3]
+        for field in ["sos", "tos"]
+    ]
+    os.makedirs(f"{tmpdir}/ref")
+    write_average("ocean_month", 1, 4, historydir=tmpdir, ppdir=f"{tmpdir}/ref")
+    ave = xr.open_dataset(
+        f"{tmpdir}/pp/ocean_month/av/monthly_4yr/ocean_month.0001-0004.ann.nc",
+        decode_times=False,
+    )
+    ref = xr.open_dataset(
+        f"{tmpdir}/ref/ocean_month/av/monthly_4yr/ocean_month.0001-0004.ann.nc",
+        decode_times=False,
+    )
+    xr.testing.assert_identical(ave, ref)
+    assert len(os.listdir(f"{tmpdir}/pp/ocean_month/av/monthly_4yr")) == 13 + 4
+    write_average(
+        "ocean_month", 1, 4, historydir=tmpdir, ppdir=f"{tmpdir}/ref", avtype="seas"
+    )
+    for season in ["DJF", "MAM", "JJA", "SON"]:
+        ave, ref = [
+            xr.open_dataset(
+                f"{tmpdir}/{d}/ocean_month/av/monthly_4yr/ocean_month.0001-0004."
+                f"{season}.nc",
+                decode_times=False,
+            )
+            for d in ["pp", "ref"]
+        ]
+        xr.testing.assert_identical(ave, ref)
+
+    with pytest.raises(ValueError, match="streaming"):
+        write_products("ocean_month", 1, 4, ["ann"], streaming=True)
@@ -0,0 +1,54 @@
+import os
+import time
+
+import numpy as np
+import xarray as xr
+
+testds = xr.DataArray(np.arange(1000.0), dims=("time")).to_dataset(name="x")
+
+
+def test_cache_key(tmpdir):
+    from freedompp.libcache import cache_key
+
+    archive = f"{tmpdir}/00010101.nc.tar"
+    with open(archive, "w") as fid:
+        fid.write("a")
+    key = cache_key([archive], ["./00010101.ocean_month.nc"], avtype="ann")
+    assert key == cache_key([archive], ["./00010101.ocean_month.nc"], avtype="ann")
+    assert key != cache_key([archive], ["./00010101.ocean_month.nc"], avtype="mm")
+    assert key != cache_key([archive], ["./00010101.ice_month.nc"], avtype="ann")
+
+    # a rewritten archive invalidates the key
+    with open(archive, "w") as fid:
+        fid.write("ab")
+    assert key != cache_key([archive], ["./00010101.ocean_month.nc"], avtype="ann")
+
+
+def test_cache_put_get(tmpdir):
+    from freedompp.libcache import cache_get, cache_put
+
+    assert cache_get(tmpdir, "abc") is None
+    cache_put(f"{tmpdir}/cache", "abc", testds)
+    cached = cache_get(f"{tmpdir}/cache", "abc")
+    assert np.array_equal(cached["x"].values, testds["x"].values)
+    assert os.listdir(f"{tmpdir}/cache") == ["abc.nc"]
+
+
+def test_evict(tmpdir):
+    from freedompp.libcache import cache_get, cache_put, cache_filename
+
+    cachedir = f"{tmpdir}/cache"
+    for key in ["a", "b", "c"]:
+        cache_put(cachedir, key, testds)
+        # mtime resolution of some filesystems
+        os.utime(cache_filename(cachedir, key), (time.time(), time.time() - 10))
+    # a is used again, b is now the least recently used
+    cache_get(cachedir, "a")
+
+    size = os.path.getsize(cache_filename(cachedir, "a"))
+    cache_put(cachedir, "d", testds, max_bytes=3 * size)
+    assert sorted(os.listdir(cachedir)) == ["a.nc", "c.nc", "d.nc"]
+
+    # the result just stored is kept even if larger than the cache
+    cache_put(cachedir, "e", testds, max_bytes=1)
+    assert os.listdir(cachedir) == ["e.nc"]
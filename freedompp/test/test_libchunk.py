@@ -0,0 +1,49 @@
+import pytest
+
+
+def test_plan_chunks():
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libchunk import chunk_bytes, plan_chunks
+
+    ds = ocean_month_z(nz=10, ny=100, nx=200)
+    # one level of one record is 80kB
+    chunks = plan_chunks(ds, pptype="ann", target_bytes=200_000)
+    assert chunks["time"] == 1
+    assert chunks["z_l"] == 2
+    assert (chunks["yh"], chunks["xh"]) == (100, 200)
+    assert chunk_bytes(ds, chunks) <= 200_000
+
+    # timeseries group records up to the target
+    chunks = plan_chunks(ds, pptype="ts", target_bytes=2_000_000)
+    assert chunks["z_l"] == 10
+    assert chunks["time"] == 2
+
+    # levels too large for the target are split along latitude
+    chunks = plan_chunks(ds, pptype="ts", target_bytes=40_000)
+    assert chunks["z_l"] == 1
+    assert chunks["yh"] == 50
+    assert chunks["time"] == 1
+
+    # explicit chunks are kept, the others are planned
+    chunks = plan_chunks(ds, chunks={"time": 12, "z_l": 1}, target_bytes=500_000)
+    assert chunks["time"] == 12
+    assert chunks["z_l"] == 1
+    assert chunks["yh"] == 52
+    assert chunk_bytes(ds, chunks) <= 500_000
+    # dimensions not in the dataset are ignored
+    chunks = plan_chunks(ds, chunks={"zi": 5})
+    assert "zi" not in chunks
+
+
+@pytest.mark.parametrize("BUDGET", [None, 2**30])
+def test_plan_read_chunks(BUDGET):
+    from freedompp.benchmarks.synthetic import ocean_month_z
+    from freedompp.libchunk import chunk_bytes, plan_read_chunks, read_chunk_bytes
+
+    ds = ocean_month_z(nz=10, ny=100, nx=200)
+    chunks = plan_read_chunks(ds, memory_budget=BUDGET)
+    if BUDGET is None:
+        # the whole year fits in one chunk
+        assert chunks["time"] == 12
+        assert chunks["z_l"] == 10
+    assert chunk_bytes(ds, chunks) <= read_chunk_bytes
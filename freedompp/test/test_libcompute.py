@@ -1,10 +1,10 @@
 import cftime
 import numpy as np
+import pytest
 import pandas as pd
 import xarray as xr
 from calendar import monthrange
 
-
 mom6like = xr.Dataset(
     data_vars=dict(
         tos=(["time", "yh", "xh"], np.random.rand(2, 180, 360)),
@@ -168,6 +168,13 @@ def test_extract_timeserie():
     assert "tos" in ds.variables
 
 
+def test_timeserie_fields():
+    from freedompp.libcompute import timeserie_fields
+
+    assert timeserie_fields(mom6like) == ["tos"]
+    assert timeserie_fields(ds_1m) == ["data"]
+
+
 def test_simple_average():
     from freedompp.libcompute import simple_average
 
@@ -197,3 +204,140 @@ def test_weighted_by_month_length_average():
 
 #    ave = month_by_month_average(ds_1d)
 #    assert len(ave["data"]) == 12
+
+
+@pytest.mark.parametrize("AVTYPE", ["ann", "mm"])
+@pytest.mark.parametrize("WEIGHTED", [True, False])
+def test_accumulate_average(AVTYPE, WEIGHTED):
+    from freedompp.libcompute import accumulate_average, finalize_average
+    from freedompp.libcompute import month_by_month_average, simple_average
+    from freedompp.libcompute import weighted_by_month_length_average
+
+    if AVTYPE == "mm" and WEIGHTED:
+        pytest.skip("monthly averages are not weighted")
+
+    ds = ds_1m.copy()
+    ds["time"].attrs = {"units": units, "calendar": "gregorian"}
+    ds["data"] = ds["data"].astype("f8")
+    ds["data"][5] = np.nan
+    ds["static"] = xr.DataArray(np.arange(3.0), dims=("x"))
+
+    # accumulate year by year
+    acc = None
+    for year in range(10):
+        dsyear = ds.isel(time=slice(12 * year, 12 * (year + 1)))
+        acc = accumulate_average(acc, dsyear, avtype=AVTYPE, weighted=WEIGHTED)
+    ave = finalize_average(acc, avtype=AVTYPE)
+
+    if AVTYPE == "mm":
+        expected = month_by_month_average(ds)
+    elif WEIGHTED:
+        expected = weighted_by_month_length_average(ds)
+    else:
+        expected = simple_average(ds)
+
+    xr.testing.assert_allclose(ave, expected)
+
+
+def test_month_time_vars():
+    from freedompp.libcompute import month_time_vars
+
+    # 3 years of noleap months, in days since the start of the first year
+    mdays = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype="f8")
+    dt = np.tile(mdays, 3)
+    t2 = np.cumsum(dt)
+    time_bnds = np.stack([t2 - dt, t2], axis=1)
+    month = np.tile(np.arange(1, 13), 3)
+
+    tvars = month_time_vars(month, time_bnds, dt)
+    assert np.array_equal(tvars["average_T1"], time_bnds[:12, 0])
+    assert np.array_equal(tvars["average_T2"], time_bnds[24:, 1])
+    assert np.array_equal(tvars["average_DT"], 3 * mdays)
+    assert np.array_equal(tvars["time"], time_bnds[24:, 1] - 0.5 * mdays)
+
+    # records do not need to be ordered by month
+    order = np.random.permutation(36)
+    shuffled = month_time_vars(month[order], time_bnds[order], dt[order])
+    assert np.array_equal(shuffled["average_DT"], tvars["average_DT"])
+
+    with pytest.raises(ValueError):
+        month_time_vars(month[:11], time_bnds[:11], dt[:11])
+
+
+def test_seasonal_average():
+    from freedompp.libcompute import month_by_month_average, seasonal_average
+    from freedompp.libcompute import extract_season
+
+    ds = ds_1m.copy()
+    ds["time"].attrs = {"units": units, "calendar": "gregorian"}
+    ds["data"] = ds["data"].astype("f8")
+    ds["data"][0] = np.nan
+
+    ave_mm = month_by_month_average(ds)
+    ave = seasonal_average(ave_mm)
+    assert ave.sizes["time"] == 4
+
+    # JJA months have the same length every year: average of all records
+    month = np.tile(np.arange(1, 13), 10)
+    jja = ds.isel(time=np.isin(month, [6, 7, 8]))
+    jja = jja.dropna("time")
+    expected = (jja["data"] * jja["average_DT"]).sum() / jja["average_DT"].sum()
+    assert np.isclose(ave["data"].values[2], expected)
+    # DJF is weighted by the length of the months within the same years
+    djf = ave_mm.isel(time=[11, 0, 1])
+    expected = djf["data"].weighted(djf["average_DT"]).mean()
+    assert np.isclose(ave["data"].values[0], expected)
+
+    # time bookkeeping from the monthly averages
+    dt = ds["average_DT"].values.reshape(10, 12).sum(axis=0)
+    expected = [dt[[11, 0, 1]].sum(), dt[2:5].sum(), dt[5:8].sum(), dt[8:11].sum()]
+    assert np.array_equal(ave["average_DT"], expected)
+    assert ave["average_T1"].values[0] == ds["average_T1"].values[0]
+    assert ave["average_T2"].values[0] == ds["average_T2"].values[-1]
+    assert ave["average_T1"].values[1] == ds["average_T1"].values[2]
+    assert ave["average_T2"].values[1] == ds["average_T2"].values[-8]
+    assert np.array_equal(ave["time"], ave_mm["time"][[0, 3, 6, 9]])
+
+    jja = extract_season(ave, "JJA")
+    assert jja.sizes["time"] == 1
+    assert jja["time"].values[0] == ave_mm["time"].values[6]
+
+    with pytest.raises(ValueError):
+        seasonal_average(ave_mm.isel(time=slice(0, 6)))
+
+
+def test_select_years():
+    from freedompp.libcompute import select_years
+
+    ds = ds_1m.copy()
+    ds["time"].attrs = {"units": units, "calendar": "gregorian"}
+    sub = select_years(ds, 2003, 2004)
+    assert len(sub["time"]) == 24
+    assert np.allclose(sub["data"].values, np.arange(24, 48))
+
+
+def test_stack_tiles():
+    from freedompp.libcompute import simple_average, split_tiles, stack_tiles
+
+    tiles = [ds_1y.copy() for k in range(3)]
+    for k, tile in enumerate(tiles):
+        tile["data"] = tile["data"] + 10 * k
+        tile["area"] = xr.DataArray(np.full(4, k), dims=("x"))
+    stacked = stack_tiles(tiles, [1, 2, 3])
+    assert stacked["data"].dims == ("tile", "time")
+    assert stacked["area"].dims == ("tile", "x")
+    assert "tile" not in stacked["average_DT"].dims
+
+    ave = simple_average(stacked)
+    split = split_tiles(ave, "tile*.nc")
+    assert [ftype for ftype, _ in split] == ["tile1.nc", "tile2.nc", "tile3.nc"]
+    for k, (_, tile) in enumerate(split):
+        assert "tile" not in tile.variables
+        expected = simple_average(tiles[k])
+        assert np.allclose(tile["data"], expected["data"])
+        assert np.allclose(tile["area"], k)
+        assert np.array_equal(tile["average_DT"], expected["average_DT"])
+
+    assert split_tiles(ave, "nc") == [("nc", ave)]
+    with pytest.raises(ValueError):
+        split_tiles(tiles[0], "tile*.nc")
@@ -0,0 +1,589 @@
+import os
+import tarfile
+import pytest
+
+import numpy as np
+import xarray as xr
+
+# days in each month of the noleap calendar
+mdays = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype="f8")
+time_attrs = {"units": "days since 0001-01-01 00:00:00", "calendar": "noleap"}
+
+
+def monthly_history(year, nx=4):
+    """create a dataset looking like a year of FMS monthly history"""
+    t2 = (year - 1) * 365 + np.cumsum(mdays)
+    t1 = t2 - mdays
+    data = year * 100 + np.arange(12)[:, None] + np.zeros((12, nx))
+    ds = xr.Dataset(
+        data_vars=dict(
+            tos=(["time", "xh"], data, {"units": "degC"}),
+            sos=(["time", "xh"], data + 0.5, {"units": "psu"}),
+            average_T1=(["time"], t1, time_attrs),
+            average_T2=(["time"], t2, time_attrs),
+            average_DT=(["time"], mdays, {"units": "days"}),
+            time_bnds=(["time", "nv"], np.stack([t1, t2], axis=1), time_attrs),
+        ),
+        coords=dict(
+            time=xr.DataArray(0.5 * (t1 + t2), dims=("time"), attrs=time_attrs),
+            xh=xr.DataArray(np.arange(nx, dtype="f8"), dims=("xh")),
+        ),
+    )
+    return ds
+
+
+def make_history(historydir, yearstart, yearend, comesfrom="ocean_month"):
+    """write yearly tar archives of monthly history into historydir"""
+    for year in range(yearstart, yearend + 1):
+        ncfile = f"{historydir}/tmp.nc"
+        monthly_history(year).to_netcdf(ncfile)
+        with tarfile.open(f"{historydir}/{year:04d}0101.nc.tar", "w:") as tar:
+            tar.add(ncfile, arcname=f"./{year:04d}0101.{comesfrom}.nc")
+        os.remove(ncfile)
+
+
+def make_tiled_history(historydir, yearstart, yearend, comesfrom="atmos_month"):
+    """write yearly tar archives of 6 tiles of monthly history"""
+    for year in range(yearstart, yearend + 1):
+        with tarfile.open(f"{historydir}/{year:04d}0101.nc.tar", "w:") as tar:
+            for tile in range(1, 7):
+                ncfile = f"{historydir}/tmp.nc"
+                ds = monthly_history(year)
+                for var in ["tos", "sos"]:
+                    ds[var] = ds[var] + 1000 * tile
+                ds.to_netcdf(ncfile)
+                tar.add(ncfile, arcname=f"./{year:04d}0101.{comesfrom}.tile{tile}.nc")
+                os.remove(ncfile)
+
+
+def test_write_timeseries(tmpdir):
+    from freedompp.libfreedompp import write_timeseries
+
+    make_history(tmpdir, 1, 2)
+    write_timeseries(
+        ["tos", "sos"], "ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir
+    )
+    for field in ["tos", "sos"]:
+        ts = xr.open_dataset(
+            f"{tmpdir}/ocean_month/ts/monthly/2yr/ocean_month.000101-000212.{field}.nc",
+            decode_times=False,
+        )
+        assert len(ts["time"]) == 24
+        assert "average_DT" in ts.variables
+        expected = xr.concat([monthly_history(1), monthly_history(2)], dim="time")
+        assert np.allclose(ts[field].values, expected[field].values)
+
+    # every time-dependent field
+    write_timeseries("ALL", "ocean_month", 1, 1, historydir=tmpdir, ppdir=tmpdir)
+    outdir = f"{tmpdir}/ocean_month/ts/monthly/1yr"
+    assert sorted(os.listdir(outdir)) == [
+        "ocean_month.000101-000112.sos.nc",
+        "ocean_month.000101-000112.tos.nc",
+    ]
+
+
+def test_write_timeseries_profile(tmpdir):
+    from freedompp.libfreedompp import write_average, write_timeseries
+
+    make_history(tmpdir, 1, 2)
+    kwargs = dict(historydir=tmpdir, ppdir=tmpdir)
+    assert write_timeseries(["tos"], "ocean_month", 1, 2, **kwargs) is None
+    profile = write_timeseries(["tos"], "ocean_month", 1, 2, profile=True, **kwargs)
+    assert [s["stage"] for s in profile.stages] == ["index", "open", "compute"]
+    # the same profile collects several jobs
+    write_average("ocean_month", 1, 2, profile=profile, **kwargs)
+    stages = [s["stage"] for s in profile.stages]
+    assert stages[3:] == ["index", "open", "average", "compute"]
+
+
+def test_write_tiles(tmpdir):
+    from freedompp.libfreedompp import write_average, write_timeseries
+
+    make_tiled_history(tmpdir, 1, 2)
+    kwargs = dict(historydir=tmpdir, ppdir=tmpdir, ftype="tile*.nc")
+    write_timeseries(["tos"], "atmos_month", 1, 2, **kwargs)
+    write_average("atmos_month", 1, 2, avtype="ann", **kwargs)
+
+    expected = xr.concat([monthly_history(1), monthly_history(2)], dim="time")
+    for tile in range(1, 7):
+        ts = xr.open_dataset(
+            f"{tmpdir}/atmos_month/ts/monthly/2yr/"
+            f"atmos_month.000101-000212.tos.tile{tile}.nc",
+            decode_times=False,
+        )
+        assert ts["tos"].dims == ("time", "xh")
+        assert np.allclose(ts["tos"].values, expected["tos"].values + 1000 * tile)
+        assert np.array_equal(ts["average_DT"].values, expected["average_DT"].values)
+
+        ave = xr.open_dataset(
+            f"{tmpdir}/atmos_month/av/monthly_2yr/atmos_month.0001-0002.ann.tile{tile}.nc",
+            decode_times=False,
+        )
+        weights = expected["average_DT"] / expected["average_DT"].sum()
+        mean = (expected["sos"] * weights).sum("time") + 1000 * tile
+        assert np.allclose(ave["sos"].values, mean.values)
+        assert ave["average_DT"].values == [730]
+
+
+@pytest.mark.parametrize("FTYPE", ["nc", "tile*.nc"])
+def test_write_timeseries_streaming(tmpdir, FTYPE):
+    from freedompp.libfreedompp import write_timeseries
+
+    if FTYPE == "nc":
+        make_history(tmpdir, 1, 3, comesfrom="atmos_month")
+    else:
+        make_tiled_history(tmpdir, 1, 3)
+    kwargs = dict(historydir=tmpdir, ftype=FTYPE)
+    os.makedirs(f"{tmpdir}/ref")
+    os.makedirs(f"{tmpdir}/pp")
+    write_timeseries("ALL", "atmos_month", 1, 3, ppdir=f"{tmpdir}/ref", **kwargs)
+    write_timeseries(
+        "ALL",
+        "atmos_month",
+        1,
+        3,
+        ppdir=f"{tmpdir}/pp",
+        streaming=True,
+        writers=2,
+        **kwargs,
+    )
+
+    outdir = "atmos_month/ts/monthly/3yr"
+    files = sorted(os.listdir(f"{tmpdir}/ref/{outdir}"))
+    assert len(files) == (2 if FTYPE == "nc" else 12)
+    assert sorted(os.listdir(f"{tmpdir}/pp/{outdir}")) == files
+    for fname in files:
+        ref = xr.open_dataset(f"{tmpdir}/ref/{outdir}/{fname}", decode_times=False)
+        ts = xr.open_dataset(f"{tmpdir}/pp/{outdir}/{fname}", decode_times=False)
+        xr.testing.assert_identical(ts, ref)
+
+    # reads, splits and writes overlapping through queues
+    os.makedirs(f"{tmpdir}/pipeline")
+    profile = write_timeseries(
+        "ALL",
+        "atmos_month",
+        1,
+        3,
+        ppdir=f"{tmpdir}/pipeline",
+        pipeline=True,
+        queue_depth=1,
+        writers=2,
+        profile=True,
+        **kwargs,
+    )
+    queues = profile.stages[-1]["queues"]
+    assert queues["read"]["items"] == 3
+    assert sum(queues[f"write{k}"]["items"] for k in range(2)) == 3 * len(files)
+    for fname in files:
+        ref = xr.open_dataset(f"{tmpdir}/ref/{outdir}/{fname}", decode_times=False)
+        ts = xr.open_dataset(f"{tmpdir}/pipeline/{outdir}/{fname}", decode_times=False)
+        xr.testing.assert_identical(ts, ref)
+
+
+def test_write_timeseries_compression(tmpdir):
+    import netCDF4
+    from freedompp.libfreedompp import write_timeseries
+
+    make_history(tmpdir, 1, 1)
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        1,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        compression={"method": "zlib", "least_significant_digit": 2},
+    )
+    fname = f"{tmpdir}/ocean_month/ts/monthly/1yr/ocean_month.000101-000112.tos.nc"
+    with netCDF4.Dataset(fname) as nc:
+        assert nc["tos"].filters()["zlib"]
+        assert nc["tos"].least_significant_digit == 2
+        assert not hasattr(nc["average_DT"], "least_significant_digit")
+    ts = xr.open_dataset(fname, decode_times=False)
+    assert np.allclose(ts["tos"].values, monthly_history(1)["tos"].values)
+
+
+def test_write_average(tmpdir):
+    from freedompp.libfreedompp import write_average
+
+    make_history(tmpdir, 1, 2)
+    expected = xr.concat([monthly_history(1), monthly_history(2)], dim="time")
+
+    write_average("ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir, avtype="mm")
+    outdir = f"{tmpdir}/ocean_month/av/monthly_2yr"
+    for month in range(1, 12 + 1):
+        ave = xr.open_dataset(
+            f"{outdir}/ocean_month.0001-0002.{month:02d}.nc", decode_times=False
+        )
+        assert len(ave["time"]) == 1
+        tos = expected["tos"].isel(time=[month - 1, month + 11]).mean(dim="time")
+        assert np.allclose(ave["tos"].values, tos.values)
+        assert np.allclose(ave["average_DT"].values, 2 * mdays[month - 1])
+
+    write_average("ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir, avtype="ann")
+    ave = xr.open_dataset(f"{outdir}/ocean_month.0001-0002.ann.nc", decode_times=False)
+    tos = expected["tos"].weighted(expected["average_DT"]).mean(dim="time")
+    assert np.allclose(ave["tos"].values, tos.values)
+    assert np.allclose(ave["average_DT"].values, 730)
+
+
+def test_write_average_seasons(tmpdir):
+    from freedompp.libfreedompp import write_average
+
+    make_history(tmpdir, 1, 2)
+    expected = xr.concat([monthly_history(1), monthly_history(2)], dim="time")
+
+    # monthly and seasonal averages from one read
+    profile = write_average(
+        "ocean_month",
+        1,
+        2,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        avtype=["mm", "seas"],
+        profile=True,
+    )
+    assert [s["stage"] for s in profile.stages].count("open") == 1
+    outdir = f"{tmpdir}/ocean_month/av/monthly_2yr"
+    assert len(os.listdir(outdir)) == 12 + 4
+    for season, months in [("DJF", [0, 1, 11]), ("JJA", [5, 6, 7])]:
+        ave = xr.open_dataset(
+            f"{outdir}/ocean_month.0001-0002.{season}.nc", decode_times=False
+        )
+        assert len(ave["time"]) == 1
+        records = expected.isel(time=months + [m + 12 for m in months])
+        tos = records["tos"].weighted(records["average_DT"]).mean(dim="time")
+        assert np.allclose(ave["tos"].values, tos.values)
+        assert np.allclose(ave["average_DT"].values, records["average_DT"].sum())
+
+
+@pytest.mark.parametrize("AVTYPE", ["ann", "mm", "seas"])
+def test_write_average_hierarchical(tmpdir, monkeypatch, AVTYPE):
+    import freedompp.libfreedompp
+    from freedompp.libfreedompp import write_average
+    from freedompp.libIO import open_files_from_archives
+    from freedompp.libstruct import avsuffixes
+
+    make_history(tmpdir, 1, 5)
+    for d in ["pp", "ref"]:
+        os.makedirs(f"{tmpdir}/{d}")
+    write_average(
+        "ocean_month", 1, 5, historydir=tmpdir, ppdir=f"{tmpdir}/ref", avtype=AVTYPE
+    )
+    # existing shorter averages cover years 1-2 and 4
+    for first, last in [(1, 2), (4, 4)]:
+        write_average(
+            "ocean_month",
+            first,
+            last,
+            historydir=tmpdir,
+            ppdir=f"{tmpdir}/pp",
+            avtype=AVTYPE,
+        )
+
+    opened = []
+
+    def open_files(files, archives, **kwargs):
+        opened.extend(archives)
+        return open_files_from_archives(files, archives, **kwargs)
+
+    monkeypatch.setattr(freedompp.libfreedompp, "open_files_from_archives", open_files)
+    write_average(
+        "ocean_month",
+        1,
+        5,
+        historydir=tmpdir,
+        ppdir=f"{tmpdir}/pp",
+        avtype=AVTYPE,
+        hierarchical=True,
+    )
+    # only the years without an existing average are read
+    assert [os.path.basename(a) for a in opened] == [
+        "00030101.nc.tar",
+        "00050101.nc.tar",
+    ]
+    for suffix in avsuffixes(AVTYPE):
+        ave, ref = [
+            xr.open_dataset(
+                f"{tmpdir}/{d}/ocean_month/av/monthly_5yr/ocean_month.0001-0005."
+                f"{suffix}.nc",
+                decode_times=False,
+            )
+            for d in ["pp", "ref"]
+        ]
+        xr.testing.assert_allclose(ave, ref)
+        for var in ref.variables:
+            assert ave[var].attrs == ref[var].attrs
+            assert ave[var].dtype == ref[var].dtype
+
+
+@pytest.mark.parametrize("AVTYPE", ["ann", "mm", "seas"])
+def test_compute_average_streaming(tmpdir, AVTYPE):
+    from freedompp.libfreedompp import compute_average
+
+    make_history(tmpdir, 1, 3)
+    ave = compute_average("ocean_month", 1, 3, historydir=tmpdir, avtype=AVTYPE)
+    streamed = compute_average(
+        "ocean_month", 1, 3, historydir=tmpdir, avtype=AVTYPE, streaming=True
+    )
+    xr.testing.assert_allclose(streamed, ave.load())
+    for var in ave.variables:
+        assert streamed[var].attrs == ave[var].attrs
+
+    # archives staged locally ahead of being read, then removed
+    staged = compute_average(
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        avtype=AVTYPE,
+        streaming=True,
+        stagedir=f"{tmpdir}/stage",
+        prefetch=1,
+    )
+    xr.testing.assert_allclose(staged, streamed)
+    assert os.listdir(f"{tmpdir}/stage") == []
+
+    # the next archives are read while the current one is averaged
+    pipelined = compute_average(
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        avtype=AVTYPE,
+        pipeline=True,
+        queue_depth=1,
+        stagedir=f"{tmpdir}/stage",
+    )
+    xr.testing.assert_allclose(pipelined, streamed)
+    assert os.listdir(f"{tmpdir}/stage") == []
+
+
+def test_cache(tmpdir, monkeypatch):
+    import freedompp.libfreedompp
+    from freedompp.libfreedompp import compute_average, load_timeserie
+
+    make_history(tmpdir, 1, 2)
+    cachedir = f"{tmpdir}/cache"
+    ave = compute_average(
+        "ocean_month", 1, 2, historydir=tmpdir, avtype="mm", cachedir=cachedir
+    )
+    ts = load_timeserie(
+        "tos", "ocean_month", 1, 2, historydir=tmpdir, cachedir=cachedir
+    )
+    assert len(os.listdir(cachedir)) == 2
+
+    # the history is not read again
+    def no_history(*args, **kwargs):
+        raise AssertionError("history should not be read")
+
+    with monkeypatch.context() as m:
+        m.setattr(freedompp.libfreedompp, "open_files_from_archives", no_history)
+        cached = compute_average(
+            "ocean_month", 1, 2, historydir=tmpdir, avtype="mm", cachedir=cachedir
+        )
+        assert np.array_equal(cached["tos"].values, ave["tos"].values)
+        assert np.array_equal(cached["average_T2"].values, ave["average_T2"].values)
+        cached = load_timeserie(
+            "tos", "ocean_month", 1, 2, historydir=tmpdir, cachedir=cachedir
+        )
+        assert np.array_equal(cached["tos"].values, ts["tos"].values)
+
+    # other inputs are not taken from the cache
+    compute_average("ocean_month", 1, 1, historydir=tmpdir, cachedir=cachedir)
+    assert len(os.listdir(cachedir)) == 3
+
+
+def test_copy_output(tmpdir):
+    from freedompp.libfreedompp import copy_output
+
+    # a file, cloned or copied, then a store replacing a leftover copy
+    with open(f"{tmpdir}/file.nc", "wb") as f:
+        f.write(b"data")
+    copy_output(f"{tmpdir}/file.nc", f"{tmpdir}/copy.nc")
+    with open(f"{tmpdir}/copy.nc", "ab") as f:
+        f.write(b" appended")
+    assert open(f"{tmpdir}/file.nc", "rb").read() == b"data"
+    assert open(f"{tmpdir}/copy.nc", "rb").read() == b"data appended"
+
+    os.makedirs(f"{tmpdir}/store.zarr/tos")
+    os.replace(f"{tmpdir}/file.nc", f"{tmpdir}/store.zarr/tos/0")
+    os.makedirs(f"{tmpdir}/copy.zarr/leftover")
+    copy_output(f"{tmpdir}/store.zarr", f"{tmpdir}/copy.zarr")
+    assert os.listdir(f"{tmpdir}/copy.zarr") == ["tos"]
+    assert open(f"{tmpdir}/copy.zarr/tos/0", "rb").read() == b"data"
+
+
+def test_write_timeseries_incremental(tmpdir, monkeypatch):
+    from freedompp.libfreedompp import write_timeseries
+
+    make_history(tmpdir, 1, 3)
+    write_timeseries(["tos"], "ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir)
+    old = f"{tmpdir}/ocean_month/ts/monthly/2yr/ocean_month.000101-000212.tos.nc"
+    assert os.path.exists(old)
+
+    # tos is extended by reading year 3 only, staged locally first
+    os.remove(f"{tmpdir}/00010101.nc.tar")
+    os.remove(f"{tmpdir}/00020101.nc.tar")
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        incremental=True,
+        stagedir=f"{tmpdir}/stage",
+    )
+    assert os.listdir(f"{tmpdir}/stage") == []
+    new = f"{tmpdir}/ocean_month/ts/monthly/3yr/ocean_month.000101-000312.tos.nc"
+    ts = xr.open_dataset(new, decode_times=False)
+    expected = xr.concat([monthly_history(y) for y in range(1, 4)], dim="time")
+    assert len(ts["time"]) == 36
+    assert np.allclose(ts["tos"].values, expected["tos"].values)
+    assert np.allclose(ts["time_bnds"].values, expected["time_bnds"].values)
+    assert np.allclose(ts["time"].values, expected["time"].values)
+    ts.close()
+    # the shorter timeserie is kept as it was
+    short = xr.open_dataset(old, decode_times=False)
+    assert len(short["time"]) == 24
+    assert np.allclose(short["tos"].values, expected["tos"].values[:24])
+    short.close()
+
+    # a failed append leaves the existing timeserie untouched
+    def fail(ds, filename):
+        raise OSError("disk full")
+
+    make_history(tmpdir, 4, 4)
+    monkeypatch.setattr("freedompp.libfreedompp.append_ncfile", fail)
+    with pytest.raises(OSError, match="disk full"):
+        write_timeseries(
+            ["tos"],
+            "ocean_month",
+            1,
+            4,
+            historydir=tmpdir,
+            ppdir=tmpdir,
+            incremental=True,
+        )
+    assert os.listdir(f"{tmpdir}/ocean_month/ts/monthly/4yr") == []
+    ts = xr.open_dataset(new, decode_times=False)
+    assert len(ts["time"]) == 36
+    ts.close()
+
+    # a rerun leaves the extended timeserie as it is
+    mtime = os.path.getmtime(new)
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        incremental=True,
+    )
+    assert os.path.getmtime(new) == mtime
+
+
+def test_write_timeseries_zarr(tmpdir):
+    pytest.importorskip("zarr")
+    from freedompp.libfreedompp import copy_output, replace_output
+    from freedompp.libfreedompp import write_timeseries, write_average
+
+    make_history(tmpdir, 1, 3)
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        2,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        chunks={"time": 12},
+        output_format="zarr",
+    )
+    store = f"{tmpdir}/ocean_month/ts/monthly/2yr/ocean_month.000101-000212.tos.zarr"
+    ts = xr.open_zarr(store, decode_times=False)
+    assert ts["tos"].encoding["chunks"] == (12, 4)
+    expected = xr.concat([monthly_history(y) for y in range(1, 4)], dim="time")
+    assert np.allclose(ts["tos"].values, expected["tos"].values[:24])
+
+    # extended with the new year only
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        incremental=True,
+        output_format="zarr",
+    )
+    # the shorter timeserie is kept
+    assert len(xr.open_zarr(store, decode_times=False)["time"]) == 24
+    ts = xr.open_zarr(
+        f"{tmpdir}/ocean_month/ts/monthly/3yr/ocean_month.000101-000312.tos.zarr",
+        decode_times=False,
+    )
+    assert np.allclose(ts["tos"].values, expected["tos"].values)
+    assert np.allclose(ts["time_bnds"].values, expected["time_bnds"].values)
+
+    # a rerun keeps the extended store, which also replaces an existing one
+    write_timeseries(
+        ["tos"],
+        "ocean_month",
+        1,
+        3,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        incremental=True,
+        output_format="zarr",
+    )
+    new = f"{tmpdir}/ocean_month/ts/monthly/3yr/ocean_month.000101-000312.tos.zarr"
+    assert np.allclose(
+        xr.open_zarr(new, decode_times=False)["tos"].values, expected["tos"].values
+    )
+    copy_output(store, f"{new}.tmp")
+    replace_output(f"{new}.tmp", new)
+    assert len(xr.open_zarr(new, decode_times=False)["time"]) == 24
+    assert sorted(os.listdir(os.path.dirname(new))) == [os.path.basename(new)]
+
+    write_average(
+        "ocean_month",
+        1,
+        2,
+        historydir=tmpdir,
+        ppdir=tmpdir,
+        compression={"method": "zstd"},
+        output_format="zarr",
+    )
+    ave = xr.open_zarr(
+        f"{tmpdir}/ocean_month/av/monthly_2yr/ocean_month.0001-0002.ann.zarr",
+        decode_times=False,
+    )
+    assert len(ave["time"]) == 1
+
+
+def test_write_timeseries_zarr_streaming(tmpdir):
+    pytest.importorskip("zarr")
+    from freedompp.libfreedompp import write_timeseries
+
+    make_history(tmpdir, 1, 3)
+    expected = xr.concat([monthly_history(y) for y in range(1, 4)], dim="time")
+    store = f"{tmpdir}/ocean_month/ts/monthly/3yr/ocean_month.000101-000312.tos.zarr"
+    # a rerun replaces the stores of the first run
+    for _ in range(2):
+        write_timeseries(
+            ["tos"],
+            "ocean_month",
+            1,
+            3,
+            historydir=tmpdir,
+            ppdir=tmpdir,
+            chunks={"time": 12},
+            output_format="zarr",
+            streaming=True,
+            writers=2,
+        )
+        ts = xr.open_zarr(store, decode_times=False)
+        assert np.allclose(ts["tos"].values, expected["tos"].values)
+        assert os.listdir(os.path.dirname(store)) == [os.path.basename(store)]
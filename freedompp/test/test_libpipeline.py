@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+
+def test_run_pipeline():
+    from freedompp.libpipeline import run_pipeline
+
+    reads, written = [], {}
+    lock = threading.Lock()
+
+    def read(item):
+        reads.append(item)
+        return item * 10
+
+    def reduce(item, data):
+        return [(f"file{k}", data + k) for k in range(3)]
+
+    def write(key, output):
+        # slow writes, the next items are read meanwhile
+        time.sleep(0.01)
+        with lock:
+            written.setdefault(key, []).append(output)
+
+    metrics = run_pipeline(list(range(5)), read, reduce, write, depth=2, writers=2)
+    assert reads == list(range(5))
+    # each file is written in the order of the items
+    assert written == {f"file{k}": [10 * i + k for i in range(5)] for k in range(3)}
+    assert set(metrics) == {"read", "write0", "write1"}
+    assert metrics["read"]["items"] == 5
+    assert metrics["write0"]["items"] + metrics["write1"]["items"] == 15
+    for q in metrics.values():
+        assert 0 < q["max_depth"] <= q["maxsize"] == 2
+
+
+def test_run_pipeline_bounded():
+    from freedompp.libpipeline import run_pipeline
+
+    reads = []
+    reduced = []
+
+    def read(item):
+        reads.append(item)
+        return item
+
+    def reduce(item, data):
+        # the reader stays at most depth items ahead, plus the one it reads
+        time.sleep(0.01)
+        assert len(reads) - len(reduced) <= 1 + 1 + 1
+        reduced.append(item)
+        return []
+
+    metrics = run_pipeline(list(range(10)), read, reduce, depth=1)
+    assert reduced == list(range(10))
+    # the reader waited for the slow reductions
+    assert metrics["read"]["put_wait"] > 0
+
+
+@pytest.mark.parametrize("STAGE", ["read", "reduce", "write"])
+def test_run_pipeline_errors(STAGE):
+    from freedompp.libpipeline import run_pipeline
+
+    def fail(stage, item):
+        if stage == STAGE and item == 3:
+            raise RuntimeError(f"{stage} failed")
+
+    def read(item):
+        fail("read", item)
+        return item
+
+    def reduce(item, data):
+        fail("reduce", item)
+        return [("file", item)]
+
+    def write(key, item):
+        fail("write", item)
+
+    # errors are raised in the calling thread, nothing is left waiting
+    with pytest.raises(RuntimeError, match=f"{STAGE} failed"):
+        run_pipeline(list(range(10)), read, reduce, write, depth=1)
+
+    with pytest.raises(ValueError):
+        run_pipeline([], read, reduce, write, depth=0)
+    with pytest.raises(ValueError):
+        run_pipeline([], read, reduce, write, writers=0)
+    # outputs of the reductions need a write
+    with pytest.raises(ValueError, match="no write"):
+        run_pipeline(list(range(10)), read, reduce, depth=1)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from freedompp.test.test_libfreedompp import make_history
+
+
+def test_plan_inputs(tmpdir):
+    from freedompp.libplan import plan_inputs
+
+    make_history(tmpdir, 1, 3)
+    os.remove(f"{tmpdir}/00020101.nc.tar")
+
+    inputs = plan_inputs("ocean_month", 1, 3, historydir=tmpdir)
+    assert len(inputs["archives"]) == 3
+    assert inputs["missing"] == [f"{tmpdir}/00020101.nc.tar:./00020101.ocean_month.nc"]
+    assert inputs["year_bytes"][1] == 0
+    size = os.path.getsize(f"{tmpdir}/00010101.nc.tar")
+    assert 0 < inputs["year_bytes"][0] < size
+    assert inputs["read_bytes"] == sum(inputs["year_bytes"])
+
+
+def test_plan_timeseries(tmpdir):
+    from freedompp.libplan import check_plan, plan_timeseries
+
+    make_history(tmpdir, 1, 2)
+    plan = plan_timeseries(
+        ["tos"], "ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir, chunks="auto"
+    )
+    check_plan(plan)
+    assert len(plan["outputs"]) == 1
+    output = plan["outputs"][0]
+    assert output["path"].endswith("ts/monthly/2yr/ocean_month.000101-000212.tos.nc")
+    # tos, time variables and coordinates, 24 records
+    assert output["bytes"] == 24 * 8 * (4 + 3 + 2 + 1) + 4 * 8
+    assert output["chunks"]["time"] == 24
+    assert plan["peak_memory"] >= plan["read_bytes"]
+    # nothing was written
+    assert not os.path.exists(f"{tmpdir}/ocean_month")
+
+    plan = plan_timeseries("ALL", "ocean_month", 1, 3, historydir=tmpdir)
+    assert len(plan["outputs"]) == 2
+    with pytest.raises(FileNotFoundError, match="00030101.ocean_month.nc"):
+        check_plan(plan)
+
+
+@pytest.mark.parametrize("AVTYPE", ["ann", "mm"])
+def test_plan_average(tmpdir, AVTYPE):
+    from freedompp.libplan import plan_average
+
+    make_history(tmpdir, 1, 2)
+    plan = plan_average(
+        "ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir, avtype=AVTYPE
+    )
+    assert len(plan["outputs"]) == (1 if AVTYPE == "ann" else 12)
+    # one record per file
+    assert plan["outputs"][0]["bytes"] == 8 * (4 + 4 + 3 + 2 + 1) + 4 * 8
+    assert plan["outputs"][0]["chunks"] is None
+    streamed = plan_average(
+        "ocean_month", 1, 2, historydir=tmpdir, avtype=AVTYPE, streaming=True
+    )
+    assert streamed["peak_memory"] < plan["peak_memory"]
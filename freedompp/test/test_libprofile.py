@@ -0,0 +1,41 @@
+import json
+
+import dask
+import numpy as np
+
+
+def test_profile():
+    from freedompp.libprofile import Profile
+
+    profile = Profile("job")
+    with profile.stage("work") as record:
+        record["items"] = 3
+    x = dask.array.ones((10, 10), chunks=5)
+    (total,) = profile.compute(x.sum())
+    assert total == 100
+
+    assert [s["stage"] for s in profile.stages] == ["work", "compute"]
+    assert profile.stages[0]["items"] == 3
+    assert profile.stages[1]["tasks"] > 4
+    assert len(profile.stages[1]["task_time"]) > 0
+    assert profile.total()["time"] >= profile.stages[1]["time"]
+    assert profile.total()["tasks"] == profile.stages[1]["tasks"]
+
+    lines = [json.loads(line) for line in profile.to_json().split("\n")]
+    assert [line["stage"] for line in lines] == ["work", "compute", "total"]
+    profile.print_table()
+
+
+def test_profile_stage():
+    from freedompp.libprofile import profile_compute, profile_stage, start_profile
+
+    assert start_profile(None) is None
+    assert start_profile(False) is None
+    profile = start_profile(True, "job")
+    assert start_profile(profile) is profile
+
+    # no-ops without a profile
+    with profile_stage(None, "work") as record:
+        record["items"] = 3
+    (total,) = profile_compute(None, dask.array.ones(4).sum())
+    assert np.isclose(total, 4)
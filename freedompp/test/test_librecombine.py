@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+
+def split(ds, ylayout, xlayout):
+    """split ds in blocks as written by distributed IO"""
+    pieces = []
+    ny, nx = ds.sizes["yh"], ds.sizes["xh"]
+    for y0, y1 in ylayout:
+        for x0, x1 in xlayout:
+            piece = ds.isel(yh=slice(y0, y1), xh=slice(x0, x1))
+            piece = piece.assign_coords(
+                yh=piece["yh"].assign_attrs(domain_decomposition=[1, ny, y0 + 1, y1]),
+                xh=piece["xh"].assign_attrs(domain_decomposition=[1, nx, x0 + 1, x1]),
+            )
+            pieces.append(piece.chunk({}))
+    return pieces
+
+
+def test_decomposition():
+    from freedompp.benchmarks.synthetic import history_year
+    from freedompp.librecombine import decomposition
+
+    ds = history_year(nz=2, ny=6, nx=4)
+    assert decomposition(ds) == {}
+    pieces = split(ds, [(0, 2), (2, 6)], [(0, 4)])
+    assert decomposition(pieces[1]) == {"yh": (1, 6, 3, 6), "xh": (1, 4, 1, 4)}
+
+
+def test_recombine_pieces():
+    from freedompp.benchmarks.synthetic import history_year
+    from freedompp.librecombine import recombine_pieces
+
+    ds = history_year(nz=2, ny=6, nx=5)
+    pieces = split(ds, [(0, 2), (2, 6)], [(0, 3), (3, 5)])
+    # pieces can come in any order
+    recombined = recombine_pieces(pieces[::-1])
+    assert recombined["thetao"].dims == ds["thetao"].dims
+    assert recombined["thetao"].chunks is not None
+    xr.testing.assert_identical(recombined.compute(), ds)
+    assert "domain_decomposition" not in recombined["yh"].attrs
+
+
+def test_recombine_pieces_masked():
+    from freedompp.benchmarks.synthetic import history_year
+    from freedompp.librecombine import recombine_pieces
+
+    ds = history_year(ny=4, nx=4)
+    pieces = split(ds, [(0, 2), (2, 4)], [(0, 2), (2, 4)])
+    # no file for a block masked over land
+    recombined = recombine_pieces(pieces[:3]).compute()
+    assert np.isnan(recombined["tos"].values[:, 2:, 2:]).all()
+    assert np.allclose(recombined["tos"].values[:, :2, :], ds["tos"].values[:, :2, :])
+    assert np.allclose(recombined["xh"], ds["xh"])
+
+
+def test_recombine_pieces_errors():
+    from freedompp.benchmarks.synthetic import history_year
+    from freedompp.librecombine import recombine_pieces
+
+    ds = history_year(ny=6, nx=4)
+    with pytest.raises(ValueError, match="no domain_decomposition"):
+        recombine_pieces([ds])
+    pieces = split(ds, [(0, 2), (2, 4), (4, 6)], [(0, 4)])
+    with pytest.raises(ValueError, match="do not cover"):
+        recombine_pieces([pieces[0], pieces[2]])
+    with pytest.raises(ValueError, match="same block"):
+        recombine_pieces([pieces[0], pieces[0], pieces[1], pieces[2]])
+
+
+@pytest.mark.parametrize("DECODE", [True, False])
+def test_recombine_pieces_fill_value(tmpdir, DECODE):
+    from freedompp.benchmarks.synthetic import history_year
+    from freedompp.librecombine import recombine_pieces
+
+    ds = history_year(ny=4, nx=4)
+    files = []
+    for k, piece in enumerate(split(ds, [(0, 2), (2, 4)], [(0, 2), (2, 4)])[:3]):
+        files.append(f"{tmpdir}/piece.nc.{k:04d}")
+        piece.to_netcdf(files[-1], encoding={"tos": {"_FillValue": -1e34}})
+    pieces = [
+        xr.open_dataset(f, decode_times=False, mask_and_scale=DECODE, chunks={})
+        for f in files
+    ]
+    recombined = recombine_pieces(pieces).compute()
+    hole = recombined["tos"].values[:, 2:, 2:]
+    if DECODE:
+        # the hole is missing, as the decoded values of the pieces
+        assert np.isnan(hole).all()
+    else:
+        assert (hole == -1e34).all()
+        assert recombined["tos"].attrs["_FillValue"] == -1e34
+    assert np.allclose(recombined["tos"].values[:, :2, :], ds["tos"].values[:, :2, :])
+    for piece in pieces:
+        piece.close()
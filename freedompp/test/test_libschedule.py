@@ -0,0 +1,153 @@
+import os
+import time
+import pytest
+
+from freedompp.test.test_libfreedompp import make_history
+
+
+def touch(filename):
+    with open(filename, "a"):
+        os.utime(filename)
+
+
+def test_job_dependencies(tmpdir):
+    from freedompp.libschedule import Job, job_dependencies
+
+    a = Job("a", touch, [f"{tmpdir}/in"], [f"{tmpdir}/a"])
+    b = Job("b", touch, [f"{tmpdir}/a"], [f"{tmpdir}/b"])
+    c = Job("c", touch, [f"{tmpdir}/a", f"{tmpdir}/b"], [f"{tmpdir}/c"])
+    deps = job_dependencies([a, b, c])
+    assert deps == {"a": set(), "b": {"a"}, "c": {"a", "b"}}
+
+    d = Job("d", touch, [f"{tmpdir}/e"], [f"{tmpdir}/d"])
+    e = Job("e", touch, [f"{tmpdir}/d"], [f"{tmpdir}/e"])
+    with pytest.raises(ValueError):
+        job_dependencies([d, e])
+
+
+def test_run_jobs(tmpdir):
+    from freedompp.libschedule import Job, run_jobs
+
+    order = []
+
+    def produce(name):
+        order.append(name)
+        touch(f"{tmpdir}/{name}")
+
+    touch(f"{tmpdir}/in")
+    jobs = [
+        Job("c", produce, [f"{tmpdir}/a", f"{tmpdir}/b"], [f"{tmpdir}/c"], ("c",)),
+        Job("a", produce, [f"{tmpdir}/in"], [f"{tmpdir}/a"], ("a",)),
+        Job("b", produce, [f"{tmpdir}/in"], [f"{tmpdir}/b"], ("b",)),
+    ]
+    status = run_jobs(jobs, max_concurrent=2)
+    assert status == {"a": "done", "b": "done", "c": "done"}
+    assert order[-1] == "c"
+
+    # everything is up to date
+    status = run_jobs(jobs, max_concurrent=2)
+    assert set(status.values()) == {"skipped"}
+
+    # newer input triggers the job and the ones depending on it
+    time.sleep(0.01)
+    touch(f"{tmpdir}/in")
+    os.utime(f"{tmpdir}/b", (0, 0))
+    touch(f"{tmpdir}/b")
+    order.clear()
+    status = run_jobs(jobs)
+    assert status == {"a": "done", "b": "skipped", "c": "done"}
+
+    # failures block the dependent jobs
+    def fail():
+        raise RuntimeError("failed")
+
+    jobs[1] = Job("a", fail, [f"{tmpdir}/in"], [f"{tmpdir}/a"])
+    status = run_jobs(jobs, force=True)
+    assert status == {"a": "failed", "b": "done", "c": "blocked"}
+
+
+def test_timeserie_and_average_jobs(tmpdir):
+    from freedompp.libschedule import average_job, run_jobs, timeserie_job
+
+    make_history(tmpdir, 1, 2)
+    jobs = [
+        timeserie_job(["tos"], "ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir),
+        average_job("ocean_month", 1, 2, historydir=tmpdir, ppdir=tmpdir, avtype="mm"),
+    ]
+    assert len(jobs[1].outputs) == 12
+    status = run_jobs(jobs, max_concurrent=2)
+    assert set(status.values()) == {"done"}
+    for job in jobs:
+        assert all(os.path.exists(f) for f in job.outputs)
+    status = run_jobs(jobs, max_concurrent=2)
+    assert set(status.values()) == {"skipped"}
+
+
+def test_jobs_from_pp_products(tmpdir):
+    import numpy as np
+    import xarray as xr
+    from freedompp.libfreedompp import compute_average
+    from freedompp.libschedule import average_job, job_dependencies, run_jobs
+    from freedompp.libschedule import timeserie_job
+
+    make_history(tmpdir, 1, 5)
+    os.makedirs(f"{tmpdir}/pp")
+    kwargs = dict(historydir=tmpdir, ppdir=f"{tmpdir}/pp")
+    jobs = [
+        timeserie_job(["tos"], "ocean_month", 1, 2, **kwargs),
+        timeserie_job(["tos"], "ocean_month", 1, 5, incremental=True, **kwargs),
+        average_job("ocean_month", 1, 2, **kwargs),
+        average_job("ocean_month", 3, 4, **kwargs),
+        average_job("ocean_month", 1, 5, segment=2, **kwargs),
+    ]
+    # jobs extending timeseries or combining averages wait for their inputs
+    deps = job_dependencies(jobs)
+    assert deps[jobs[1].name] == {jobs[0].name}
+    assert deps[jobs[4].name] == {jobs[2].name, jobs[3].name}
+    assert f"{tmpdir}/00050101.nc.tar" in jobs[4].inputs
+    assert f"{tmpdir}/00010101.nc.tar" not in jobs[4].inputs
+
+    status = run_jobs(jobs, max_concurrent=4)
+    assert set(status.values()) == {"done"}
+    ts = xr.open_dataset(jobs[1].outputs[0], decode_times=False)
+    assert len(ts["time"]) == 60
+    ts.close()
+    ave = xr.open_dataset(jobs[4].outputs[0], decode_times=False)
+    ref = compute_average("ocean_month", 1, 5, historydir=tmpdir)
+    assert np.allclose(ave["tos"], ref["tos"])
+    ave.close()
+
+    with pytest.raises(ValueError):
+        average_job("ocean_month", 1, 5, segment=5, **kwargs)
+
+    job = average_job("ocean_month", 1, 5, avtype=["ann", "seas"], **kwargs)
+    assert job.name == "ann+seas:ocean_month:1-5"
+
+
+def test_run_jobs_concurrent_writes(tmpdir, monkeypatch):
+    import threading
+
+    from freedompp import libfreedompp
+    from freedompp.libschedule import average_job, run_jobs, timeserie_job
+
+    # the computes of netcdf writes wait for each other by pairs, a job
+    # computing alone (e.g. under a lock) breaks the barrier
+    barrier = threading.Barrier(2, timeout=10)
+    profile_compute = libfreedompp.profile_compute
+
+    def track(profile, *writes):
+        barrier.wait()
+        return profile_compute(profile, *writes)
+
+    monkeypatch.setattr(libfreedompp, "profile_compute", track)
+
+    make_history(tmpdir, 1, 4)
+    kwargs = dict(historydir=tmpdir, ppdir=tmpdir)
+    jobs = []
+    for year in range(1, 5):
+        jobs.append(timeserie_job(["tos", "sos"], "ocean_month", year, year, **kwargs))
+        jobs.append(average_job("ocean_month", year, year, avtype="mm", **kwargs))
+    status = run_jobs(jobs, max_concurrent=8)
+    assert set(status.values()) == {"done"}
+    for job in jobs:
+        assert all(os.path.exists(f) for f in job.outputs)
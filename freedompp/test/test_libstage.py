@@ -0,0 +1,77 @@
+import os
+import tarfile
+
+
+def make_archives(tmpdir, n):
+    archives = []
+    for k in range(n):
+        member = f"{tmpdir}/file{k}.nc"
+        with open(member, "w") as fid:
+            fid.write("x" * 1000)
+        archive = f"{tmpdir}/{k + 1:04d}0101.nc.tar"
+        with tarfile.open(archive, "w:") as tar:
+            tar.add(member, arcname=f"./file{k}.nc")
+        archives.append(archive)
+    return archives
+
+
+def test_stage_archive(tmpdir):
+    from freedompp.libstage import remove_staged, stage_archive
+    from freedompp.libtar import archive_stamp, read_tar_index, tar_index
+
+    archive = make_archives(tmpdir, 1)[0]
+    tar_index(archive)
+    staged = stage_archive(archive, f"{tmpdir}/stage")
+    assert staged == f"{tmpdir}/stage/00010101.nc.tar"
+    assert archive_stamp(staged) == archive_stamp(archive)
+    # the index is reused, not rebuilt
+    assert read_tar_index(staged) == tar_index(archive)
+
+    remove_staged(staged)
+    assert os.listdir(f"{tmpdir}/stage") == []
+
+
+def test_archive_stager(tmpdir):
+    from freedompp.libstage import ArchiveStager
+
+    archives = make_archives(tmpdir, 4) + [f"{tmpdir}/00050101.nc.tar"]
+    stagedir = f"{tmpdir}/stage"
+    with ArchiveStager(archives, stagedir=stagedir, prefetch=1) as stager:
+        for archive in archives[:4]:
+            staged = stager.get(archive)
+            assert staged == f"{stagedir}/{os.path.basename(archive)}"
+            with tarfile.open(staged) as tar:
+                assert len(tar.getnames()) == 1
+            # the archive being read and at most one ahead
+            assert len(os.listdir(stagedir)) <= 2
+            stager.release(archive)
+        # missing archives are reported when opened
+        assert stager.get(archives[4]) == archives[4]
+    assert os.listdir(stagedir) == []
+
+
+def test_archive_stager_budget(tmpdir):
+    from freedompp.libstage import ArchiveStager
+
+    archives = make_archives(tmpdir, 3)
+    stagedir = f"{tmpdir}/stage"
+    size = os.path.getsize(archives[0])
+    # room for a single archive, the next one is staged once released
+    with ArchiveStager(archives, stagedir, prefetch=2, max_bytes=size) as stager:
+        stager.get(archives[0])
+        assert stager.used_bytes == size
+        assert os.listdir(stagedir) == ["00010101.nc.tar"]
+        stager.release(archives[0])
+        stager.get(archives[1])
+    # closed before the end, staged copies are removed
+    assert os.listdir(stagedir) == []
+
+
+def test_archive_stager_in_place(tmpdir):
+    from freedompp.libstage import ArchiveStager
+
+    archives = make_archives(tmpdir, 2)
+    with ArchiveStager(archives) as stager:
+        assert stager.get(archives[1]) == archives[1]
+        stager.release(archives[1])
+    assert os.path.exists(archives[1])
@@ -1,3 +1,4 @@
+import os
 import pytest
 
 
@@ -134,6 +135,35 @@ def test_avfilename():
     assert fname == "river_cubic.1981-1985.01.tile1.nc"
 
 
+def test_avsuffixes():
+    from freedompp.libstruct import avsuffixes
+
+    assert avsuffixes("ann") == ["ann"]
+    assert avsuffixes("mm") == [f"{m:02d}" for m in range(1, 13)]
+    assert avsuffixes(["ann", "seas"]) == ["ann", "DJF", "MAM", "JJA", "SON"]
+    with pytest.raises(ValueError):
+        avsuffixes("djf")
+
+
+def test_find_averages(tmpdir):
+    from freedompp.libstruct import find_averages
+
+    for first, last in [(1, 5), (1, 2), (3, 7), (6, 10), (11, 11)]:
+        subdir = f"{tmpdir}/ocean_month/av/monthly_{last - first + 1}yr"
+        os.makedirs(subdir, exist_ok=True)
+        open(f"{subdir}/ocean_month.{first:04d}-{last:04d}.ann.nc", "w").close()
+
+    found = find_averages(str(tmpdir), "ocean_month", 1, 12)
+    # longest first, without overlap
+    assert [(first, last) for first, last, _ in found] == [(1, 5), (6, 10), (11, 11)]
+    assert found[0][2] == [
+        f"{tmpdir}/ocean_month/av/monthly_5yr/ocean_month.0001-0005.ann.nc"
+    ]
+    # the segment itself is not reused, and monthly files are missing
+    assert len(find_averages(str(tmpdir), "ocean_month", 1, 5)) == 1
+    assert find_averages(str(tmpdir), "ocean_month", 1, 12, avtype="mm") == []
+
+
 def test_ppsubdirname():
     from freedompp.libstruct import ppsubdirname
 
@@ -148,3 +178,40 @@ def test_ppsubdirname():
 
     dirname = ppsubdirname("ocean_daily", 1, 10, pptype="ts")
     assert dirname == "ocean_daily/ts/daily/10yr"
+
+
+def test_format_suffix():
+    from freedompp.libstruct import format_suffix
+
+    fname = "ocean_month.0001-0005.ann.nc"
+    assert format_suffix(fname) == fname
+    assert format_suffix(fname, "zarr") == "ocean_month.0001-0005.ann.zarr"
+    assert format_suffix("atmos.0001-0005.01.tile1.nc", "zarr") == (
+        "atmos.0001-0005.01.tile1.zarr"
+    )
+    with pytest.raises(ValueError):
+        format_suffix(fname, "grib")
+
+
+def test_find_timeserie(tmpdir):
+    from freedompp.libstruct import find_timeserie
+
+    fname, lastyear = find_timeserie(tmpdir, "so", "ocean_annual", 1, 10)
+    assert fname is None
+    assert lastyear is None
+
+    for yearend in [5, 7]:
+        os.makedirs(f"{tmpdir}/ocean_annual/ts/annual/{yearend}yr")
+        with open(
+            f"{tmpdir}/ocean_annual/ts/annual/{yearend}yr/"
+            f"ocean_annual.0001-{yearend:04d}.so.nc",
+            "w",
+        ):
+            pass
+
+    fname, lastyear = find_timeserie(tmpdir, "so", "ocean_annual", 1, 10)
+    assert lastyear == 7
+    assert fname == f"{tmpdir}/ocean_annual/ts/annual/7yr/ocean_annual.0001-0007.so.nc"
+
+    fname, lastyear = find_timeserie(tmpdir, "so", "ocean_annual", 1, 6)
+    assert lastyear == 5
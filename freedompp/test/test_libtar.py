@@ -0,0 +1,106 @@
+import os
+import tarfile
+import pytest
+
+import numpy as np
+import xarray as xr
+
+testds = xr.DataArray(np.arange(10), dims=("x")).to_dataset(name="x")
+
+
+def make_archive(tmpdir, members):
+    """create a tar archive in tmpdir containing small netcdf files"""
+    archive = f"{tmpdir}/00000101.nc.tar"
+    with tarfile.open(archive, "w:") as tar_handle:
+        for k, member in enumerate(members):
+            ncfile = f"{tmpdir}/tmp{k}.nc"
+            (testds + k).to_netcdf(ncfile)
+            tar_handle.add(ncfile, arcname=member)
+            os.remove(ncfile)
+    return archive
+
+
+def test_build_tar_index(tmpdir):
+    from freedompp.libtar import build_tar_index
+
+    archive = make_archive(tmpdir, ["./a.nc", "./b.nc"])
+    members = build_tar_index(archive)
+    assert list(members) == ["./a.nc", "./b.nc"]
+
+    # offsets and sizes match what tarfile finds
+    with tarfile.open(archive) as tar:
+        for name, (offset, size) in members.items():
+            tarinfo = tar.getmember(name)
+            assert offset == tarinfo.offset_data
+            assert size == tarinfo.size
+
+
+def test_tar_index(tmpdir):
+    from freedompp.libtar import tar_index, index_filename
+    from freedompp.libtar import read_tar_index, write_tar_index
+
+    archive = make_archive(tmpdir, ["./a.nc"])
+    members = tar_index(archive)
+    assert "./a.nc" in members
+    assert os.path.exists(index_filename(archive))
+    assert read_tar_index(archive) == members
+
+    # index stored in a separate directory
+    idxdir = f"{tmpdir}/indexes"
+    assert write_tar_index(archive, members, indexdir=idxdir)
+    assert os.path.exists(index_filename(archive, indexdir=idxdir))
+    assert read_tar_index(archive, indexdir=idxdir) == members
+
+    # stale index is rebuilt when archive changes
+    archive = make_archive(tmpdir, ["./a.nc", "./c.nc"])
+    assert read_tar_index(archive) is None
+    members = tar_index(archive)
+    assert "./c.nc" in members
+
+
+def test_open_member(tmpdir):
+    from freedompp.libtar import open_member
+
+    archive = make_archive(tmpdir, ["./a.nc", "./b.nc"])
+    fid = open_member(archive, "./b.nc")
+    assert isinstance(fid, tarfile.ExFileObject)
+    ds = xr.open_dataset(fid)
+    assert np.allclose(ds["x"], np.arange(10) + 1)
+    fid.close()
+
+    with pytest.raises(KeyError):
+        open_member(archive, "./missing.nc")
+
+
+def test_extract_member(tmpdir):
+    from freedompp.libtar import extract_member
+
+    archive = make_archive(tmpdir, ["./a.nc", "./b.nc"])
+    outfile = extract_member(archive, "./a.nc", f"{tmpdir}/extracted")
+    assert os.path.exists(f"{tmpdir}/extracted/a.nc")
+    ds = xr.open_dataset(outfile)
+    assert np.allclose(ds["x"], np.arange(10))
+
+
+def test_mapped_member(tmpdir):
+    from freedompp.libtar import MappedMember
+
+    archive = make_archive(tmpdir, ["./a.nc", "./b.nc"])
+    with open(archive, "rb") as fid:
+        content = fid.read()
+
+    mapped = MappedMember(archive, "./b.nc")
+    assert mapped.buffer.readonly
+    assert bytes(mapped.buffer[1:4]) == b"HDF"
+    assert bytes(mapped.buffer) in content
+    mapped.close()
+
+
+def test_match_members(tmpdir):
+    from freedompp.libtar import match_members
+
+    members = [f"./a.tile{k}.nc" for k in [1, 2, 10]] + ["./a.nc", "./b.tile1.nc"]
+    archive = make_archive(tmpdir, members)
+    matches = match_members(archive, "./a.tile*.nc")
+    assert matches == {"./a.tile1.nc": "1", "./a.tile2.nc": "2", "./a.tile10.nc": "10"}
+    assert match_members(archive, "./c.tile*.nc") == {}